@@ -1,3 +1,45 @@
-from .agent import agent
+import importlib
+import threading
+from dotenv import load_dotenv
 
-__all__ = ["agent"]
\ No newline at end of file
+# Las variables del .env se cargan antes de que utils lea su configuración,
+# aunque el agente todavía no se haya creado
+load_dotenv()
+
+
+class _InstanciaPerezosa:
+    """
+    Crea un objeto pesado al primer acceso a uno de sus atributos. Así
+    importar el paquete no carga pydantic-ai ni el proveedor de Google:
+    las páginas estáticas arrancan sin pagarlos.
+    """
+    def __init__(self, modulo, nombre):
+        self._modulo = modulo
+        self._nombre = nombre
+        self._instancia = None
+        self._lock = threading.Lock()
+
+    def _obtener(self):
+        if self._instancia is None:
+            with self._lock:
+                if self._instancia is None:
+                    self._instancia = getattr(importlib.import_module(self._modulo, __name__), self._nombre)
+        return self._instancia
+
+    def __getattr__(self, nombre):
+        return getattr(self._obtener(), nombre)
+
+
+# Singleton del agente multi-cuenta; MultiAccountAgent() se construye al primer uso
+multi_agent = _InstanciaPerezosa(".multi_account_agent", "multi_agent")
+
+
+def __getattr__(nombre):
+    # El agente simple de agent/agent.py también se crea solo si alguien lo pide
+    if nombre == "agent":
+        from .agent import agent
+        return agent
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
+
+
+__all__ = ["agent", "multi_agent"]
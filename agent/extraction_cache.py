@@ -0,0 +1,158 @@
+# scanner/agent/extraction_cache.py
+from .output import ReporteAnalisisSuelo
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+
+def page_fingerprint(page):
+    """
+    SHA-256 del contenido normalizado de una página: tamaño, stream de contenido
+    decodificado y los datos de las imágenes/XObjects que dibuja. Dos páginas
+    iguales en PDFs distintos producen la misma huella.
+    """
+    h = hashlib.sha256()
+    h.update(repr([round(float(x), 2) for x in page.mediabox]).encode())
+    h.update(str(page.get("/Rotate", 0)).encode())
+    contents = page.get_contents()
+    if contents is not None:
+        h.update(contents.get_data())
+    _hash_resources(page.get("/Resources"), h, set())
+    return h.hexdigest()
+
+
+def _hash_resources(resources, h, seen):
+    """Añade al hash los XObjects (imágenes y formularios) de un diccionario de recursos"""
+    if resources is None:
+        return
+    resources = resources.get_object()
+    xobjects = resources.get("/XObject")
+    if xobjects is None:
+        return
+    xobjects = xobjects.get_object()
+    for name in sorted(xobjects.keys()):
+        ref = xobjects.raw_get(name)
+        key = (ref.idnum, ref.generation) if hasattr(ref, "idnum") else None
+        if key is not None and key in seen:
+            continue
+        if key is not None:
+            seen.add(key)
+        xobject = ref.get_object()
+        h.update(name.encode())
+        # Datos sin decodificar: suficiente para identificar la imagen y mucho más barato
+        h.update(getattr(xobject, "_data", b"") or b"")
+        if xobject.get("/Subtype") == "/Form":
+            _hash_resources(xobject.get("/Resources"), h, seen)
+
+
+class ExtractionCache:
+    """
+    Caché persistente (SQLite) de los reportes extraídos de cada página.
+    La clave es la huella de la página más la versión del prompt/modelo, y el
+    tamaño total está acotado con expulsión LRU.
+    """
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = directory or os.getenv(
+            "EXTRACTION_CACHE_DIR", os.path.join(tempfile.gettempdir(), "pdf_scaner_cache")
+        )
+        self.max_bytes = max_bytes or int(os.getenv("EXTRACTION_CACHE_MAX_MB", "256")) * 1024 * 1024
+        self.path = os.path.join(self.directory, "extracciones.sqlite3")
+        self.enabled = True
+        self._lock = threading.Lock()
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS paginas ("
+                    " clave TEXT PRIMARY KEY,"
+                    " datos BLOB NOT NULL,"
+                    " tamano INTEGER NOT NULL,"
+                    " ultimo_acceso REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_ultimo_acceso ON paginas (ultimo_acceso)")
+        except Exception as e:
+            logger.warning(f"Caché de extracciones deshabilitada ({self.path}): {e}")
+            self.enabled = False
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    @staticmethod
+    def make_key(page_hash, version):
+        return hashlib.sha256(f"{version}:{page_hash}".encode()).hexdigest()
+
+    def get_many(self, keys):
+        """Devuelve {clave: [ReporteAnalisisSuelo, ...]} para las claves presentes en la caché"""
+        if not self.enabled or not keys:
+            return {}
+        encontrados = {}
+        try:
+            with self._connect() as conn:
+                unicas = list(set(keys))
+                for inicio in range(0, len(unicas), 500):
+                    lote = unicas[inicio:inicio + 500]
+                    marcadores = ",".join("?" * len(lote))
+                    filas = conn.execute(
+                        f"SELECT clave, datos FROM paginas WHERE clave IN ({marcadores})", lote
+                    ).fetchall()
+                    for clave, datos in filas:
+                        reportes = json.loads(zlib.decompress(datos).decode("utf-8"))
+                        encontrados[clave] = [ReporteAnalisisSuelo.model_validate(r) for r in reportes]
+                if encontrados:
+                    ahora = time.time()
+                    conn.executemany(
+                        "UPDATE paginas SET ultimo_acceso = ? WHERE clave = ?",
+                        [(ahora, clave) for clave in encontrados]
+                    )
+        except Exception as e:
+            logger.warning(f"Error leyendo la caché de extracciones: {e}")
+            return {}
+        return encontrados
+
+    def put_many(self, entries):
+        """Guarda {clave: [ReporteAnalisisSuelo, ...]} y expulsa las entradas menos usadas si hace falta"""
+        if not self.enabled or not entries:
+            return
+        ahora = time.time()
+        filas = []
+        for clave, reportes in entries.items():
+            datos = zlib.compress(
+                json.dumps([r.model_dump() for r in reportes], ensure_ascii=False).encode("utf-8")
+            )
+            filas.append((clave, datos, len(datos), ahora))
+        try:
+            with self._lock, self._connect() as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO paginas (clave, datos, tamano, ultimo_acceso) VALUES (?, ?, ?, ?)",
+                    filas
+                )
+                self._evict(conn)
+        except Exception as e:
+            logger.warning(f"Error guardando en la caché de extracciones: {e}")
+
+    def _evict(self, conn):
+        """Expulsa por LRU hasta dejar la caché por debajo del 90% del límite"""
+        total = conn.execute("SELECT COALESCE(SUM(tamano), 0) FROM paginas").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        objetivo = int(self.max_bytes * 0.9)
+        expulsadas = 0
+        for clave, tamano in conn.execute(
+            "SELECT clave, tamano FROM paginas ORDER BY ultimo_acceso ASC"
+        ).fetchall():
+            if total <= objetivo:
+                break
+            conn.execute("DELETE FROM paginas WHERE clave = ?", (clave,))
+            total -= tamano
+            expulsadas += 1
+        logger.info(f"Caché de extracciones: {expulsadas} páginas expulsadas por tamaño")
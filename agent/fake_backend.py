@@ -0,0 +1,107 @@
+# scanner/agent/fake_backend.py
+from pydantic_ai.exceptions import ModelHTTPError
+from pydantic_ai.messages import ModelResponse, ToolCallPart
+from pydantic_ai.models.function import FunctionModel, AgentInfo
+from .output import ReporteAnalisisSuelo
+from .numeric_verifier import NUMERIC_FIELDS
+import asyncio
+import io
+import os
+import random
+import re
+import PyPDF2
+
+_CLAVE = re.compile(r"CLAVE DE LA MUESTRA:?\s*(\S+)", re.IGNORECASE)
+_NUMERO = re.compile(r"-?\d+[.,]\d+")
+
+
+class FakeGeminiBackend:
+    """
+    Sustituto local de Gemini para pruebas de carga (GEMINI_BACKEND=falso).
+    Devuelve un ReporteAnalisisSuelo sintético por página con latencia
+    log-normal y errores 429/503 con la tasa configurada. No consume cuota.
+
+    Variables de entorno:
+        FAKE_NUM_KEYS              número de API keys simuladas (3)
+        FAKE_LATENCIA_MEDIANA      mediana de la latencia por llamada en segundos (1.5)
+        FAKE_LATENCIA_SIGMA        dispersión log-normal de la latencia (0.4)
+        FAKE_LATENCIA_POR_PAGINA   segundos extra por página enviada (0.2)
+        FAKE_TASA_429              probabilidad de responder 429 (0.0)
+        FAKE_TASA_503              probabilidad de responder 503 (0.0)
+        FAKE_SEMILLA               semilla del generador aleatorio (sin fijar)
+    """
+    model_name = "gemini-falso"
+
+    def __init__(self):
+        self.num_keys = int(os.getenv("FAKE_NUM_KEYS", "3"))
+        self.latencia_mediana = float(os.getenv("FAKE_LATENCIA_MEDIANA", "1.5"))
+        self.latencia_sigma = float(os.getenv("FAKE_LATENCIA_SIGMA", "0.4"))
+        self.latencia_por_pagina = float(os.getenv("FAKE_LATENCIA_POR_PAGINA", "0.2"))
+        self.tasa_429 = float(os.getenv("FAKE_TASA_429", "0.0"))
+        self.tasa_503 = float(os.getenv("FAKE_TASA_503", "0.0"))
+        semilla = os.getenv("FAKE_SEMILLA")
+        self.random = random.Random(int(semilla) if semilla else None)
+        self._campos_requeridos = [
+            campo for campo, info in ReporteAnalisisSuelo.model_fields.items() if info.is_required()
+        ]
+
+    def api_keys(self):
+        return [f"falsa-{i + 1}" for i in range(self.num_keys)]
+
+    def create_model(self, key_index):
+        async def responder(messages, info: AgentInfo):
+            return await self._responder(key_index, messages, info)
+        return FunctionModel(responder, model_name=self.model_name)
+
+    def _latencia(self, num_paginas):
+        base = self.latencia_mediana * self.random.lognormvariate(0, self.latencia_sigma)
+        return base + self.latencia_por_pagina * num_paginas
+
+    async def _responder(self, key_index, messages, info):
+        paginas = self._paginas_del_mensaje(messages)
+        latencia = self._latencia(len(paginas))
+
+        sorteo = self.random.random()
+        if sorteo < self.tasa_429 + self.tasa_503:
+            # Los errores llegan antes que una respuesta completa
+            await asyncio.sleep(latencia * self.random.uniform(0.05, 0.3))
+            codigo = 429 if sorteo < self.tasa_429 else 503
+            raise ModelHTTPError(
+                status_code=codigo, model_name=self.model_name,
+                body=f"Respuesta simulada {codigo} en la key falsa #{key_index + 1}"
+            )
+
+        await asyncio.sleep(latencia)
+        reportes = [self._reporte_sintetico(texto, n) for n, texto in enumerate(paginas)]
+        return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, {"response": reportes})])
+
+    def _paginas_del_mensaje(self, messages):
+        """Texto de cada página del PDF enviado en el último mensaje"""
+        for part in messages[-1].parts:
+            contenido = getattr(part, "content", None)
+            if not isinstance(contenido, list):
+                continue
+            for item in contenido:
+                if getattr(item, "media_type", None) == "application/pdf":
+                    reader = PyPDF2.PdfReader(io.BytesIO(item.data))
+                    return [page.extract_text() or "" for page in reader.pages]
+        return [""]
+
+    def _reporte_sintetico(self, texto, n):
+        """
+        Un reporte por página. La clave y los números se toman de la capa de
+        texto cuando existe, de modo que el verificador numérico no los rechace.
+        """
+        reporte = {campo: "" for campo in self._campos_requeridos}
+        clave = _CLAVE.search(texto)
+        reporte["clave_de_la_muestra"] = clave.group(1) if clave else f"FALSA-{n + 1:03d}"
+        reporte["nombre"] = "Solicitante sintético"
+        reporte["estado"] = "Chiapas"
+
+        numeros = _NUMERO.findall(texto)
+        for i, campo in enumerate(NUMERIC_FIELDS):
+            if numeros:
+                reporte[campo] = numeros[i % len(numeros)]
+            else:
+                reporte[campo] = f"{self.random.uniform(0, 100):.2f}"
+        return reporte
@@ -0,0 +1,208 @@
+# scanner/agent/key_pool.py
+from collections import deque
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Cubeta de tokens que se rellena de forma continua hasta su capacidad.
+    Se usa tanto para peticiones por minuto como para tokens por minuto.
+    """
+    def __init__(self, capacity, per_seconds=60.0):
+        self.capacity = float(capacity)
+        self.refill_rate = self.capacity / per_seconds
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+
+    def _refill(self, now):
+        elapsed = now - self.last_refill
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_rate)
+            self.last_refill = now
+
+    def available(self, now):
+        self._refill(now)
+        return self.tokens
+
+    def wait_time(self, amount, now):
+        """Segundos hasta que haya `amount` tokens disponibles (0 si ya los hay)"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_rate
+
+    def consume(self, amount, now):
+        self._refill(now)
+        self.tokens -= amount
+
+    def drain(self, now):
+        """Vacía la cubeta (p. ej. tras un 429 del proveedor)"""
+        self._refill(now)
+        self.tokens = min(self.tokens, 0.0)
+
+
+class KeyHealth:
+    """Registro de salud de una API key: errores recientes, latencia y espera por cuota"""
+    def __init__(self):
+        self.recent_errors = deque()  # (timestamp, tipo)
+        self.consecutive_errors = 0
+        self.latency_ewma = None
+        self.successes = 0
+        self.failures = 0
+        self.cooldown_until = 0.0
+
+    def prune(self, now, window):
+        while self.recent_errors and now - self.recent_errors[0][0] > window:
+            self.recent_errors.popleft()
+
+
+class KeyPool:
+    """
+    Presupuesto por API key (peticiones y tokens por minuto) más un marcador de salud.
+    `acquire` elige la key con más margen y solo espera cuando ninguna tiene presupuesto.
+    """
+    def __init__(self, num_keys, rpm=10, tpm=250_000, cooldowns=(5, 10, 20, 30, 60), error_window=60.0):
+        self.num_keys = num_keys
+        self.rpm = rpm
+        self.tpm = tpm
+        self.cooldowns = list(cooldowns)
+        self.error_window = error_window
+        self.request_buckets = [TokenBucket(rpm) for _ in range(num_keys)]
+        self.token_buckets = [TokenBucket(tpm) for _ in range(num_keys)]
+        self.health = [KeyHealth() for _ in range(num_keys)]
+        self._lock = threading.Lock()
+
+    def _wait_time(self, key_index, estimated_tokens, now, wall_now):
+        health = self.health[key_index]
+        return max(
+            health.cooldown_until - wall_now,
+            self.request_buckets[key_index].wait_time(1, now),
+            self.token_buckets[key_index].wait_time(estimated_tokens, now),
+            0.0
+        )
+
+    def _headroom(self, key_index, now, wall_now):
+        health = self.health[key_index]
+        health.prune(wall_now, self.error_window)
+        margen = min(
+            self.request_buckets[key_index].available(now) / self.rpm,
+            self.token_buckets[key_index].available(now) / self.tpm
+        )
+        # Penalizar keys con errores recientes y, a igualdad, las más lentas
+        penalizacion = 0.15 * len(health.recent_errors)
+        if health.latency_ewma:
+            penalizacion += min(health.latency_ewma / 600.0, 0.1)
+        return margen - penalizacion
+
+    def try_acquire(self, estimated_tokens):
+        """
+        Intenta reservar presupuesto en la key con más margen.
+        Devuelve (key_index, 0) si lo consigue o (None, segundos_de_espera) si todas están agotadas.
+        """
+        with self._lock:
+            now = time.monotonic()
+            wall_now = time.time()
+            candidatas = [
+                i for i in range(self.num_keys)
+                if self._wait_time(i, estimated_tokens, now, wall_now) == 0
+            ]
+            if not candidatas:
+                espera = min(self._wait_time(i, estimated_tokens, now, wall_now) for i in range(self.num_keys))
+                return None, espera
+
+            key_index = max(candidatas, key=lambda i: self._headroom(i, now, wall_now))
+            self.request_buckets[key_index].consume(1, now)
+            self.token_buckets[key_index].consume(estimated_tokens, now)
+            return key_index, 0.0
+
+    def acquire(self, estimated_tokens, logger=None):
+        """Reserva presupuesto en la mejor key, esperando solo si todas están agotadas"""
+        while True:
+            key_index, espera = self.try_acquire(estimated_tokens)
+            if key_index is not None:
+                return key_index
+            if logger:
+                logger.info(f"Todas las API keys sin presupuesto, esperando {espera:.1f} segundos...")
+            time.sleep(espera)
+
+    async def acquire_async(self, estimated_tokens, logger=None):
+        """Igual que acquire pero esperando con asyncio.sleep para no bloquear el event loop"""
+        while True:
+            key_index, espera = self.try_acquire(estimated_tokens)
+            if key_index is not None:
+                return key_index
+            if logger:
+                logger.info(f"Todas las API keys sin presupuesto, esperando {espera:.1f} segundos...")
+            await asyncio.sleep(espera)
+
+    def record_success(self, key_index, latency, estimated_tokens, actual_tokens=None):
+        """Registra una llamada exitosa y corrige el presupuesto con el consumo real de tokens"""
+        with self._lock:
+            health = self.health[key_index]
+            health.successes += 1
+            health.consecutive_errors = 0
+            if health.latency_ewma is None:
+                health.latency_ewma = latency
+            else:
+                health.latency_ewma = 0.8 * health.latency_ewma + 0.2 * latency
+            if actual_tokens:
+                self.token_buckets[key_index].consume(actual_tokens - estimated_tokens, time.monotonic())
+
+    def record_error(self, key_index, is_quota_error):
+        """
+        Registra un error. Los errores de cuota/sobrecarga vacían la cubeta de peticiones
+        y apartan la key con una espera progresiva; el resto la apartan brevemente.
+        """
+        with self._lock:
+            wall_now = time.time()
+            health = self.health[key_index]
+            health.failures += 1
+            health.consecutive_errors += 1
+            health.recent_errors.append((wall_now, "cuota" if is_quota_error else "otro"))
+            if is_quota_error:
+                self.request_buckets[key_index].drain(time.monotonic())
+                indice = min(health.consecutive_errors - 1, len(self.cooldowns) - 1)
+                espera = self.cooldowns[indice]
+            else:
+                espera = self.cooldowns[0]
+            health.cooldown_until = max(health.cooldown_until, wall_now + espera)
+
+    def healthy_keys(self):
+        """Índices de las keys que no están apartadas por errores"""
+        wall_now = time.time()
+        with self._lock:
+            return [i for i, health in enumerate(self.health) if health.cooldown_until <= wall_now]
+
+    def capacity(self):
+        """
+        Capacidad actual del pool: (keys sanas, segundos hasta que vuelva la
+        primera key apartada). Con alguna key sana la espera es 0.
+        """
+        wall_now = time.time()
+        with self._lock:
+            esperas = [max(0.0, health.cooldown_until - wall_now) for health in self.health]
+        sanas = sum(1 for espera in esperas if espera == 0)
+        return sanas, (0.0 if sanas else min(esperas))
+
+    def snapshot(self):
+        """Estado actual de cada key (para logs y diagnóstico)"""
+        with self._lock:
+            now = time.monotonic()
+            wall_now = time.time()
+            estado = []
+            for i, health in enumerate(self.health):
+                health.prune(wall_now, self.error_window)
+                estado.append({
+                    "key": i + 1,
+                    "peticiones_disponibles": round(self.request_buckets[i].available(now), 2),
+                    "tokens_disponibles": int(self.token_buckets[i].available(now)),
+                    "errores_recientes": len(health.recent_errors),
+                    "latencia_media": round(health.latency_ewma, 2) if health.latency_ewma else None,
+                    "exitos": health.successes,
+                    "fallos": health.failures,
+                    "en_espera": max(0.0, round(health.cooldown_until - wall_now, 1)),
+                })
+            return estado
@@ -0,0 +1,256 @@
+# scanner/agent/local_extractor.py
+from .output import ReporteAnalisisSuelo
+import re
+import unicodedata
+
+# Número tal cual aparece en el PDF: nunca se normaliza ("3.20" se queda "3.20")
+_NUMERO = r"-?\d+(?:[.,]\d+)?"
+_NUMERO_RE = re.compile(_NUMERO)
+_NUMERO_COMPLETO = re.compile(rf"^{_NUMERO}$")
+
+# Unidades que pueden ir entre el valor y su interpretación
+_UNIDADES = re.compile(
+    r"(%|MG\s*KG\s*-?\s*1|DS\s*M\s*-?\s*1|ME\s*/\s*100\s*G|T\s*M\s*-?\s*3|PPM|MEQ\s*/\s*100\s*G)"
+)
+_INTERPRETACION = re.compile(r"([A-Z][A-Z ]*[A-Z])\s*$")
+
+# Campos "etiqueta: valor" de los bloques del solicitante y de la muestra.
+# El orden importa: las etiquetas más largas van antes que sus prefijos.
+CAMPOS_ETIQUETA = [
+    ("clave_de_la_muestra", r"CLAVE DE LA MUESTRA"),
+    ("folio", r"FOLIO"),
+    ("nombre_del_productor", r"NOMBRE DEL PRODUCTOR"),
+    ("nombre", r"NOMBRE(?! DEL PRODUCTOR)"),
+    ("direccion", r"DIRECCION|DOMICILIO"),
+    ("telefono", r"TELEFONO"),
+    ("colonia", r"COLONIA"),
+    ("correo", r"CORREO(?: ELECTRONICO)?|E-?MAIL"),
+    ("estado_de_procedencia", r"ESTADO DE PROCEDENCIA"),
+    ("estado", r"ESTADO(?! DE PROCEDENCIA)"),
+    ("localidad", r"LOCALIDAD"),
+    ("cantidad", r"CANTIDAD"),
+    ("aceptable", r"ACEPTABLE"),
+    ("fecha_de_muestreo", r"FECHA DE MUESTREO"),
+    ("tabla_lote", r"TABLA\s*(?:/|O)?\s*LOTE"),
+    ("profundidad_de_muestreo", r"PROFUNDIDAD DE MUESTREO"),
+    ("cultivo_anterior", r"CULTIVO ANTERIOR"),
+    ("cultivo_a_establecer", r"CULTIVO A ESTABLECER"),
+    ("meta_de_rendimiento", r"META DE RENDIMIENTO"),
+    ("incorporo_residuos_de_cosecha", r"INCORPORO RESIDUOS(?: DE COSECHA)?"),
+    ("coordenadas_latitud", r"LATITUD"),
+    ("coordenadas_longitud", r"LONGITUD"),
+    ("municipio", r"MUNICIPIO"),
+]
+
+# Filas de tabla "etiqueta valor [unidad] [interpretación]"; la etiqueta va al inicio de la línea
+CAMPOS_FILA = [
+    ("arcilla", None, r"ARCILLA"),
+    ("limo", None, r"LIMO"),
+    ("arena", None, r"ARENA"),
+    ("porcentaje_saturacion", None, r"(?:PORCENTAJE DE |% DE )?SATURACION"),
+    ("densidad_aparente_DAP", None, r"DENSIDAD APARENTE"),
+    ("ph_agua_suelo", "ph_agua_suelo_interpretacion", r"PH\s*\(?\s*(?:RELACION\s*)?2\s*:\s*1|PH AGUA"),
+    # La concentración del reactivo ("0.01 M", "1 M") forma parte de la etiqueta
+    ("ph_cacl2", "ph_cacl2_interpretacion", r"PH\s*(?:EN\s*)?\(?CACL\s*2\)?(?:\s*0[.,]01\s*M)?"),
+    ("ph_kcl", "ph_kcl_interpretacion", r"PH\s*(?:EN\s*)?\(?KCL\)?(?:\s*1\s*[MN])?"),
+    ("carbonato_calcio_equivalente", "carbonato_calcio_interpretacion", r"CARBONATO(?:S| DE CALCIO)"),
+    ("conductividad_electrica", "conductividad_electrica_interpretacion", r"CONDUCTIVIDAD ELECTRICA"),
+    ("materia_organica", "materia_organica_interpretacion", r"MATERIA ORGANICA"),
+    ("fosforo", "fosforo_interpretacion", r"FOSFORO"),
+    ("n_inorganico", "n_inorganico_interpretacion", r"(?:N|NITROGENO)[\s-]*INORGANICO"),
+    ("potasio", "potasio_interpretacion", r"POTASIO"),
+    ("calcio", "calcio_interpretacion", r"CALCIO"),
+    ("magnesio", "magnesio_interpretacion", r"MAGNESIO"),
+    ("sodio", "sodio_interpretacion", r"SODIO"),
+    ("azufre", "azufre_interpretacion", r"AZUFRE"),
+    ("hierro", "hierro_interpretacion", r"HIERRO"),
+    ("cobre", "cobre_interpretacion", r"COBRE"),
+    ("zinc", "zinc_interpretacion", r"ZINC"),
+    ("manganeso", "manganeso_interpretacion", r"MANGANESO"),
+    ("boro", "boro_interpretacion", r"BORO"),
+    ("cic", None, r"CIC|CAPACIDAD DE INTERCAMBIO CATIONICO"),
+]
+
+# Cationes intercambiables: "Ca⁺² <porcentaje> <me/100g>"
+CATIONES = [
+    ("ca", r"CA\s*(?:\+\s*2|2\s*\+)?"),
+    ("mg", r"MG\s*(?:\+\s*2|2\s*\+)?"),
+    ("k", r"K\s*\+?"),
+    ("na", r"NA\s*\+?"),
+    ("al", r"AL\s*(?:\+\s*3|3\s*\+)?"),
+    ("h", r"H\s*\+?"),
+]
+
+# Relaciones entre cationes por POSICIÓN, igual que en el prompt del modelo
+RELACIONES = [
+    ("ca_mg_relacion", "ca_mg_interpretacion"),
+    ("mg_k_relacion", "mg_k_interpretacion"),
+    ("ca_k_relacion", "ca_k_interpretacion"),
+    ("ca_mg_k_relacion", "ca_mg_k_interpretacion"),
+    ("k_mg_relacion", "k_mg_interpretacion"),
+]
+
+CAMPO_TEXTURA = ("textura", r"TEXTURA")
+
+
+def _fold(texto):
+    """
+    Mayúsculas sin acentos conservando la longitud, para poder buscar en el
+    texto plegado y recortar el valor literal del texto original
+    """
+    plegado = []
+    for c in texto:
+        base = unicodedata.normalize("NFKD", c)[:1] or c
+        mayuscula = base.upper()
+        plegado.append(mayuscula if len(mayuscula) == 1 else c)
+    return "".join(plegado)
+
+
+def _numeric_confidence(valor):
+    return 1.0 if _NUMERO_COMPLETO.match(valor) else 0.6
+
+
+def _extract_labelled(lineas, plegadas, valores, confianza):
+    """Campos 'etiqueta: valor' de los bloques del solicitante y de la muestra"""
+    patrones = [(campo, re.compile(rf"(?<![A-Z])(?:{patron})(?![A-Z])")) for campo, patron in CAMPOS_ETIQUETA]
+    municipios = []
+
+    for original, plegada in zip(lineas, plegadas):
+        # Todas las etiquetas de la línea, para cortar cada valor en la siguiente
+        encontradas = []
+        ocupado = []
+        for campo, patron in patrones:
+            for m in patron.finditer(plegada):
+                if any(a <= m.start() < b for a, b in ocupado):
+                    continue
+                encontradas.append((m.start(), m.end(), campo))
+                ocupado.append((m.start(), m.end()))
+        encontradas.sort()
+
+        for n, (inicio, fin, campo) in enumerate(encontradas):
+            limite = encontradas[n + 1][0] if n + 1 < len(encontradas) else len(original)
+            valor = original[fin:limite].strip().lstrip(":").strip()
+            if campo == "municipio":
+                municipios.append(valor)
+            elif campo not in valores:
+                valores[campo] = valor
+                confianza[campo] = 1.0 if valor else 0.8
+
+    # El primer MUNICIPIO es el del solicitante y el segundo el de la muestra
+    for campo, valor in zip(["municipio", "municipio_muestra"], municipios):
+        valores[campo] = valor
+        confianza[campo] = 1.0 if valor else 0.8
+
+
+def _extract_rows(lineas, plegadas, valores, confianza):
+    """Filas de las tablas físicas, químicas, de fertilidad y de micronutrientes"""
+    for campo, campo_interpretacion, patron in CAMPOS_FILA:
+        regex = re.compile(rf"^\s*(?:{patron})(?![A-Z])[^\d\-]*?({_NUMERO})(.*)$")
+        for original, plegada in zip(lineas, plegadas):
+            m = regex.match(plegada)
+            if not m:
+                continue
+            valores[campo] = original[m.start(1):m.end(1)]
+            confianza[campo] = _numeric_confidence(valores[campo])
+            if campo_interpretacion:
+                # Tapar las unidades con espacios para que las posiciones sigan
+                # coincidiendo con el texto original
+                resto = _UNIDADES.sub(lambda u: " " * len(u.group()), plegada[m.start(2):])
+                interpretacion = _INTERPRETACION.search(resto)
+                if interpretacion:
+                    desplazamiento = m.start(2)
+                    valores[campo_interpretacion] = original[
+                        desplazamiento + interpretacion.start(1):desplazamiento + interpretacion.end(1)
+                    ]
+                    confianza[campo_interpretacion] = 1.0
+                else:
+                    valores[campo_interpretacion] = ""
+                    confianza[campo_interpretacion] = 0.7
+            break
+
+    regex_textura = re.compile(rf"^\s*{CAMPO_TEXTURA[1]}\s*:?\s*(.+)$")
+    for original, plegada in zip(lineas, plegadas):
+        m = regex_textura.match(plegada)
+        if m:
+            valores["textura"] = original[m.start(1):].strip()
+            confianza["textura"] = 1.0
+            break
+
+
+def _extract_cations(lineas, plegadas, valores, confianza):
+    """Tabla de cationes intercambiables: porcentaje y me/100g por catión"""
+    for cation, patron in CATIONES:
+        regex = re.compile(rf"^\s*(?:{patron})(?![A-Z])\s*({_NUMERO})\s+({_NUMERO})")
+        for original, plegada in zip(lineas, plegadas):
+            m = regex.match(plegada)
+            if m:
+                valores[f"{cation}_porcentaje"] = original[m.start(1):m.end(1)]
+                valores[f"{cation}_me_100g"] = original[m.start(2):m.end(2)]
+                confianza[f"{cation}_porcentaje"] = 1.0
+                confianza[f"{cation}_me_100g"] = 1.0
+                break
+
+
+def _extract_ratios(lineas, plegadas, valores, confianza):
+    """Relaciones entre cationes: cinco valores asignados por posición"""
+    inicio = next((i for i, p in enumerate(plegadas) if "RELACIONES ENTRE CATIONES" in p), None)
+    if inicio is None:
+        return
+
+    for i in range(inicio + 1, min(inicio + 8, len(lineas))):
+        numeros = list(_NUMERO_RE.finditer(plegadas[i]))
+        if len(numeros) < len(RELACIONES):
+            continue
+        for (campo, _), m in zip(RELACIONES, numeros):
+            valores[campo] = lineas[i][m.start():m.end()]
+            confianza[campo] = 1.0
+
+        # Las interpretaciones suelen ir en la línea siguiente, una palabra por columna
+        if i + 1 < len(lineas) and not _NUMERO_RE.search(plegadas[i + 1]):
+            palabras = lineas[i + 1].split()
+            if len(palabras) == len(RELACIONES):
+                for (_, campo_interpretacion), palabra in zip(RELACIONES, palabras):
+                    valores[campo_interpretacion] = palabra
+                    confianza[campo_interpretacion] = 1.0
+        return
+
+
+def extract_report(texto):
+    """
+    Extrae un ReporteAnalisisSuelo de la capa de texto de una página.
+    Devuelve (reporte, {campo: confianza entre 0 y 1}). Los campos que no se
+    encuentran quedan vacíos con confianza 0.
+    """
+    lineas = [linea for linea in texto.splitlines() if linea.strip()]
+    plegadas = [_fold(linea) for linea in lineas]
+    valores = {}
+    confianza = {}
+
+    _extract_labelled(lineas, plegadas, valores, confianza)
+    _extract_rows(lineas, plegadas, valores, confianza)
+    _extract_cations(lineas, plegadas, valores, confianza)
+    _extract_ratios(lineas, plegadas, valores, confianza)
+
+    for campo in ReporteAnalisisSuelo.model_fields:
+        valores.setdefault(campo, "")
+        confianza.setdefault(campo, 0.0)
+
+    return ReporteAnalisisSuelo(**valores), confianza
+
+
+def extract_page(preflight, index, umbral):
+    """
+    Intenta extraer localmente el reporte de una página. Devuelve el reporte si
+    la página tiene un único reporte y la confianza media supera el umbral, o
+    None si la página debe enviarse al modelo.
+    """
+    texto = preflight.page_text(index)
+    if not texto.strip() or _fold(texto).count("CLAVE DE LA MUESTRA") != 1:
+        return None
+
+    reporte, confianza = extract_report(texto)
+    if confianza["clave_de_la_muestra"] < 1.0:
+        return None
+    if sum(confianza.values()) / len(confianza) < umbral:
+        return None
+    return reporte
@@ -1,56 +1,29 @@
 # scanner/agent/multi_account_agent.py
 from pydantic_ai import Agent, BinaryContent
+from pydantic_ai.models.google import GoogleModel
+from pydantic_ai.providers.google import GoogleProvider
 from dotenv import load_dotenv
 from .output import ReporteAnalisisSuelo
+from .key_pool import KeyPool
+from .extraction_cache import ExtractionCache, page_fingerprint
+from .preflight import PDFPreflight
+from .page_classifier import classify_pages
+from .local_extractor import extract_page
+from .numeric_verifier import PageNumberIndex, mismatched_fields
+from .fake_backend import FakeGeminiBackend
+from utils.metricas import ETAPA_SEGUNDOS, MODELO_SEGUNDOS, MODELO_TOKENS, REINTENTOS, CACHE_PAGINAS
+import asyncio
+import hashlib
 import os
 from typing import List
 import time
 import logging
-import PyPDF2
-import io
+import json
+import re
 
 load_dotenv()
 
-class MultiAccountAgent:
-    def __init__(self):
-        # Configurar múltiples API keys
-        self.api_keys = [
-            os.getenv("GEMINI_API_KEY"),      # Tu API key original
-            os.getenv("GEMINI_API_KEY_1"),    # Si es diferente a la original
-            os.getenv("GEMINI_API_KEY_2"), 
-            os.getenv("GEMINI_API_KEY_3"),
-            os.getenv("GEMINI_API_KEY_4")     # Añade más si tienes
-        ]
-        
-        # Filtrar keys válidas
-        self.api_keys = [key for key in self.api_keys if key]
-        
-        if not self.api_keys:
-            raise ValueError("No se encontraron API keys válidas. Configura GEMINI_API_KEY, GEMINI_API_KEY_1, GEMINI_API_KEY_2, etc. en tu .env")
-        
-        self.current_key_index = 0
-        self.retry_delays = [5, 10, 20, 30, 60]  # Delays progresivos
-        
-        # Configurar logging
-        logging.basicConfig(level=logging.INFO)
-        self.logger = logging.getLogger(__name__)
-        
-        # Crear agente inicial
-        self.agent = self._create_agent()
-        
-        self.logger.info(f"MultiAccountAgent inicializado con {len(self.api_keys)} API keys")
-        
-    def _create_agent(self):
-        """Crea un nuevo agente con la API key actual"""
-        current_key = self.api_keys[self.current_key_index]
-        
-        # Configurar la variable de entorno para el agente
-        os.environ["GOOGLE_API_KEY"] = current_key
-        
-        return Agent(
-            "gemini-2.5-flash",
-            system_prompt=(
-"""Eres un EXTRACTOR LITERAL de datos de documentos PDF de análisis de suelo.
+SYSTEM_PROMPT = """Eres un EXTRACTOR LITERAL de datos de documentos PDF de análisis de suelo.
 
 🚨 REGLA ABSOLUTA PARA NÚMEROS: COPIA EXACTA, CARÁCTER POR CARÁCTER 🚨
 
@@ -102,15 +75,194 @@ Si un campo está vacío, usar cadena vacía "".
 NO inventes datos.
 Procesa cada página por separado si tiene múltiples reportes.
 """
-),
+
+
+def _contains_token(texto, clave):
+    """
+    True si la clave aparece en el texto como palabra completa: "M-1" no
+    coincide dentro de "M-10" ni de "M-1-2"
+    """
+    patron = rf"(?<!\w)(?<!\w[-/.]){re.escape(clave)}(?!\w)(?![-/.]\w)"
+    return re.search(patron, texto) is not None
+
+
+class Result:
+    """Resultado de una extracción con la misma forma que el de Agent.run"""
+    def __init__(self, output, paginas_omitidas=None, paginas_locales=None, discrepancias=None):
+        self.output = output
+        # Páginas que no se enviaron al modelo por no contener reportes
+        self.paginas_omitidas = paginas_omitidas or []
+        # Páginas extraídas localmente desde la capa de texto (numeradas desde 1)
+        self.paginas_locales = paginas_locales or []
+        # Reportes cuyos números no coinciden con el texto del PDF tras reintentar
+        self.discrepancias = discrepancias or []
+
+
+class Progress:
+    """
+    Cuenta los chunks enviados al modelo y avisa al llamador: on_progress(hechos, total)
+    y on_chunk(tipo, datos) con los reportes de cada chunk ("filas") o sus errores ("error_chunk").
+    """
+    def __init__(self, callback=None, logger=None, on_chunk=None):
+        self.callback = callback
+        self.on_chunk = on_chunk
+        self.logger = logger
+        self.done = 0
+        self.total = 0
+        # Los reintentos del verificador no vuelven a emitir filas ya enviadas
+        self.stream_rows = True
+    
+    def plan(self, chunks):
+        self.total += chunks
+        self._notify(self.callback, self.done, self.total)
+    
+    def complete(self, chunks=1):
+        self.done += chunks
+        self._notify(self.callback, self.done, self.total)
+    
+    def rows(self, page_indices, reports, origen="modelo"):
+        if self.stream_rows and reports:
+            self._notify(self.on_chunk, "filas", {
+                "paginas": [p + 1 for p in page_indices], "reportes": reports, "origen": origen
+            })
+    
+    def chunk_error(self, page_indices, error, retrying):
+        self._notify(self.on_chunk, "error_chunk", {
+            "paginas": [p + 1 for p in page_indices or []], "error": str(error), "reintentando": retrying
+        })
+    
+    def _notify(self, callback, *args):
+        if callback is None:
+            return
+        try:
+            callback(*args)
+        except Exception as e:
+            # Un fallo al informar del progreso no debe interrumpir la extracción
+            if self.logger:
+                self.logger.warning(f"Error en el callback de progreso: {e}")
+
+
+class MultiAccountAgent:
+    def __init__(self):
+        # Backend del modelo: "gemini" (real) o "falso" (local, para pruebas de carga)
+        self.backend = os.getenv("GEMINI_BACKEND", "gemini").lower()
+        self.fake_backend = FakeGeminiBackend() if self.backend == "falso" else None
+        
+        # Configurar múltiples API keys
+        self.api_keys = [
+            os.getenv("GEMINI_API_KEY"),      # Tu API key original
+            os.getenv("GEMINI_API_KEY_1"),    # Si es diferente a la original
+            os.getenv("GEMINI_API_KEY_2"), 
+            os.getenv("GEMINI_API_KEY_3"),
+            os.getenv("GEMINI_API_KEY_4")     # Añade más si tienes
+        ]
+        
+        # Filtrar keys válidas
+        self.api_keys = [key for key in self.api_keys if key]
+        if self.fake_backend:
+            self.api_keys = self.fake_backend.api_keys()
+        
+        if not self.api_keys:
+            raise ValueError("No se encontraron API keys válidas. Configura GEMINI_API_KEY, GEMINI_API_KEY_1, GEMINI_API_KEY_2, etc. en tu .env")
+        
+        self.current_key_index = 0
+        self.retry_delays = [5, 10, 20, 30, 60]  # Delays progresivos
+        self.model_name = "gemini-2.5-flash"
+        
+        # Presupuesto por key (peticiones y tokens por minuto) y marcador de salud
+        self.key_pool = KeyPool(
+            len(self.api_keys),
+            rpm=int(os.getenv("GEMINI_RPM", "10")),
+            tpm=int(os.getenv("GEMINI_TPM", "250000")),
+            cooldowns=self.retry_delays
+        )
+        
+        # Configurar logging
+        logging.basicConfig(level=logging.INFO)
+        self.logger = logging.getLogger(__name__)
+        
+        # Omitir portadas, separadores y anexos antes de enviar páginas al modelo
+        self.classify_pages = os.getenv("CLASIFICAR_PAGINAS", "1") != "0"
+        
+        # Extraer localmente las páginas digitales con capa de texto fiable
+        self.local_extraction = os.getenv("EXTRACCION_LOCAL", "1") != "0"
+        self.local_threshold = float(os.getenv("EXTRACCION_LOCAL_UMBRAL", "0.9"))
+        
+        # Comprobar los números extraídos contra la capa de texto y reintentar solo los que fallen
+        self.verify_numbers = os.getenv("VERIFICACION_NUMERICA", "1") != "0"
+        
+        # Caché persistente de reportes por página; la versión cambia si cambia
+        # el modelo, el prompt o el esquema de salida
+        self.cache = ExtractionCache()
+        self.prompt_version = hashlib.sha256(
+            "|".join([
+                self.fake_backend.model_name if self.fake_backend else self.model_name,
+                SYSTEM_PROMPT,
+                json.dumps(ReporteAnalisisSuelo.model_json_schema(), sort_keys=True)
+            ]).encode("utf-8")
+        ).hexdigest()[:16]
+        
+        # Crear agente inicial
+        self.agent = self._create_agent()
+        
+        self.logger.info(f"MultiAccountAgent inicializado con {len(self.api_keys)} API keys (backend: {self.backend})")
+        
+    def _create_agent(self):
+        """Crea un nuevo agente con la API key actual"""
+        current_key = self.api_keys[self.current_key_index]
+        
+        # Configurar la variable de entorno para el agente
+        os.environ["GOOGLE_API_KEY"] = current_key
+        
+        return Agent(
+            self.model_name,
+            system_prompt=SYSTEM_PROMPT,
             output_type=List[ReporteAnalisisSuelo]
         )
     
-    def _rotate_api_key(self):
-        """Rota a la siguiente API key disponible"""
-        self.current_key_index = (self.current_key_index + 1) % len(self.api_keys)
-        self.logger.info(f"Rotando a API key #{self.current_key_index + 1}/{len(self.api_keys)}")
-        self.agent = self._create_agent()
+    def _create_model(self, key_index):
+        """
+        Crea un modelo de Gemini ligado a una API key concreta.
+        A diferencia de _create_agent no toca GOOGLE_API_KEY, por lo que
+        se puede usar desde varios hilos a la vez.
+        """
+        if self.fake_backend:
+            return self.fake_backend.create_model(key_index)
+        provider = GoogleProvider(api_key=self.api_keys[key_index])
+        return GoogleModel(self.model_name, provider=provider)
+    
+    def _estimate_tokens(self, num_pages):
+        """
+        Estima los tokens de entrada de una llamada: Gemini cuenta ~258 tokens
+        por página de PDF, más el prompt del sistema y el mensaje.
+        """
+        return 258 * max(num_pages, 1) + 1500
+    
+    async def _call_model(self, messages, estimated_tokens):
+        """
+        Ejecuta una llamada en la key con más margen del pool y registra el
+        resultado (latencia, tokens o error) en su marcador de salud
+        """
+        key_index = await self.key_pool.acquire_async(estimated_tokens, logger=self.logger)
+        self.logger.info(f"Usando API key #{key_index + 1}/{len(self.api_keys)}")
+        inicio = time.monotonic()
+        try:
+            result = await self.agent.run(messages, model=self._create_model(key_index))
+        except Exception as error:
+            MODELO_SEGUNDOS.observe(key_index + 1, "error", valor=time.monotonic() - inicio)
+            self.key_pool.record_error(key_index, self._is_quota_exceeded_error(error))
+            self.logger.error(f"Error con API key #{key_index + 1}: {str(error)}")
+            raise
+        
+        latencia = time.monotonic() - inicio
+        MODELO_SEGUNDOS.observe(key_index + 1, "ok", valor=latencia)
+        try:
+            tokens_reales = result.usage().total_tokens
+        except Exception:
+            tokens_reales = None
+        MODELO_TOKENS.inc(key_index + 1, valor=tokens_reales or estimated_tokens)
+        self.key_pool.record_success(key_index, latencia, estimated_tokens, tokens_reales)
+        return result
     
     def _is_quota_exceeded_error(self, error):
         """Detecta si el error es por límite de cuota/tokens o sobrecarga del modelo"""
@@ -134,95 +286,311 @@ Procesa cada página por separado si tiene múltiples reportes.
         ]
         return any(indicator in error_str for indicator in quota_indicators)
     
-    def _split_pdf_by_pages(self, pdf_content, max_pages_per_chunk=8):  # Reducido a 8 páginas
+    def _error_class(self, error):
+        """Clase de un error para las métricas de reintentos"""
+        error_str = str(error).lower()
+        if "429" in error_str or "quota" in error_str or "rate limit" in error_str or "resource exhausted" in error_str:
+            return "cuota"
+        if "503" in error_str or "overloaded" in error_str or "unavailable" in error_str:
+            return "sobrecarga"
+        if "content field missing" in error_str:
+            return "respuesta_vacia"
+        if self._is_quota_exceeded_error(error):
+            return "otro_temporal"
+        return type(error).__name__
+    
+    def _split_pdf_by_pages(self, preflight, page_indices, max_pages_per_chunk=8):  # Reducido a 8 páginas
         """
-        Divide el PDF en chunks por páginas usando PyPDF2
+        Divide las páginas indicadas en chunks usando PyPDF2.
+        Devuelve una lista de (índices_de_página, bytes_del_chunk).
         """
         chunks = []
         
         try:
-            # Crear un objeto BytesIO desde el contenido
-            pdf_stream = io.BytesIO(pdf_content)
-            pdf_reader = PyPDF2.PdfReader(pdf_stream)
-            total_pages = len(pdf_reader.pages)
-            
-            self.logger.info(f"PDF tiene {total_pages} páginas, dividiendo en chunks de {max_pages_per_chunk} páginas")
+            self.logger.info(f"Dividiendo {len(page_indices)} páginas en chunks de {max_pages_per_chunk} páginas")
+            inicio = time.perf_counter()
             
-            for start_page in range(0, total_pages, max_pages_per_chunk):
-                end_page = min(start_page + max_pages_per_chunk, total_pages)
-                
-                # Crear un nuevo PDF con las páginas del chunk
-                pdf_writer = PyPDF2.PdfWriter()
-                
-                for page_num in range(start_page, end_page):
-                    pdf_writer.add_page(pdf_reader.pages[page_num])
-                
-                # Guardar el chunk en bytes
-                chunk_stream = io.BytesIO()
-                pdf_writer.write(chunk_stream)
-                chunk_bytes = chunk_stream.getvalue()
-                chunk_stream.close()
-                
-                chunks.append(chunk_bytes)
-                self.logger.info(f"Chunk creado: páginas {start_page + 1}-{end_page} ({len(chunk_bytes)} bytes)")
+            for start in range(0, len(page_indices), max_pages_per_chunk):
+                chunk_pages = page_indices[start:start + max_pages_per_chunk]
+                chunk_bytes = preflight.build_pdf(chunk_pages)
+                chunks.append((chunk_pages, chunk_bytes))
+                self.logger.info(f"Chunk creado: páginas {[p + 1 for p in chunk_pages]} ({len(chunk_bytes)} bytes)")
             
-            pdf_stream.close()
+            ETAPA_SEGUNDOS.observe("division", valor=time.perf_counter() - inicio)
             return chunks
             
         except Exception as e:
             self.logger.error(f"Error al dividir PDF: {str(e)}")
             # Si no se puede dividir, devolver el PDF completo
-            return [pdf_content]
+            return [(list(range(preflight.num_pages)), preflight.data)]
+    
+    def _lookup_cached_pages(self, preflight, page_indices):
+        """
+        Calcula la clave de caché de las páginas indicadas y busca las ya extraídas.
+        Devuelve ({índice_de_página: clave}, {índice_de_página: reportes}).
+        """
+        page_keys = {}
+        for i in page_indices:
+            try:
+                page_keys[i] = ExtractionCache.make_key(page_fingerprint(preflight.page(i)), self.prompt_version)
+            except Exception as e:
+                self.logger.warning(f"No se pudo calcular la huella de la página {i + 1}: {e}")
+        
+        encontrados = self.cache.get_many(list(page_keys.values()))
+        cached = {i: encontrados[key] for i, key in page_keys.items() if key in encontrados}
+        return page_keys, cached
     
-    def run_sync(self, messages, max_retries_per_key=2):  # Reducido el número de reintentos
+    def _extract_pages_locally(self, preflight, page_indices):
         """
-        Ejecuta el agente con rotación automática de API keys y manejo de chunks
+        Extrae desde la capa de texto las páginas cuya confianza supera el umbral.
+        Devuelve {índice_de_página: [reporte]} solo para esas páginas.
         """
+        if not self.local_extraction or not preflight.has_text_layer:
+            return {}
+        
+        extraidas = {}
+        for i in page_indices:
+            try:
+                reporte = extract_page(preflight, i, self.local_threshold)
+            except Exception as e:
+                self.logger.warning(f"Error en la extracción local de la página {i + 1}: {e}")
+                continue
+            if reporte is not None:
+                extraidas[i] = [reporte]
+        return extraidas
+    
+    def _assign_reports_to_pages(self, preflight, page_indices, reports):
+        """
+        Reparte los reportes de un grupo de páginas entre sus páginas para poder
+        guardarlos en la caché. Usa la clave de la muestra en el texto de la página
+        y, si no hay texto, un reporte por página cuando las cuentas coinciden.
+        Devuelve {índice_de_página: reportes} o None si no se puede repartir.
+        """
+        por_pagina = {i: [] for i in page_indices}
+        
+        textos = {i: preflight.page_text(i) for i in page_indices}
+        
+        asignados = 0
+        if any(textos.values()):
+            for reporte in reports:
+                clave = (reporte.clave_de_la_muestra or "").strip()
+                pagina = next((i for i in page_indices if clave and _contains_token(textos.get(i, ""), clave)), None)
+                if pagina is None:
+                    break
+                por_pagina[pagina].append(reporte)
+                asignados += 1
+        if asignados == len(reports):
+            return por_pagina
+        
+        if len(reports) == len(page_indices):
+            return {i: [reporte] for i, reporte in zip(page_indices, reports)}
+        
+        return None
+    
+    def run_sync(self, messages, max_retries_per_key=2, on_progress=None, on_chunk=None):  # Reducido el número de reintentos
+        """
+        Versión síncrona de run_async para los controladores de Flask.
+        No se puede llamar desde código que ya tenga un event loop en marcha.
+        """
+        return asyncio.run(self.run_async(messages, max_retries_per_key, on_progress, on_chunk))
+    
+    async def run_async(self, messages, max_retries_per_key=2, on_progress=None, on_chunk=None):
+        """
+        Ejecuta el agente con rotación automática de API keys y manejo de chunks.
+        El PDF puede llegar como PDFPreflight (ya parseado por el controlador)
+        o como BinaryContent. Las páginas ya extraídas en subidas anteriores se
+        sirven desde la caché y solo las páginas nuevas se envían al modelo.
+        on_progress(hechos, total) se llama cada vez que termina un chunk y
+        on_chunk(tipo, datos) recibe sus reportes en cuanto están listos.
+        """
+        progress = Progress(on_progress, self.logger, on_chunk)
         # Extraer contenido PDF del mensaje
+        preflight = None
         pdf_content = None
         text_message = None
         
         for message in messages:
-            if hasattr(message, 'data') and hasattr(message, 'media_type'):
+            if isinstance(message, PDFPreflight):
+                preflight = message
+            elif hasattr(message, 'data') and hasattr(message, 'media_type'):
                 if message.media_type == "application/pdf":
                     pdf_content = message.data
             elif isinstance(message, str):
                 text_message = message
         
-        # Determinar si necesita procesamiento por chunks
-        needs_chunking = False
-        if pdf_content:
-            # Verificar número de páginas
+        if preflight is None:
+            if not pdf_content:
+                return await self._process_normal_pdf(messages, max_retries_per_key)
             try:
-                pdf_stream = io.BytesIO(pdf_content)
-                pdf_reader = PyPDF2.PdfReader(pdf_stream)
-                num_pages = len(pdf_reader.pages)
-                pdf_stream.close()
-                
-                # Si tiene más de 12 páginas o el archivo es muy grande, usar chunks
-                if num_pages > 12 or len(pdf_content) > 4 * 1024 * 1024:  # 4MB
-                    needs_chunking = True
-                    self.logger.info(f"PDF con {num_pages} páginas requiere procesamiento por chunks")
-                    
+                preflight = await asyncio.to_thread(PDFPreflight, pdf_content)
             except Exception as e:
                 self.logger.warning(f"No se pudo determinar el número de páginas: {e}")
+                return await self._process_normal_pdf(messages, max_retries_per_key)
+        
+        num_pages = preflight.num_pages
+        report_pages = list(range(num_pages))
+        skipped = []
+        if self.classify_pages:
+            with ETAPA_SEGUNDOS.time("clasificacion"):
+                report_pages, skipped = await asyncio.to_thread(classify_pages, preflight)
+            if skipped:
+                self.logger.info(f"Páginas omitidas por no contener reportes: {skipped}")
+        
+        with ETAPA_SEGUNDOS.time("cache"):
+            page_keys, page_results = await asyncio.to_thread(self._lookup_cached_pages, preflight, report_pages)
+        missing = [i for i in report_pages if i not in page_results]
+        CACHE_PAGINAS.inc("acierto", valor=len(page_results))
+        CACHE_PAGINAS.inc("fallo", valor=len(missing))
+        self.logger.info(f"Caché de extracciones: {len(report_pages) - len(missing)}/{len(report_pages)} páginas encontradas")
+        if page_results:
+            cached_pages = sorted(page_results)
+            progress.rows(cached_pages, [r for i in cached_pages for r in page_results[i]], "cache")
+        
+        # Solo las páginas que no se pueden extraer localmente con confianza van al modelo
+        with ETAPA_SEGUNDOS.time("extraccion_local"):
+            local_results = await asyncio.to_thread(self._extract_pages_locally, preflight, missing)
+        if local_results:
+            page_results.update(local_results)
+            missing = [i for i in missing if i not in local_results]
+            self.logger.info(f"Extracción local: {len(local_results)} páginas resueltas sin llamar al modelo")
+            local_pages = sorted(local_results)
+            progress.rows(local_pages, [r for i in local_pages for r in local_results[i]], "local")
+        
+        # Reportes que no se pudieron repartir por página, anclados a la primera página de su grupo
+        unassigned = {}
+        discrepancias = []
+        if missing:
+            extracted, unassigned = await self._extract_and_assign(
+                preflight, missing, text_message, max_retries_per_key, progress
+            )
+            
+            failing = {}
+            if self.verify_numbers and preflight.has_text_layer:
+                numbers = PageNumberIndex(preflight)
+                with ETAPA_SEGUNDOS.time("verificacion"):
+                    failing = await asyncio.to_thread(self._find_mismatches, extracted, numbers)
+                if failing:
+                    self.logger.warning(f"Números que no coinciden con el PDF en las páginas {[p + 1 for p in failing]}; re-extrayendo solo esas páginas")
+                    progress.stream_rows = False
+                    retried, _ = await self._extract_and_assign(
+                        preflight, sorted(failing), text_message, max_retries_per_key, progress
+                    )
+                    retried_failing = await asyncio.to_thread(self._find_mismatches, retried, numbers)
+                    for i, reports in retried.items():
+                        if i not in failing:
+                            continue
+                        # Solo vale un reintento con los mismos reportes; si no, se conserva el original
+                        if not self._same_reports(extracted[i], reports):
+                            self.logger.warning(f"El reintento de la página {i + 1} no devolvió los mismos reportes; se conserva la extracción original")
+                            continue
+                        # Quedarse con la extracción con menos discrepancias
+                        if self._mismatch_count(retried_failing.get(i)) < self._mismatch_count(failing[i]):
+                            extracted[i] = reports
+                            failing[i] = retried_failing.get(i)
+                    failing = {i: fallos for i, fallos in failing.items() if fallos}
+                
+                for i, fallos in sorted(failing.items()):
+                    discrepancias.extend({"pagina": i + 1, **fallo} for fallo in fallos)
+            
+            page_results.update(extracted)
+            # Las páginas con discrepancias no se guardan para que una nueva subida las reintente,
+            # ni las que el modelo dejó sin reportes (pudo saltárselas dentro del grupo)
+            await asyncio.to_thread(
+                self.cache.put_many,
+                {page_keys[i]: reports for i, reports in extracted.items() if reports and i in page_keys and i not in failing}
+            )
         
-        if needs_chunking:
-            return self._process_large_pdf(text_message, pdf_content, max_retries_per_key)
-        else:
-            # Procesamiento normal para PDFs pequeños
-            return self._process_normal_pdf(messages, max_retries_per_key)
+        all_results = []
+        for i in range(num_pages):
+            all_results.extend(page_results.get(i, []))
+            all_results.extend(unassigned.get(i, []))
+        
+        self.logger.info(f"Procesamiento completo: {len(all_results)} reportes extraídos en total")
+        return Result(
+            all_results,
+            paginas_omitidas=skipped,
+            paginas_locales=sorted(i + 1 for i in local_results),
+            discrepancias=discrepancias
+        )
+    
+    async def _extract_and_assign(self, preflight, page_indices, text_message, max_retries_per_key, progress):
+        """
+        Extrae con el modelo las páginas indicadas y reparte los reportes por página.
+        Devuelve ({índice_de_página: reportes}, {primera_página_del_grupo: reportes_sin_repartir}).
+        """
+        extracted = {}
+        unassigned = {}
+        with ETAPA_SEGUNDOS.time("modelo"):
+            groups = await self._extract_pages(preflight, page_indices, text_message, max_retries_per_key, progress)
+        for group_pages, reports in groups:
+            por_pagina = await asyncio.to_thread(self._assign_reports_to_pages, preflight, group_pages, reports)
+            if por_pagina is None:
+                self.logger.info(f"No se pudieron repartir los reportes de las páginas {[p + 1 for p in group_pages]}; no se guardan en caché")
+                unassigned[group_pages[0]] = reports
+                continue
+            extracted.update(por_pagina)
+        return extracted, unassigned
+    
+    def _find_mismatches(self, extracted, numbers):
+        """
+        Comprueba cada campo numérico de cada reporte contra los números de su página.
+        Devuelve {índice_de_página: [{"clave_de_la_muestra": ..., "campos": [...]}, ...]} con las páginas que fallan.
+        """
+        failing = {}
+        for i, reports in extracted.items():
+            page_numbers = numbers.numbers([i])
+            fallos = []
+            for reporte in reports:
+                campos = mismatched_fields(reporte, page_numbers)
+                if campos:
+                    fallos.append({"clave_de_la_muestra": reporte.clave_de_la_muestra, "campos": campos})
+            if fallos:
+                failing[i] = fallos
+        return failing
+    
+    def _mismatch_count(self, fallos):
+        return sum(len(fallo["campos"]) for fallo in fallos or [])
+    
+    def _same_reports(self, originales, reintentados):
+        """True si ambas extracciones tienen los mismos reportes según su clave de la muestra"""
+        def claves(reportes):
+            return sorted((r.clave_de_la_muestra or "").strip() for r in reportes)
+        return len(originales) == len(reintentados) and claves(originales) == claves(reintentados)
     
-    def _process_normal_pdf(self, messages, max_retries_per_key):
+    async def _extract_pages(self, preflight, page_indices, text_message, max_retries_per_key, progress):
+        """
+        Envía al modelo las páginas indicadas. Devuelve una lista de
+        (índices_de_página, reportes) por cada grupo de páginas enviado.
+        """
+        # Si tiene más de 12 páginas o el archivo es muy grande, usar chunks
+        if len(page_indices) > 12 or preflight.num_bytes > 4 * 1024 * 1024:  # 4MB
+            self.logger.info(f"PDF con {len(page_indices)} páginas por extraer requiere procesamiento por chunks")
+            return await self._process_large_pdf(preflight, page_indices, text_message, max_retries_per_key, progress)
+        
+        # Procesamiento normal para PDFs pequeños (el PDF completo si no hay páginas en caché)
+        pdf_content = await asyncio.to_thread(preflight.build_pdf, page_indices)
+        messages = [text_message, BinaryContent(data=pdf_content, media_type="application/pdf")]
+        
+        progress.plan(1)
+        result = await self._process_normal_pdf(
+            messages, max_retries_per_key, len(page_indices), progress=progress, page_indices=page_indices
+        )
+        output = result.output if isinstance(result.output, list) else [result.output]
+        progress.rows(page_indices, output)
+        progress.complete()
+        return [(list(page_indices), output)]
+    
+    async def _process_normal_pdf(self, messages, max_retries_per_key, num_pages=1, progress=None, page_indices=None):
         """Procesa un PDF de tamaño normal sin dividir en chunks"""
         total_attempts = 0
         max_total_attempts = len(self.api_keys) * max_retries_per_key
+        estimated_tokens = self._estimate_tokens(num_pages)
         
         while total_attempts < max_total_attempts:
             try:
-                self.logger.info(f"Intento {total_attempts + 1}/{max_total_attempts} con API key #{self.current_key_index + 1}")
+                self.logger.info(f"Intento {total_attempts + 1}/{max_total_attempts}")
                 
-                result = self.agent.run_sync(messages)
+                result = await self._call_model(messages, estimated_tokens)
                 self.logger.info("Procesamiento exitoso")
                 return result
                 
@@ -235,31 +603,21 @@ Procesa cada página por separado si tiene múltiples reportes.
                 is_quota_error = self._is_quota_exceeded_error(error)
                 self.logger.info(f"¿Es error de cuota/sobrecarga? {is_quota_error}")
                 
-                if is_quota_error:
-                    if total_attempts < max_total_attempts:
-                        # Rotar API key y reintentar
-                        self.logger.warning(f"Rotando API key debido a: {error_msg}")
-                        self._rotate_api_key()
-                        
-                        # Aplicar delay progresivo
-                        delay_index = min(total_attempts - 1, len(self.retry_delays) - 1)
-                        delay = self.retry_delays[delay_index]
-                        self.logger.info(f"Esperando {delay} segundos antes del siguiente intento...")
-                        time.sleep(delay)
-                        continue
-                    else:
-                        self.logger.error("Se agotaron todos los intentos con todas las API keys")
-                        break
+                if progress is not None:
+                    progress.chunk_error(page_indices, error, total_attempts < max_total_attempts)
+                
+                if total_attempts < max_total_attempts:
+                    REINTENTOS.inc(self._error_class(error))
+                    # La key que falló queda apartada en el pool; el siguiente
+                    # intento va a la key con más margen y solo espera si no hay ninguna
+                    if not is_quota_error:
+                        self.logger.error(f"Error no relacionado con cuota: {error_msg}")
+                    continue
+                elif is_quota_error:
+                    self.logger.error("Se agotaron todos los intentos con todas las API keys")
+                    break
                 else:
-                    # Error no relacionado con cuota, no reintentar inmediatamente
-                    self.logger.error(f"Error no relacionado con cuota: {error_msg}")
-                    # Intentar rotar API key de todas formas, por si ayuda
-                    if total_attempts < max_total_attempts:
-                        self._rotate_api_key()
-                        time.sleep(5)
-                        continue
-                    else:
-                        raise error
+                    raise error
         
         # Si llegamos aquí, se agotaron todos los intentos
         raise Exception(f"Se agotaron todos los intentos con {len(self.api_keys)} API keys. "
@@ -267,78 +625,91 @@ Procesa cada página por separado si tiene múltiples reportes.
                        f"El documento puede ser demasiado complejo o grande para procesar. "
                        f"Intenta dividir el PDF en secciones más pequeñas.")
     
-    def _process_large_pdf(self, text_message, pdf_content, max_retries_per_key):
+    async def _process_large_pdf(self, preflight, page_indices, text_message, max_retries_per_key, progress):
         """
-        Procesa un PDF grande dividiéndolo en chunks por páginas
+        Procesa un PDF grande dividiéndolo en chunks por páginas.
+        Los chunks se envían en paralelo (tantos a la vez como API keys sanas)
+        y los grupos se devuelven en el orden de las páginas.
         """
+        max_pages_per_chunk = 8
         # Dividir PDF en chunks por páginas (chunks más pequeños)
-        chunks = self._split_pdf_by_pages(pdf_content, max_pages_per_chunk=8)
+        chunks = await asyncio.to_thread(
+            self._split_pdf_by_pages, preflight, page_indices, max_pages_per_chunk
+        )
         self.logger.info(f"PDF dividido en {len(chunks)} chunks")
+        progress.plan(len(chunks))
         
-        all_results = []
+        # Tantos chunks en vuelo como API keys sanas (al menos uno)
+        max_concurrent = max(1, min(len(self.key_pool.healthy_keys()), len(chunks)))
+        semaphore = asyncio.Semaphore(max_concurrent)
+        self.logger.info(f"Procesando {len(chunks)} chunks con {max_concurrent} en paralelo")
         
-        for i, chunk_pdf_bytes in enumerate(chunks):
-            self.logger.info(f"Procesando chunk {i + 1}/{len(chunks)}")
-            
-            chunk_messages = [
-                f"{text_message} (Procesando páginas del chunk {i + 1} de {len(chunks)})",
-                BinaryContent(data=chunk_pdf_bytes, media_type="application/pdf")
-            ]
-            
-            # Procesar chunk con rotación de API keys
-            total_attempts = 0
-            max_total_attempts = len(self.api_keys) * max_retries_per_key
-            chunk_processed = False
-            
-            while total_attempts < max_total_attempts and not chunk_processed:
-                try:
-                    self.logger.info(f"Procesando chunk {i + 1} - intento {total_attempts + 1} con API key #{self.current_key_index + 1}")
-                    
-                    result = self.agent.run_sync(chunk_messages)
-                    
-                    # Extraer resultados del chunk
-                    chunk_results = result.output if hasattr(result, 'output') else result
-                    if isinstance(chunk_results, list):
-                        all_results.extend(chunk_results)
-                    else:
-                        all_results.append(chunk_results)
-                        
-                    chunk_processed = True
-                    self.logger.info(f"Chunk {i + 1} procesado exitosamente - {len(chunk_results) if isinstance(chunk_results, list) else 1} reportes extraídos")
-                    
-                except Exception as error:
-                    total_attempts += 1
-                    self.logger.error(f"Error en chunk {i + 1}, intento {total_attempts}: {str(error)}")
-                    
-                    if self._is_quota_exceeded_error(error) and total_attempts < max_total_attempts:
-                        self._rotate_api_key()
-                        delay_index = min(total_attempts - 1, len(self.retry_delays) - 1)
-                        delay = self.retry_delays[delay_index]
-                        self.logger.info(f"Esperando {delay} segundos antes del siguiente intento...")
-                        time.sleep(delay)
-                    else:
-                        # Si no es error de cuota o se agotaron intentos, fallar
-                        if not self._is_quota_exceeded_error(error):
-                            self.logger.error(f"Error no relacionado con cuota en chunk {i + 1}: {error}")
-                        raise error
-            
-            if not chunk_processed:
-                raise Exception(f"No se pudo procesar el chunk {i + 1} después de {max_total_attempts} intentos")
-            
-            # Pausa más larga entre chunks para evitar rate limiting
-            if i < len(chunks) - 1:  # No pausar después del último chunk
-                pause_time = 8  # Pausa de 8 segundos entre chunks
-                self.logger.info(f"Pausa de {pause_time} segundos antes del siguiente chunk...")
-                time.sleep(pause_time)
+        async def process_with_limit(i, chunk_pages, chunk_pdf_bytes):
+            async with semaphore:
+                chunk_results = await self._process_chunk(
+                    i, len(chunks), text_message, chunk_pdf_bytes, len(chunk_pages), max_retries_per_key,
+                    progress=progress, page_indices=chunk_pages
+                )
+            progress.rows(chunk_pages, chunk_results)
+            progress.complete()
+            return chunk_results
         
-        self.logger.info(f"Procesamiento completo: {len(all_results)} reportes extraídos en total")
+        # gather conserva el orden de los chunks y, por tanto, el de las páginas
+        chunk_outputs = await asyncio.gather(
+            *(process_with_limit(i, chunk_pages, chunk_pdf_bytes) for i, (chunk_pages, chunk_pdf_bytes) in enumerate(chunks))
+        )
+        
+        self.logger.info(f"Estado de las API keys: {self.key_pool.snapshot()}")
+        return [(chunk_pages, chunk_results) for (chunk_pages, _), chunk_results in zip(chunks, chunk_outputs)]
+    
+    async def _process_chunk(self, i, total_chunks, text_message, chunk_pdf_bytes, num_pages, max_retries_per_key,
+                             progress=None, page_indices=None):
+        """
+        Procesa un único chunk; cada intento va a la key con más margen del pool.
+        Devuelve la lista de reportes extraídos del chunk.
+        """
+        chunk_messages = [
+            f"{text_message} (Procesando páginas del chunk {i + 1} de {total_chunks})",
+            BinaryContent(data=chunk_pdf_bytes, media_type="application/pdf")
+        ]
+        
+        total_attempts = 0
+        max_total_attempts = len(self.api_keys) * max_retries_per_key
+        estimated_tokens = self._estimate_tokens(num_pages)
         
-        # Crear objeto resultado simulando la estructura esperada
-        class Result:
-            def __init__(self, output):
-                self.output = output
+        while total_attempts < max_total_attempts:
+            try:
+                self.logger.info(f"Procesando chunk {i + 1} - intento {total_attempts + 1}")
+                
+                result = await self._call_model(chunk_messages, estimated_tokens)
+                
+                # Extraer resultados del chunk
+                chunk_results = result.output if hasattr(result, 'output') else result
+                if not isinstance(chunk_results, list):
+                    chunk_results = [chunk_results]
+                
+                self.logger.info(f"Chunk {i + 1} procesado exitosamente - {len(chunk_results)} reportes extraídos")
+                return chunk_results
+                
+            except Exception as error:
+                total_attempts += 1
+                self.logger.error(f"Error en chunk {i + 1}, intento {total_attempts}: {str(error)}")
+                
+                retrying = self._is_quota_exceeded_error(error) and total_attempts < max_total_attempts
+                if progress is not None:
+                    progress.chunk_error(page_indices, error, retrying)
+                
+                if retrying:
+                    REINTENTOS.inc(self._error_class(error))
+                    # El pool ya apartó la key; el siguiente intento espera solo si todas están agotadas
+                    continue
+                
+                # Si no es error de cuota o se agotaron intentos, fallar
+                if not self._is_quota_exceeded_error(error):
+                    self.logger.error(f"Error no relacionado con cuota en chunk {i + 1}: {error}")
+                raise error
         
-        return Result(all_results)
+        raise Exception(f"No se pudo procesar el chunk {i + 1} después de {max_total_attempts} intentos")
 
 # Crear instancia global
 multi_agent = MultiAccountAgent()
@@ -0,0 +1,64 @@
+# scanner/agent/numeric_verifier.py
+import re
+
+_NUMERO = re.compile(r"-?\d+(?:[.,]\d+)?")
+_VALOR_NUMERICO = re.compile(r"^-?\d+(?:[.,]\d+)?$")
+
+# Campos de ReporteAnalisisSuelo que contienen una medición copiada del PDF
+NUMERIC_FIELDS = [
+    'arcilla', 'limo', 'arena', 'porcentaje_saturacion', 'densidad_aparente_DAP',
+    'ph_agua_suelo', 'ph_cacl2', 'ph_kcl', 'carbonato_calcio_equivalente', 'conductividad_electrica',
+    'materia_organica', 'fosforo', 'n_inorganico', 'potasio', 'calcio', 'magnesio', 'sodio', 'azufre',
+    'ca_porcentaje', 'ca_me_100g', 'mg_porcentaje', 'mg_me_100g', 'k_porcentaje', 'k_me_100g',
+    'na_porcentaje', 'na_me_100g', 'al_porcentaje', 'al_me_100g', 'h_porcentaje', 'h_me_100g', 'cic',
+    'hierro', 'cobre', 'zinc', 'manganeso', 'boro',
+    'ca_mg_relacion', 'mg_k_relacion', 'ca_k_relacion', 'ca_mg_k_relacion', 'k_mg_relacion',
+]
+
+
+def number_set(texto):
+    """
+    Conjunto de los números que aparecen literalmente en un texto. Se añade la
+    variante con punto de cada número con coma decimal (y la variante sin signo),
+    pero nunca una con otros decimales: "3.20" no admite "3.2".
+    """
+    numeros = set()
+    for m in _NUMERO.finditer(texto):
+        valor = m.group()
+        for variante in (valor, valor.replace(",", ".")):
+            numeros.add(variante)
+            numeros.add(variante.lstrip("-"))
+    return frozenset(numeros)
+
+
+def mismatched_fields(reporte, numeros):
+    """Campos numéricos del reporte cuyo valor no aparece tal cual en el texto de la página"""
+    if not numeros:
+        return []
+    fallos = []
+    for campo in NUMERIC_FIELDS:
+        valor = (getattr(reporte, campo, None) or "").strip()
+        # Solo se comprueban valores con forma de número ("N/D" o "" no se verifican)
+        if not _VALOR_NUMERICO.match(valor):
+            continue
+        if valor not in numeros and valor.replace(",", ".") not in numeros:
+            fallos.append(campo)
+    return fallos
+
+
+class PageNumberIndex:
+    """Números de la capa de texto de cada página, tokenizados una sola vez por subida"""
+    def __init__(self, preflight):
+        self.preflight = preflight
+        self._paginas = {}
+
+    def numbers(self, page_indices):
+        """Unión de los números de las páginas indicadas"""
+        if len(page_indices) == 1:
+            return self._page(page_indices[0])
+        return frozenset().union(*(self._page(i) for i in page_indices))
+
+    def _page(self, index):
+        if index not in self._paginas:
+            self._paginas[index] = number_set(self.preflight.page_text(index))
+        return self._paginas[index]
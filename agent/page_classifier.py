@@ -0,0 +1,101 @@
+# scanner/agent/page_classifier.py
+import re
+import unicodedata
+
+# Encabezados que aparecen en las páginas de un reporte de análisis de suelo
+REPORT_KEYWORDS = [
+    "RELACIONES ENTRE CATIONES",
+    "CLAVE DE LA MUESTRA",
+    "CATIONES INTERCAMBIABLES",
+    "MICRONUTRIENTES",
+    "RESULTADOS DE FERTILIDAD",
+    "DATOS DEL SOLICITANTE",
+    "CONDICIONES DE LA MUESTRA",
+    "PARAMETROS FISICOS",
+    "PARAMETROS QUIMICOS",
+    "MATERIA ORGANICA",
+    "CONDUCTIVIDAD ELECTRICA",
+    "CAPACIDAD DE INTERCAMBIO",
+    "TEXTURA",
+]
+
+# Las tablas del reporte tienen muchos valores numéricos con decimales
+_NUMERO = re.compile(r"\d+[.,]\d+")
+MIN_TABLE_NUMBERS = 15
+MIN_TEXT_CHARS = 30
+# Páginas sin texto pero con mucho dibujo vectorial (p. ej. texto convertido a trazos)
+MIN_VECTOR_BYTES = 2000
+
+
+def _normalize(texto):
+    """Mayúsculas sin acentos ni espacios repetidos"""
+    texto = unicodedata.normalize("NFKD", texto)
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", texto).upper()
+
+
+def _has_images(page):
+    """True si la página dibuja imágenes u otros XObjects (p. ej. una hoja escaneada)"""
+    try:
+        resources = page.get("/Resources")
+        return resources is not None and bool(resources.get_object().get("/XObject"))
+    except Exception:
+        return True
+
+
+def _content_size(page):
+    """Bytes del stream de contenido de la página (0 si no dibuja nada)"""
+    try:
+        contents = page.get_contents()
+        return len(contents.get_data().strip()) if contents is not None else 0
+    except Exception:
+        return MIN_VECTOR_BYTES
+
+
+def classify_page(preflight, index):
+    """
+    Clasifica una página. Devuelve None si parece una página de reporte
+    (o no se puede saber) o el motivo por el que se puede omitir.
+    """
+    texto = preflight.page_text(index).strip()
+
+    if len(texto) < MIN_TEXT_CHARS:
+        page = preflight.page(index)
+        # Sin capa de texto útil: con imágenes o mucho dibujo puede ser un
+        # reporte escaneado o vectorizado, que no se puede clasificar aquí
+        if _has_images(page):
+            return None
+        tamano = _content_size(page)
+        if tamano >= MIN_VECTOR_BYTES:
+            return None
+        if not texto and tamano == 0:
+            return "página en blanco"
+        return "separador sin contenido"
+
+    normalizado = _normalize(texto)
+    coincidencias = sum(1 for palabra in REPORT_KEYWORDS if palabra in normalizado)
+    numeros = len(_NUMERO.findall(texto))
+
+    if coincidencias >= 2 or (coincidencias >= 1 and numeros >= MIN_TABLE_NUMBERS):
+        return None
+    # Un escaneo con un encabezado o sello con texto ("Laboratorio... Página 1 de 3")
+    # tiene los datos en la imagen: igual que sin texto, no se puede juzgar aquí
+    if _has_images(preflight.page(index)):
+        return None
+    return "sin datos de análisis de suelo (portada o anexo)"
+
+
+def classify_pages(preflight):
+    """
+    Separa las páginas con reporte de las que no lo tienen.
+    Devuelve (índices_con_reporte, [{"pagina": n, "motivo": ...}, ...]) con páginas numeradas desde 1.
+    """
+    report_pages = []
+    skipped = []
+    for i in range(preflight.num_pages):
+        motivo = classify_page(preflight, i)
+        if motivo is None:
+            report_pages.append(i)
+        else:
+            skipped.append({"pagina": i + 1, "motivo": motivo})
+    return report_pages, skipped
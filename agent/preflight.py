@@ -0,0 +1,75 @@
+# scanner/agent/preflight.py
+import hashlib
+import io
+
+
+class PDFPreflight:
+    """
+    Análisis previo de un PDF subido. Se crea una sola vez por subida y lo
+    comparten el controlador y el agente, de modo que el PDF solo se parsea una vez.
+    """
+    def __init__(self, data, filename=None, sha256=None):
+        self.data = data
+        self.filename = filename
+        self.num_bytes = len(data)
+        # Huella del contenido; la subida la calcula mientras llegan los bytes
+        self.sha256 = sha256 or hashlib.sha256(data).hexdigest()
+
+        # Parsear una sola vez; las páginas de PyPDF2 se abren bajo demanda
+        # (PyPDF2 se importa aquí para no cargarlo al arrancar la aplicación)
+        import PyPDF2
+        self.reader = PyPDF2.PdfReader(io.BytesIO(data))
+        self.is_encrypted = self.reader.is_encrypted
+        if self.is_encrypted:
+            # Muchos PDFs "cifrados" solo tienen permisos y abren con contraseña vacía
+            try:
+                descifrado = self.reader.decrypt("")
+            except Exception as e:
+                raise ValueError(f"El PDF está protegido con contraseña: {str(e)}")
+            if not descifrado:
+                raise ValueError("El PDF está protegido con contraseña")
+
+        self.num_pages = len(self.reader.pages)
+        self._texts = {}
+        self._has_text_layer = None
+
+    def page(self, index):
+        """Devuelve la página indicada (PyPDF2 la parsea al primer acceso)"""
+        return self.reader.pages[index]
+
+    def page_text(self, index):
+        """Texto de la capa de texto de una página, extraído una sola vez"""
+        if index not in self._texts:
+            try:
+                self._texts[index] = self.page(index).extract_text() or ""
+            except Exception:
+                self._texts[index] = ""
+        return self._texts[index]
+
+    @property
+    def has_text_layer(self):
+        """True si alguna página tiene texto extraíble (PDF digital y no escaneado)"""
+        if self._has_text_layer is None:
+            self._has_text_layer = any(self.page_text(i).strip() for i in range(self.num_pages))
+        return self._has_text_layer
+
+    def build_pdf(self, page_indices):
+        """Crea un nuevo PDF en memoria con las páginas indicadas"""
+        if list(page_indices) == list(range(self.num_pages)):
+            return self.data
+
+        import PyPDF2
+        pdf_writer = PyPDF2.PdfWriter()
+        for page_num in page_indices:
+            pdf_writer.add_page(self.page(page_num))
+
+        chunk_stream = io.BytesIO()
+        pdf_writer.write(chunk_stream)
+        chunk_bytes = chunk_stream.getvalue()
+        chunk_stream.close()
+        return chunk_bytes
+
+    def as_binary_content(self):
+        """Contenido listo para enviar al modelo"""
+        from pydantic_ai import BinaryContent
+        return BinaryContent(data=self.data, media_type="application/pdf")
@@ -8,6 +8,12 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 sys.path.insert(0, parent_dir)
 
+# Como función serverless el proceso se congela tras cada respuesta: las
+# extracciones se hacen dentro de la petición (200 con el resultado) en lugar
+# de en la cola en segundo plano (202 + /api/jobs), que necesita un servidor
+# de larga duración. Se fija antes de importar las rutas, que crean la cola.
+os.environ.setdefault("TRABAJOS_SINCRONOS", "1")
+
 # Debug: Lista de archivos disponibles
 def listar_archivos():
     archivos_info = {
@@ -32,6 +38,12 @@ try:
         pdf_bp_status = f"Error: {str(e)}"
         import_errors.append(f"pdf_routes: {str(e)}")
     
+    try:
+        from routes.metrics_routes import metrics_bp
+    except Exception as e:
+        metrics_bp = None
+        import_errors.append(f"metrics_routes: {str(e)}")
+    
     try:
         from controllers.pdf_controller import mostrar_vista_principal_controller
         controller_status = "OK"
@@ -44,10 +56,19 @@ try:
     app = Flask(__name__, 
                template_folder=os.path.join(parent_dir, 'templates'),
                static_folder=os.path.join(parent_dir, 'static'))
+    
+    # Subidas a un buffer en memoria con SHA-256 y límite de tamaño
+    try:
+        from utils.subidas import PeticionSubida
+        app.request_class = PeticionSubida
+    except Exception as e:
+        import_errors.append(f"subidas: {str(e)}")
 
     # Registrar el blueprint solo si se importó correctamente
     if pdf_bp:
         app.register_blueprint(pdf_bp, url_prefix="/api")
+    if metrics_bp:
+        app.register_blueprint(metrics_bp)
 
     # Ruta principal en la raíz
     @app.route("/")
@@ -1,14 +1,18 @@
 # scanner/app.py
 from flask import Flask, render_template
 from routes.pdf_routes import pdf_bp
-from controllers.pdf_controller import mostrar_vista_principal_controller, limpiar_archivos_antiguos
-import threading
-import time
+from routes.metrics_routes import metrics_bp
+from controllers.pdf_controller import mostrar_vista_principal_controller
+from utils.subidas import PeticionSubida
 
 app = Flask(__name__, template_folder='templates', static_folder='static')
+# Subidas a un buffer en memoria con SHA-256 y límite de tamaño
+app.request_class = PeticionSubida
 
 # Registrar el blueprint para las rutas API
 app.register_blueprint(pdf_bp, url_prefix="/api")  
+# Métricas en formato Prometheus en /metrics
+app.register_blueprint(metrics_bp)
 
 # Ruta principal en la raíz
 @app.route("/")
@@ -20,21 +24,7 @@ def index():
 def juegos():
     return render_template('juegos.html')
 
-# Función para limpieza periódica en segundo plano
-def limpieza_periodica():
-    while True:
-        try:
-            # Dormir durante 12 horas
-            time.sleep(10 * 60)
-            # Ejecutar limpieza
-            limpiar_archivos_antiguos()
-        except Exception as e:
-            print(f"Error en limpieza periódica: {str(e)}")
-
-# Iniciar hilo de limpieza periódica
+# Los archivos generados los elimina el programador de caducidad de
+# controllers.pdf_controller (un solo hilo), sin limpieza periódica aparte
 if __name__ == "__main__":
-    # Iniciar el hilo de limpieza en segundo plano
-    limpieza_thread = threading.Thread(target=limpieza_periodica, daemon=True)
-    limpieza_thread.start()
-    
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,10 @@
+# scanner/controllers/metrics_controller.py
+from flask import Response
+from utils import exponer_metricas
+
+
+def metricas_controller():
+    """
+    Expone las métricas de la aplicación en formato de texto de Prometheus
+    """
+    return Response(exponer_metricas(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,19 +1,20 @@
 # scanner/controllers/pdf_controller.py
 from pathlib import Path
-from flask import request, jsonify, render_template, send_file, redirect, url_for, make_response
-from pydantic_ai import BinaryContent
-from agent.multi_account_agent import multi_agent  # Cambiar esta línea
-from utils import convertir_reportes_a_json, exportar_dict_a_excel
+from flask import request, jsonify, render_template, send_file, redirect, url_for, make_response, Response
+from agent import multi_agent
+from agent.preflight import PDFPreflight
+from utils import convertir_reportes_a_json, exportar_dict_a_excel, COLA_TRABAJOS, ProgramadorCaducidad
+from utils.cola_trabajos import stream_eventos, ColaLlena
+from utils.metricas import ETAPA_SEGUNDOS, PDF_BYTES, PDF_PAGINAS
+from utils.subidas import leer_subida, MAX_PAGINAS_PDF
+from werkzeug.exceptions import RequestEntityTooLarge
 import os
-import tempfile
-import PyPDF2
-import openpyxl
 import json
 import io
 import datetime
-import time
 import threading
 import re
+from collections import OrderedDict
 
 
 def obtener_orden_columnas_correcto():
@@ -183,6 +184,8 @@ def crear_excel_desde_datos(report_dicts, excel_filename):
 ARCHIVOS_DIR = os.path.join(os.getcwd(), "archivos_generados")
 # Tiempo de caducidad en segundos (20 minutos)
 TIEMPO_CADUCIDAD = 20 * 60
+# Tamaño máximo del directorio (1GB); al superarlo se eliminan los que antes vencen
+LIMITE_TAMANO = 1 * 1024 * 1024 * 1024
 
 def crear_directorio_archivos():
     """
@@ -200,6 +203,64 @@ def crear_directorio_archivos():
 # Crear el directorio si no existe al cargar el módulo
 crear_directorio_archivos()
 
+# Filas ya parseadas de los Excel generados: nombre_archivo -> (columnas, datos)
+# Evita volver a leer el libro en cada visita a la página de resultados
+CACHE_FILAS = OrderedDict()
+MAX_CACHE_FILAS = 32
+_cache_filas_lock = threading.Lock()
+
+def guardar_filas_en_cache(nombre_archivo, columnas, datos):
+    """
+    Guarda las filas parseadas de un Excel, expulsando las menos usadas
+    """
+    with _cache_filas_lock:
+        CACHE_FILAS[nombre_archivo] = (columnas, datos)
+        CACHE_FILAS.move_to_end(nombre_archivo)
+        while len(CACHE_FILAS) > MAX_CACHE_FILAS:
+            CACHE_FILAS.popitem(last=False)
+
+def obtener_filas_resultados(nombre_archivo, ruta_excel):
+    """
+    Devuelve (columnas, datos) de un Excel generado: desde la caché, si no
+    desde el JSON que se guarda junto al Excel y, como último recurso,
+    leyendo el libro en modo read_only
+    """
+    with _cache_filas_lock:
+        if nombre_archivo in CACHE_FILAS:
+            CACHE_FILAS.move_to_end(nombre_archivo)
+            return CACHE_FILAS[nombre_archivo]
+    
+    ruta_json = ruta_excel[:-len('.xlsx')] + '.json'
+    if os.path.exists(ruta_json):
+        with open(ruta_json, 'r', encoding='utf-8') as f:
+            datos = aplicar_orden_dataframe(json.load(f))
+        columnas = list(datos[0].keys()) if datos else []
+    else:
+        import openpyxl
+        wb = openpyxl.load_workbook(ruta_excel, read_only=True)
+        try:
+            filas = wb.active.iter_rows(values_only=True)
+            columnas = list(next(filas, ()))
+            datos = [dict(zip(columnas, fila)) for fila in filas]
+        finally:
+            wb.close()
+    
+    guardar_filas_en_cache(nombre_archivo, columnas, datos)
+    return columnas, datos
+
+def quitar_filas_de_cache(ruta_archivo):
+    """
+    Olvida las filas de un Excel eliminado
+    """
+    with _cache_filas_lock:
+        CACHE_FILAS.pop(os.path.basename(ruta_archivo), None)
+
+# Un solo hilo elimina los archivos caducados y controla el tamaño del directorio
+PROGRAMADOR_ARCHIVOS = ProgramadorCaducidad(
+    ARCHIVOS_DIR, TIEMPO_CADUCIDAD, LIMITE_TAMANO, al_eliminar=quitar_filas_de_cache
+)
+PROGRAMADOR_ARCHIVOS.iniciar()
+
 def mostrar_vista_principal_controller():
     """
     Renderiza la vista principal con el formulario para subir PDFs
@@ -208,83 +269,13 @@ def mostrar_vista_principal_controller():
 
 def limpiar_archivos_antiguos():
     """
-    Elimina archivos generados que no se han utilizado en el tiempo de caducidad (20 minutos)
-    y elimina la carpeta si está vacía
+    Elimina los archivos generados cuya caducidad (20 minutos sin usarse) ya venció.
+    El programador lo hace solo; esta función fuerza una pasada sin recorrer el directorio.
     """
-    if not os.path.exists(ARCHIVOS_DIR):
-        return 0
-    
-    tiempo_actual = time.time()
-    contador_eliminados = 0
-    
-    # Buscar todos los archivos en el directorio
-    for archivo in os.listdir(ARCHIVOS_DIR):
-        ruta_archivo = os.path.join(ARCHIVOS_DIR, archivo)
-        
-        # Verificar si es un archivo (no un directorio)
-        if os.path.isfile(ruta_archivo):
-            # Obtener el tiempo de última modificación
-            tiempo_modificacion = os.path.getmtime(ruta_archivo)
-            
-            # Si el archivo es más antiguo que 20 minutos, eliminarlo
-            if tiempo_actual - tiempo_modificacion > TIEMPO_CADUCIDAD:
-                try:
-                    os.remove(ruta_archivo)
-                    contador_eliminados += 1
-                except Exception as e:
-                    print(f"Error al eliminar {ruta_archivo}: {str(e)}")
-    
-    # Intentar eliminar la carpeta si está vacía
-    try:
-        if os.path.exists(ARCHIVOS_DIR) and not os.listdir(ARCHIVOS_DIR):
-            os.rmdir(ARCHIVOS_DIR)
-            print("Carpeta archivos_generados eliminada (estaba vacía)")
-    except Exception as e:
-        print(f"Error al eliminar carpeta: {str(e)}")
-    
+    contador_eliminados = PROGRAMADOR_ARCHIVOS.eliminar_vencidos()
     print(f"Limpieza automática completada: {contador_eliminados} archivos eliminados")
     return contador_eliminados
 
-def verificar_espacio_disponible():
-    """
-    Verifica si hay suficiente espacio disponible en el directorio de archivos
-    Si el directorio supera 1GB, elimina los archivos más antiguos
-    """
-    # Crear el directorio si no existe
-    if not crear_directorio_archivos():
-        return False
-        
-    limite_tamano = 1 * 1024 * 1024 * 1024  # 1GB en bytes
-    
-    try:
-        tamano_total = sum(os.path.getsize(os.path.join(ARCHIVOS_DIR, f)) for f in os.listdir(ARCHIVOS_DIR) 
-                           if os.path.isfile(os.path.join(ARCHIVOS_DIR, f)))
-        
-        if tamano_total > limite_tamano:
-            print(f"Directorio excede el límite de tamaño ({tamano_total} bytes). Limpiando archivos más antiguos...")
-            
-            # Obtener lista de archivos ordenados por tiempo de modificación (más antiguos primero)
-            archivos = [(f, os.path.getmtime(os.path.join(ARCHIVOS_DIR, f))) 
-                       for f in os.listdir(ARCHIVOS_DIR) 
-                       if os.path.isfile(os.path.join(ARCHIVOS_DIR, f))]
-            archivos.sort(key=lambda x: x[1])
-            
-            # Eliminar archivos hasta que el tamaño sea menor que el 80% del límite
-            for archivo, _ in archivos:
-                ruta_archivo = os.path.join(ARCHIVOS_DIR, archivo)
-                try:
-                    tamano_archivo = os.path.getsize(ruta_archivo)
-                    os.remove(ruta_archivo)
-                    tamano_total -= tamano_archivo
-                    if tamano_total < limite_tamano * 0.8:
-                        break
-                except Exception as e:
-                    print(f"Error al eliminar {ruta_archivo}: {str(e)}")
-    except Exception as e:
-        print(f"Error al verificar espacio disponible: {str(e)}")
-    
-    return True
-
 def obtener_ruta_archivo(nombre_archivo):
     """
     Obtiene la ruta completa de un archivo y actualiza su fecha de último acceso
@@ -294,7 +285,9 @@ def obtener_ruta_archivo(nombre_archivo):
     # Actualizar la fecha de último acceso si el archivo existe
     if os.path.exists(ruta_completa):
         # Actualizar la fecha de modificación para indicar que se ha accedido al archivo
+        # (sirve de vencimiento si el proceso se reinicia) y retrasar su caducidad
         os.utime(ruta_completa, None)
+        PROGRAMADOR_ARCHIVOS.renovar(ruta_completa)
     
     return ruta_completa
 
@@ -308,88 +301,119 @@ def generar_nombre_archivo(base, extension):
     return f"{base_limpio}_{timestamp}.{extension}"
 
 def procesar_pdf_controller():
-    if "file" not in request.files:
-        return jsonify({"error": "No se envió ningún archivo PDF"}), 400
-
-    file = request.files["file"]
-
-    if file.filename == "":
-        return jsonify({"error": "El archivo no tiene nombre"}), 400
+    """
+    Valida el PDF subido y encola su extracción. Responde de inmediato con el
+    id del trabajo; el estado se consulta en /api/jobs/<job_id>.
+    """
+    # El archivo se lee del cuerpo de la petición a un buffer en memoria con su SHA-256
+    try:
+        if "file" not in request.files:
+            return jsonify({"error": "No se envió ningún archivo PDF"}), 400
+        file = request.files["file"]
+        if file.filename == "":
+            return jsonify({"error": "El archivo no tiene nombre"}), 400
+        data, sha256 = leer_subida(file)
+    except RequestEntityTooLarge as e:
+        return jsonify({"error": e.description}), 413
 
-    temp_path = None
     try:
-        # Verificar espacio disponible y limpiar si es necesario
-        if not verificar_espacio_disponible():
-            return jsonify({"error": "No se pudo preparar el directorio de archivos"}), 500
-        
-        # Limpiar archivos antiguos automáticamente
-        limpiar_archivos_antiguos()
-        
-        # Asegurar que el directorio existe después de la limpieza
+        # La caducidad y el límite de tamaño los aplica PROGRAMADOR_ARCHIVOS
+        # Asegurar que el directorio existe
         if not crear_directorio_archivos():
             return jsonify({"error": "No se pudo crear el directorio de archivos"}), 500
         
-        # Guardar temporalmente el PDF
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-            file.save(tmp.name)
-            temp_path = Path(tmp.name)
-        
-        # Verificar el número de páginas del PDF
-        pdf_reader = None
+        # Analizar el PDF una sola vez; el agente reutiliza este mismo objeto
         try:
-            pdf_reader = PyPDF2.PdfReader(str(temp_path))
-            num_pages = len(pdf_reader.pages)
+            with ETAPA_SEGUNDOS.time("preflight"):
+                preflight = PDFPreflight(data, filename=file.filename, sha256=sha256)
+            num_pages = preflight.num_pages
+            PDF_BYTES.observe(valor=preflight.num_bytes)
+            PDF_PAGINAS.observe(valor=num_pages)
             
-            # Validar si el PDF tiene más de 60 páginas
-            if num_pages > 60:
+            # Validar el número máximo de páginas
+            if num_pages > MAX_PAGINAS_PDF:
                 return jsonify({
-                    "error": "El archivo excede el tamaño máximo permitido por la aplicación (60 páginas)",
+                    "error": f"El archivo excede el tamaño máximo permitido por la aplicación ({MAX_PAGINAS_PDF} páginas)",
                     "paginas": num_pages
                 }), 413
                 
-            print(f"PDF cargado exitosamente con {num_pages} páginas")
+            print(f"PDF cargado exitosamente con {num_pages} páginas ({preflight.num_bytes} bytes)")
         except Exception as e:
             return jsonify({"error": f"Error al leer el PDF: {str(e)}"}), 400
-        finally:
-            # Asegurarnos de que se libere la referencia al lector PDF
-            pdf_reader = None
-        
-        # Leer los bytes del archivo para el procesamiento por el agente
-        pdf_bytes = temp_path.read_bytes()
         
+        # Serverless: se extrae en la propia petición y se devuelve el resultado (200)
+        if COLA_TRABAJOS.sincrono:
+            respuesta, codigo = COLA_TRABAJOS.ejecutar(extraer_reportes_trabajo, preflight, file.filename)
+            return jsonify(respuesta), codigo
+
+        # Dos subidas simultáneas del mismo PDF comparten un único trabajo
+        try:
+            trabajo, nuevo = COLA_TRABAJOS.encolar_unico(preflight.sha256, extraer_reportes_trabajo, preflight, file.filename)
+        except ColaLlena as e:
+            respuesta = jsonify({
+                "error": f"El servicio está procesando demasiados documentos. Inténtalo de nuevo en {e.retry_after} segundos.",
+                "retry_after": e.retry_after
+            })
+            respuesta.status_code = 503
+            respuesta.headers["Retry-After"] = str(e.retry_after)
+            return respuesta
+        return jsonify({
+            "mensaje": f"PDF de {num_pages} páginas en cola para su procesamiento." if nuevo
+                       else "Este PDF ya se está procesando; se espera al mismo resultado.",
+            "job_id": trabajo.id,
+            "status_url": f"/api/jobs/{trabajo.id}",
+            "paginas": num_pages
+        }), 202
+
+    except Exception as e:
+        print(f"Error al preparar el PDF: {str(e)}")
+        return jsonify({
+            "error": f"Error al procesar el PDF: {str(e)}",
+            "detalle": "Error interno del sistema."
+        }), 500
+
+def extraer_reportes_trabajo(trabajo, preflight, filename):
+    """
+    Ejecuta la extracción de un PDF en un worker de la cola.
+    Devuelve (respuesta, código_http) con la misma forma que la antigua respuesta síncrona.
+    """
+    num_pages = preflight.num_pages
+    try:
         # Usar el multi_agent en lugar del agent simple
         print("Iniciando procesamiento con multi-agent...")
         result = multi_agent.run_sync([
             f"Extrae toda la información de análisis de suelo de este PDF de {num_pages} páginas. Procesa cada hoja por separado y extrae todos los reportes encontrados.",
-            BinaryContent(data=pdf_bytes, media_type="application/pdf")
-        ])
+            preflight
+        ], on_progress=trabajo.progreso,
+           on_chunk=lambda tipo, datos: publicar_evento_chunk(trabajo, tipo, datos))
 
         print(f"Procesamiento completado. Reportes extraídos: {len(result.output) if result.output else 0}")
 
         # Verificar que se obtuvieron resultados
         if not result.output:
-            return jsonify({
+            return {
                 "error": "No se pudieron extraer datos del PDF. El documento podría no contener información de análisis de suelo en el formato esperado."
-            }), 422
+            }, 422
 
         # Convertir resultados a JSON/Dict
-        report_dicts = convertir_reportes_a_json(result.output, como_json=False)
+        with ETAPA_SEGUNDOS.time("conversion"):
+            report_dicts = convertir_reportes_a_json(result.output, como_json=False)
 
-        # Generar nombres de archivo únicos
-        nombre_base = Path(file.filename).stem
+        # Generar nombres de archivo únicos; el JSON comparte nombre con el Excel
+        nombre_base = Path(filename).stem
         excel_filename = generar_nombre_archivo(nombre_base, "xlsx")
-        json_filename = generar_nombre_archivo(nombre_base, "json")
+        json_filename = excel_filename[:-len('.xlsx')] + '.json'
         
         # Asegurar que el directorio existe antes de guardar archivos
         if not crear_directorio_archivos():
-            return jsonify({"error": "No se pudo crear el directorio de archivos para guardar los resultados"}), 500
+            return {"error": "No se pudo crear el directorio de archivos para guardar los resultados"}, 500
         
         # Crear Excel usando openpyxl en lugar de pandas
         try:
             ruta_excel = crear_excel_desde_datos(report_dicts, excel_filename)
             print(f"Archivo Excel guardado con orden correcto: {ruta_excel}")
         except Exception as e:
-            return jsonify({"error": f"Error al crear archivo Excel: {str(e)}"}), 500
+            return {"error": f"Error al crear archivo Excel: {str(e)}"}, 500
         
         # Guardar también los datos en JSON
         try:
@@ -401,18 +425,25 @@ def procesar_pdf_controller():
             print(f"Advertencia: No se pudo guardar el archivo JSON: {str(e)}")
             # No es crítico, continuar sin JSON
             
-        programar_eliminacion_archivo(ruta_excel)
+        # Las filas ya están en memoria: la página de resultados no tiene que leer el Excel
+        datos_ordenados = aplicar_orden_dataframe(report_dicts)
+        guardar_filas_en_cache(excel_filename, list(datos_ordenados[0].keys()), datos_ordenados)
+        
+        PROGRAMADOR_ARCHIVOS.registrar(ruta_excel)
         if os.path.exists(os.path.join(ARCHIVOS_DIR, json_filename)):
-            programar_eliminacion_archivo(os.path.join(ARCHIVOS_DIR, json_filename))
+            PROGRAMADOR_ARCHIVOS.registrar(os.path.join(ARCHIVOS_DIR, json_filename))
         
-        return jsonify({
+        return {
             "mensaje": f"Proceso completado correctamente. Se extrajeron {len(report_dicts)} reportes del PDF de {num_pages} páginas.",
             "archivo_excel": excel_filename,
             "archivo_json": json_filename,
             "redirect_url": f"/api/resultados/{excel_filename}",
             "reportes_extraidos": len(report_dicts),
-            "paginas_procesadas": num_pages
-        })
+            "paginas_procesadas": num_pages,
+            "paginas_omitidas": getattr(result, "paginas_omitidas", []),
+            "paginas_locales": getattr(result, "paginas_locales", []),
+            "discrepancias": getattr(result, "discrepancias", [])
+        }, 200
 
     except Exception as e:
         error_msg = str(e)
@@ -420,37 +451,86 @@ def procesar_pdf_controller():
         
         # Mensajes de error más específicos
         if "Content field missing" in error_msg:
-            return jsonify({
+            return {
                 "error": "El documento es demasiado complejo para procesar. Intenta con un PDF más pequeño o divide el documento en secciones.",
                 "detalle": "El modelo de IA no pudo generar una respuesta válida para este documento."
-            }), 422
+            }, 422
         elif "quota exceeded" in error_msg.lower() or "rate limit" in error_msg.lower():
-            return jsonify({
+            return {
                 "error": "Se han agotado temporalmente los recursos de procesamiento. Inténtalo de nuevo en unos minutos.",
                 "detalle": "Límite de API alcanzado."
-            }), 429
+            }, 429
         elif "token limit" in error_msg.lower():
-            return jsonify({
+            return {
                 "error": "El documento es demasiado grande para procesar de una vez. Intenta dividirlo en partes más pequeñas.",
                 "detalle": "Límite de tokens excedido."
-            }), 413
+            }, 413
         else:
-            return jsonify({
+            return {
                 "error": f"Error al procesar el PDF: {error_msg}",
                 "detalle": "Error interno del sistema."
-            }), 500
+            }, 500
+
+def publicar_evento_chunk(trabajo, tipo, datos):
+    """
+    Publica en el trabajo un evento de chunk del agente; los reportes se
+    convierten a filas con el mismo orden de columnas que la tabla final
+    """
+    if tipo == "filas":
+        filas = aplicar_orden_dataframe(convertir_reportes_a_json(datos["reportes"], como_json=False))
+        datos = {"paginas": datos["paginas"], "origen": datos["origen"], "filas": filas}
+    trabajo.publicar(tipo, datos)
+
+def eventos_trabajo_controller(job_id):
+    """
+    Stream Server-Sent Events con el progreso, las filas de cada chunk en cuanto
+    termina, los errores por chunk y el evento final del trabajo
+    """
+    trabajo = COLA_TRABAJOS.obtener(job_id)
+    if trabajo is None:
+        return jsonify({"error": "El trabajo no existe o ha caducado"}), 404
     
-    finally:
-        # Intentar eliminar el archivo temporal en el bloque finally
-        try:
-            if temp_path and os.path.exists(temp_path):
-                # Asegurarnos de que no hay referencias abiertas al archivo
-                import gc
-                gc.collect()  # Forzar la recolección de basura
-                os.remove(temp_path)
-                print("Archivo temporal eliminado correctamente")
-        except Exception as e:
-            print(f"Error al eliminar archivo temporal: {str(e)}")
+    # Al reconectar, el navegador envía el último id recibido
+    try:
+        desde = int(request.headers.get("Last-Event-ID", -1)) + 1
+    except ValueError:
+        desde = 0
+    
+    response = Response(stream_eventos(trabajo, desde), mimetype="text/event-stream")
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def resultados_trabajo_controller(job_id):
+    """
+    Vista de resultados en vivo de un trabajo: la tabla se va llenando con las
+    filas de cada chunk y, al terminar, se redirige a los resultados definitivos
+    """
+    trabajo = COLA_TRABAJOS.obtener(job_id)
+    if trabajo is None:
+        return jsonify({"error": "El trabajo no existe o ha caducado"}), 404
+    
+    estado = trabajo.a_dict()
+    if estado["estado"] == "completado" and estado["redirect_url"]:
+        return redirect(estado["redirect_url"])
+    
+    return render_template(
+        "resultados.html",
+        datos=[],
+        columnas=obtener_orden_columnas_correcto(),
+        nombre_archivo=None,
+        job_id=job_id,
+        dias_caducidad=30  # minutos
+    )
+
+def estado_trabajo_controller(job_id):
+    """
+    Devuelve el estado, el progreso y, al terminar, el resultado de un trabajo
+    """
+    trabajo = COLA_TRABAJOS.obtener(job_id)
+    if trabajo is None:
+        return jsonify({"error": "El trabajo no existe o ha caducado"}), 404
+    return jsonify(trabajo.a_dict())
 
 def mostrar_resultados_controller(nombre_archivo):
     """
@@ -468,21 +548,8 @@ def mostrar_resultados_controller(nombre_archivo):
         if not os.path.exists(ruta_excel):
             return jsonify({"error": "El archivo no existe o ha caducado"}), 404
         
-        # Cargar los datos del Excel usando openpyxl
-        wb = openpyxl.load_workbook(ruta_excel)
-        ws = wb.active
-        
-        # Obtener columnas (primera fila)
-        columnas = [cell.value for cell in ws[1]]
-        
-        # Obtener datos (todas las filas después de la primera)
-        datos = []
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            fila_dict = {}
-            for i, valor in enumerate(row):
-                if i < len(columnas):
-                    fila_dict[columnas[i]] = valor
-            datos.append(fila_dict)
+        # Filas parseadas (caché, JSON o, en último caso, el Excel en modo read_only)
+        columnas, datos = obtener_filas_resultados(nombre_archivo, ruta_excel)
         
         # Ruta al archivo JSON correspondiente (si existe)
         json_filename = nombre_archivo.replace('.xlsx', '.json')
@@ -531,8 +598,7 @@ def descargar_filtrado_controller():
     Genera un archivo Excel con los datos filtrados y lo devuelve para descarga
     """
     try:
-        # Verificar espacio disponible y limpiar si es necesario
-        if not verificar_espacio_disponible():
+        if not crear_directorio_archivos():
             return jsonify({"error": "No se pudo preparar el directorio de archivos"}), 500
         
         # Obtener los datos filtrados del JSON enviado por POST
@@ -549,6 +615,7 @@ def descargar_filtrado_controller():
         # Generar un nombre de archivo único para el resultado filtrado
         filtrado_filename = generar_nombre_archivo("datos_filtrados", "xlsx")
         ruta_filtrado = crear_excel_desde_datos(datos_ordenados, filtrado_filename)
+        PROGRAMADOR_ARCHIVOS.registrar(ruta_filtrado)
         
         # Devolver el archivo para descarga
         return send_file(
@@ -559,25 +626,3 @@ def descargar_filtrado_controller():
         
     except Exception as e:
         return jsonify({"error": f"Error al generar el Excel filtrado: {str(e)}"}), 500
-    
-def programar_eliminacion_archivo(ruta_archivo, delay=1200):  # 1200 segundos = 20 minutos
-    """
-    Programa la eliminación de un archivo específico después del delay especificado
-    """
-    def eliminar_archivo():
-        time.sleep(delay)
-        try:
-            if os.path.exists(ruta_archivo):
-                os.remove(ruta_archivo)
-                print(f"Archivo eliminado automáticamente: {ruta_archivo}")
-                
-                # Verificar si la carpeta está vacía y eliminarla
-                if os.path.exists(ARCHIVOS_DIR) and not os.listdir(ARCHIVOS_DIR):
-                    os.rmdir(ARCHIVOS_DIR)
-                    print("Carpeta archivos_generados eliminada (estaba vacía)")
-        except Exception as e:
-            print(f"Error al eliminar archivo programado {ruta_archivo}: {str(e)}")
-    
-    # Ejecutar en un hilo separado
-    thread = threading.Thread(target=eliminar_archivo, daemon=True)
-    thread.start()
\ No newline at end of file
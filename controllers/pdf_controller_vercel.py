@@ -1,17 +1,19 @@
 # scanner/controllers/pdf_controller_vercel.py
 from pathlib import Path
-from flask import request, jsonify, render_template, send_file, make_response
-from pydantic_ai import BinaryContent
-from agent.multi_account_agent import multi_agent
-from utils import convertir_reportes_a_json, exportar_dict_a_excel
-import tempfile
-import PyPDF2
-import openpyxl
-import json
-import io
+from flask import request, jsonify, render_template, Response, redirect
+from agent import multi_agent
+from agent.preflight import PDFPreflight
+from utils import convertir_reportes_a_json, exportar_tabla_a_excel_stream, COLA_TRABAJOS, ALMACEN_SESIONES, TablaColumnar, CACHE_EXPORTACIONES
+from utils.cola_trabajos import stream_eventos, ColaLlena
+from utils.consulta_tabla import interpretar_consulta, interpretar_especificacion, consultar, filas_filtradas, clave_consulta
+from utils.exportar_formatos import FORMATOS_EXPORTACION, comprimir_gzip
+from utils.metricas import ETAPA_SEGUNDOS, PDF_BYTES, PDF_PAGINAS
+from utils.subidas import leer_subida, MAX_PAGINAS_PDF
+from werkzeug.exceptions import RequestEntityTooLarge
 import datetime
 import time
 import re
+import uuid
 
 def obtener_orden_columnas_correcto():
     """
@@ -101,8 +103,21 @@ def generar_nombre_archivo(base, extension):
     base_limpio = re.sub(r'[\\/*?:"<>|]', "", base)
     return f"{base_limpio}_{timestamp}.{extension}"
 
-# Cache en memoria para almacenar datos temporalmente
-CACHE_DATOS = {}
+# La espera de la cola de extracciones se dimensiona con las API keys disponibles.
+# Es la única asignación: este es el controlador que registran las rutas y el
+# agente se crea al primer uso, no al importar
+COLA_TRABAJOS.capacidad = lambda: multi_agent.key_pool.capacity()
+
+# Las sesiones se guardan en ALMACEN_SESIONES (memoria acotada + SQLite compartido entre workers)
+
+def obtener_tabla_sesion(datos_sesion):
+    """
+    Tabla columnar de una sesión; las sesiones guardadas como lista de
+    diccionarios (versiones anteriores) se convierten al leerlas
+    """
+    if 'tabla' in datos_sesion:
+        return datos_sesion['tabla']
+    return TablaColumnar.desde_filas(datos_sesion.get('datos', []), obtener_orden_columnas_correcto())
 
 def mostrar_vista_principal_controller():
     """
@@ -111,78 +126,178 @@ def mostrar_vista_principal_controller():
     return render_template("index.html")
 
 def procesar_pdf_controller():
-    if "file" not in request.files:
-        return jsonify({"error": "No se envió ningún archivo PDF"}), 400
+    """
+    Valida el PDF subido y encola su extracción. Responde de inmediato con el
+    id del trabajo; el estado se consulta en /api/jobs/<job_id>.
+    """
+    # El archivo se lee del cuerpo de la petición a un buffer en memoria con su SHA-256
+    try:
+        if "file" not in request.files:
+            return jsonify({"error": "No se envió ningún archivo PDF"}), 400
+        file = request.files["file"]
+        if file.filename == "":
+            return jsonify({"error": "El archivo no tiene nombre"}), 400
+        data, sha256 = leer_subida(file)
+    except RequestEntityTooLarge as e:
+        return jsonify({"error": e.description}), 413
 
-    file = request.files["file"]
+    # Analizar el PDF una sola vez; el agente reutiliza este mismo objeto
+    try:
+        with ETAPA_SEGUNDOS.time("preflight"):
+            preflight = PDFPreflight(data, filename=file.filename, sha256=sha256)
+    except Exception as e:
+        return jsonify({"error": f"Error al leer el PDF: {str(e)}"}), 400
+    num_pages = preflight.num_pages
+    PDF_BYTES.observe(valor=preflight.num_bytes)
+    PDF_PAGINAS.observe(valor=num_pages)
+    
+    # Validar el número máximo de páginas
+    if num_pages > MAX_PAGINAS_PDF:
+        return jsonify({
+            "error": f"El archivo excede el tamaño máximo permitido por la aplicación ({MAX_PAGINAS_PDF} páginas)",
+            "paginas": num_pages
+        }), 413
+        
+    print(f"PDF cargado exitosamente con {num_pages} páginas ({preflight.num_bytes} bytes)")
+    
+    # Mismo PDF que una extracción en curso: unirse a ella en lugar de repetirla.
+    # Se consulta antes que la sesión terminada porque el trabajo guarda su
+    # sesión antes de dejar de estar en curso; así no queda ningún hueco.
+    trabajo = COLA_TRABAJOS.en_curso(sha256)
+    if trabajo is not None:
+        return respuesta_trabajo_encolado(trabajo, num_pages, reutilizado=True)
+
+    # Mismo PDF que una sesión que aún no ha caducado: devolverla sin extraer
+    sesion_previa = sesion_por_hash(sha256)
+    if sesion_previa is not None:
+        session_id = sesion_previa["session_id"]
+        print(f"PDF ya procesado ({sha256[:12]}...), reutilizando la sesión {session_id}")
+        return jsonify({
+            "mensaje": f"Este PDF ya se procesó; se reutiliza su sesión ({sesion_previa.get('reportes_extraidos', 0)} reportes extraídos).",
+            "session_id": session_id,
+            "redirect_url": f"/api/resultados/{session_id}",
+            "reportes_extraidos": sesion_previa.get("reportes_extraidos"),
+            "paginas": num_pages,
+            "reutilizado": True
+        }), 200
 
-    if file.filename == "":
-        return jsonify({"error": "El archivo no tiene nombre"}), 400
+    # Serverless: el proceso se congela tras responder, así que se extrae en la
+    # propia petición y se devuelve el resultado completo (200) como antes de la cola
+    if COLA_TRABAJOS.sincrono:
+        respuesta, codigo = COLA_TRABAJOS.ejecutar(extraer_reportes_trabajo, preflight, file.filename)
+        return jsonify(respuesta), codigo
 
-    temp_path = None
+    # Dos subidas simultáneas del mismo PDF comparten un único trabajo
+    try:
+        trabajo, nuevo = COLA_TRABAJOS.encolar_unico(sha256, extraer_reportes_trabajo, preflight, file.filename)
+    except ColaLlena as e:
+        return respuesta_cola_llena(e)
+    except ValueError as e:
+        # El agente se crea al primer uso: sin API keys configuradas no se puede extraer
+        print(f"Agente no disponible: {str(e)}")
+        return jsonify({
+            "error": "El servicio de extracción no está disponible en este momento.",
+            "detalle": str(e)
+        }), 503
+    return respuesta_trabajo_encolado(trabajo, num_pages, reutilizado=not nuevo)
+
+def respuesta_cola_llena(error):
+    """503 inmediato con Retry-After cuando no caben más extracciones en espera"""
+    print(f"Subida rechazada: {error}")
+    respuesta = jsonify({
+        "error": f"El servicio está procesando demasiados documentos. Inténtalo de nuevo en {error.retry_after} segundos.",
+        "retry_after": error.retry_after
+    })
+    respuesta.status_code = 503
+    respuesta.headers["Retry-After"] = str(error.retry_after)
+    return respuesta
+
+def respuesta_trabajo_encolado(trabajo, num_pages, reutilizado=False):
+    """Respuesta 202 con el trabajo que extrae el PDF (propio o compartido con otra subida)"""
+    if reutilizado:
+        mensaje = "Este PDF ya se está procesando; se espera al mismo resultado."
+    else:
+        mensaje = f"PDF de {num_pages} páginas en cola para su procesamiento."
+    return jsonify({
+        "mensaje": mensaje,
+        "job_id": trabajo.id,
+        "status_url": f"/api/jobs/{trabajo.id}",
+        "paginas": num_pages,
+        "reutilizado": reutilizado
+    }), 202
+
+def clave_hash_pdf(sha256):
+    """Clave en el almacén de sesiones que apunta a la sesión de un PDF por su contenido"""
+    return f"sha256:{sha256}"
+
+def sesion_por_hash(sha256):
+    """Datos de la sesión ya extraída de un PDF con ese hash, o None si no hay o caducó"""
+    alias = ALMACEN_SESIONES.obtener(clave_hash_pdf(sha256))
+    if not alias or not ALMACEN_SESIONES.existe(alias.get("session_id")):
+        return None
+    return alias
+
+def extraer_reportes_trabajo(trabajo, preflight, filename):
+    """
+    Ejecuta la extracción de un PDF en un worker de la cola.
+    Devuelve (respuesta, código_http) con la misma forma que la antigua respuesta síncrona.
+    """
+    num_pages = preflight.num_pages
     try:
-        # Guardar temporalmente el PDF
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-            file.save(tmp.name)
-            temp_path = Path(tmp.name)
-        
-        # Verificar el número de páginas del PDF
-        pdf_reader = PyPDF2.PdfReader(str(temp_path))
-        num_pages = len(pdf_reader.pages)
-        
-        # Validar si el PDF tiene más de 60 páginas
-        if num_pages > 60:
-            return jsonify({
-                "error": "El archivo excede el tamaño máximo permitido por la aplicación (60 páginas)",
-                "paginas": num_pages
-            }), 413
-            
-        print(f"PDF cargado exitosamente con {num_pages} páginas")
-        
-        # Leer los bytes del archivo para el procesamiento por el agente
-        pdf_bytes = temp_path.read_bytes()
-        
         # Usar el multi_agent
         print("Iniciando procesamiento con multi-agent...")
         result = multi_agent.run_sync([
             f"Extrae toda la información de análisis de suelo de este PDF de {num_pages} páginas. Procesa cada hoja por separado y extrae todos los reportes encontrados.",
-            BinaryContent(data=pdf_bytes, media_type="application/pdf")
-        ])
+            preflight
+        ], on_progress=trabajo.progreso,
+           on_chunk=lambda tipo, datos: publicar_evento_chunk(trabajo, tipo, datos))
 
         print(f"Procesamiento completado. Reportes extraídos: {len(result.output) if result.output else 0}")
 
         # Verificar que se obtuvieron resultados
         if not result.output:
-            return jsonify({
+            return {
                 "error": "No se pudieron extraer datos del PDF. El documento podría no contener información de análisis de suelo en el formato esperado."
-            }), 422
+            }, 422
 
-        # Convertir resultados a JSON/Dict
-        report_dicts = convertir_reportes_a_json(result.output, como_json=False)
-        
-        # Aplicar orden correcto
-        report_dicts = aplicar_orden_dataframe(report_dicts)
+        # Convertir resultados a JSON/Dict y aplicar orden correcto
+        with ETAPA_SEGUNDOS.time("conversion"):
+            report_dicts = convertir_reportes_a_json(result.output, como_json=False)
+            report_dicts = aplicar_orden_dataframe(report_dicts)
 
-        # Generar ID único para esta sesión
-        session_id = generar_nombre_archivo("session", "")
+        # Generar ID único para esta sesión (varios workers pueden crear sesiones en el mismo segundo)
+        session_id = f"{generar_nombre_archivo('session', '').rstrip('.')}_{uuid.uuid4().hex[:8]}"
         
-        # Guardar datos en cache en memoria
-        CACHE_DATOS[session_id] = {
-            'datos': report_dicts,
+        # Guardar datos en el almacén de sesiones, visible para todos los workers
+        # Las filas se guardan por columnas codificadas por diccionario
+        tabla = TablaColumnar.desde_filas(report_dicts, obtener_orden_columnas_correcto())
+        # Índices de filtrado y orden para /api/resultados/<session_id>/filas
+        tabla.indice()
+        ALMACEN_SESIONES.guardar(session_id, {
+            'tabla': tabla,
             'timestamp': time.time(),
-            'filename_base': Path(file.filename).stem
-        }
+            'filename_base': Path(filename).stem
+        })
+        # Las siguientes subidas del mismo PDF reutilizan esta sesión
+        ALMACEN_SESIONES.guardar(clave_hash_pdf(preflight.sha256), {
+            'session_id': session_id,
+            'reportes_extraidos': len(report_dicts),
+            'paginas': num_pages
+        })
         
-        # Limpiar cache antiguo (más de 30 minutos)
+        # Limpiar sesiones caducadas
         limpiar_cache_antiguo()
         
-        return jsonify({
+        return {
             "mensaje": f"Proceso completado correctamente. Se extrajeron {len(report_dicts)} reportes del PDF de {num_pages} páginas.",
             "session_id": session_id,
             "redirect_url": f"/api/resultados/{session_id}",
             "reportes_extraidos": len(report_dicts),
-            "paginas_procesadas": num_pages
-        })
+            "paginas_procesadas": num_pages,
+            "paginas_omitidas": getattr(result, "paginas_omitidas", []),
+            "paginas_locales": getattr(result, "paginas_locales", []),
+            "discrepancias": getattr(result, "discrepancias", [])
+        }, 200
 
     except Exception as e:
         error_msg = str(e)
@@ -190,132 +305,263 @@ def procesar_pdf_controller():
         
         # Mensajes de error más específicos
         if "Content field missing" in error_msg:
-            return jsonify({
+            return {
                 "error": "El documento es demasiado complejo para procesar. Intenta con un PDF más pequeño o divide el documento en secciones.",
                 "detalle": "El modelo de IA no pudo generar una respuesta válida para este documento."
-            }), 422
+            }, 422
         elif "quota exceeded" in error_msg.lower() or "rate limit" in error_msg.lower():
-            return jsonify({
+            return {
                 "error": "Se han agotado temporalmente los recursos de procesamiento. Inténtalo de nuevo en unos minutos.",
                 "detalle": "Límite de API alcanzado."
-            }), 429
+            }, 429
         else:
-            return jsonify({
+            return {
                 "error": f"Error al procesar el PDF: {error_msg}",
                 "detalle": "Error interno del sistema."
-            }), 500
-    
-    finally:
-        # Eliminar archivo temporal
-        try:
-            if temp_path and temp_path.exists():
-                temp_path.unlink()
-                print("Archivo temporal eliminado correctamente")
-        except Exception as e:
-            print(f"Error al eliminar archivo temporal: {str(e)}")
+            }, 500
 
-def limpiar_cache_antiguo():
+def publicar_evento_chunk(trabajo, tipo, datos):
+    """
+    Publica en el trabajo un evento de chunk del agente; los reportes se
+    convierten a filas con el mismo orden de columnas que la tabla final
     """
-    Elimina entradas del cache más antiguas de 30 minutos
+    if tipo == "filas":
+        filas = aplicar_orden_dataframe(convertir_reportes_a_json(datos["reportes"], como_json=False))
+        datos = {"paginas": datos["paginas"], "origen": datos["origen"], "filas": filas}
+    trabajo.publicar(tipo, datos)
+
+def eventos_trabajo_controller(job_id):
     """
-    tiempo_actual = time.time()
-    limite_tiempo = 30 * 60  # 30 minutos
+    Stream Server-Sent Events con el progreso, las filas de cada chunk en cuanto
+    termina, los errores por chunk y el evento final del trabajo
+    """
+    trabajo = COLA_TRABAJOS.obtener(job_id)
+    if trabajo is None:
+        return jsonify({"error": "El trabajo no existe o ha caducado"}), 404
     
-    keys_a_eliminar = []
-    for key, value in CACHE_DATOS.items():
-        if tiempo_actual - value['timestamp'] > limite_tiempo:
-            keys_a_eliminar.append(key)
+    # Al reconectar, el navegador envía el último id recibido
+    try:
+        desde = int(request.headers.get("Last-Event-ID", -1)) + 1
+    except ValueError:
+        desde = 0
     
-    for key in keys_a_eliminar:
-        del CACHE_DATOS[key]
+    response = Response(stream_eventos(trabajo, desde), mimetype="text/event-stream")
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def resultados_trabajo_controller(job_id):
+    """
+    Vista de resultados en vivo de un trabajo: la tabla se va llenando con las
+    filas de cada chunk y, al terminar, se redirige a los resultados definitivos
+    """
+    trabajo = COLA_TRABAJOS.obtener(job_id)
+    if trabajo is None:
+        return jsonify({"error": "El trabajo no existe o ha caducado"}), 404
     
-    print(f"Cache limpiado: {len(keys_a_eliminar)} entradas eliminadas")
+    estado = trabajo.a_dict()
+    if estado["estado"] == "completado" and estado["redirect_url"]:
+        return redirect(estado["redirect_url"])
+    
+    return render_template(
+        "resultados.html",
+        datos=[],
+        columnas=obtener_orden_columnas_correcto(),
+        session_id=None,
+        job_id=job_id,
+        dias_caducidad=ALMACEN_SESIONES.ttl // 60  # minutos
+    )
+
+def estado_trabajo_controller(job_id):
+    """
+    Devuelve el estado, el progreso y, al terminar, el resultado de un trabajo
+    """
+    trabajo = COLA_TRABAJOS.obtener(job_id)
+    if trabajo is None:
+        return jsonify({"error": "El trabajo no existe o ha caducado"}), 404
+    return jsonify(trabajo.a_dict())
+
+def limpiar_cache_antiguo():
+    """
+    Elimina las sesiones caducadas del almacén de sesiones
+    """
+    eliminadas = ALMACEN_SESIONES.limpiar_caducados()
+    CACHE_EXPORTACIONES.limpiar_caducados()
+    print(f"Cache limpiado: {eliminadas} entradas eliminadas")
 
 def mostrar_resultados_controller(session_id):
     """
     Muestra la vista de resultados con la tabla de datos desde el cache
     """
     try:
-        # Verificar que existe en el cache
-        if session_id not in CACHE_DATOS:
+        # Verificar que existe en el almacén de sesiones
+        datos_sesion = ALMACEN_SESIONES.obtener(session_id)
+        if datos_sesion is None:
             return jsonify({"error": "La sesión no existe o ha caducado"}), 404
         
-        datos_sesion = CACHE_DATOS[session_id]
-        datos = datos_sesion['datos']
-        
-        # Obtener columnas de los datos
-        columnas = []
-        if datos:
-            columnas = list(datos[0].keys())
+        tabla = obtener_tabla_sesion(datos_sesion)
         
+        # Las filas no se incrustan: la vista las pide por páginas a /filas
         return render_template(
             "resultados.html", 
-            datos=datos, 
-            columnas=columnas, 
+            datos=[], 
+            columnas=tabla.columnas, 
             session_id=session_id,
-            dias_caducidad=30  # minutos
+            total_registros=len(tabla),
+            dias_caducidad=ALMACEN_SESIONES.ttl // 60  # minutos
         )
     
     except Exception as e:
         return jsonify({"error": f"Error al mostrar los resultados: {str(e)}"}), 500
 
+def filas_resultados_controller(session_id):
+    """
+    Devuelve una página de filas de la sesión con filtros y orden aplicados
+    en el servidor (parámetros en utils.consulta_tabla.interpretar_consulta)
+    """
+    datos_sesion = ALMACEN_SESIONES.obtener(session_id)
+    if datos_sesion is None:
+        return jsonify({"error": "La sesión no existe o ha caducado"}), 404
+    
+    tabla = obtener_tabla_sesion(datos_sesion)
+    try:
+        consulta = interpretar_consulta(request.args, tabla.columnas)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    try:
+        return jsonify(consultar(tabla, consulta))
+    except Exception as e:
+        return jsonify({"error": f"Error al consultar los resultados: {str(e)}"}), 500
+
+MIMETYPE_EXCEL = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+def respuesta_exportacion(session_id, datos_sesion, formato, especificacion, mimetype, filename, generar, gzip=False):
+    """
+    Respuesta de descarga con caché por (sesión, formato, filtro) y ETag.
+    generar() devuelve los bloques del archivo y solo se llama si no está en
+    caché; la primera descarga se envía en streaming y se guarda. El ETag sale
+    de la sesión, el formato y el filtro, así que también va en la primera.
+    Con gzip los bloques se comprimen y se envían con Content-Encoding: gzip.
+    """
+    expira = datos_sesion.get('timestamp', time.time()) + ALMACEN_SESIONES.ttl
+    clave = CACHE_EXPORTACIONES.clave(session_id, f"{formato}+gzip" if gzip else formato, especificacion)
+    etag = CACHE_EXPORTACIONES.etag(clave, datos_sesion.get('timestamp'))
+    
+    # Descarga repetida o enlace compartido: el navegador ya tiene este archivo
+    if request.method == 'GET' and request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        entrada = CACHE_EXPORTACIONES.obtener(clave)
+        if entrada is None:
+            bloques = comprimir_gzip(generar()) if gzip else generar()
+            response = Response(CACHE_EXPORTACIONES.envolver(clave, bloques, expira, etag), mimetype=mimetype)
+        else:
+            response = Response(entrada[0], mimetype=mimetype)
+    response.set_etag(etag)
+    
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Cache-Control'] = 'private, no-cache'
+    if gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
+def exportar_sesion_controller(session_id, formato):
+    """
+    Descarga las filas de la sesión en xlsx, csv, ndjson o json-columnas, con los
+    mismos filtros y orden que /api/resultados/<session_id>/filas en la URL.
+    Los formatos de texto se comprimen con gzip si el cliente lo acepta.
+    """
+    if formato not in FORMATOS_EXPORTACION:
+        return jsonify({"error": f"Formato no soportado: {formato}. Formatos disponibles: {', '.join(FORMATOS_EXPORTACION)}"}), 400
+    
+    datos_sesion = ALMACEN_SESIONES.obtener(session_id)
+    if datos_sesion is None:
+        return jsonify({"error": "La sesión no existe o ha caducado"}), 404
+    
+    tabla = obtener_tabla_sesion(datos_sesion)
+    try:
+        consulta = interpretar_consulta(request.args, tabla.columnas)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    try:
+        mimetype, extension, generador, admite_gzip = FORMATOS_EXPORTACION[formato]
+        # La paginación no aplica a las descargas
+        especificacion = clave_consulta(consulta)
+        filtrada = especificacion is not None
+        filas = filas_filtradas(tabla.indice(), consulta) if filtrada else None
+        filename = generar_nombre_archivo(datos_sesion['filename_base'] + ("_filtrado" if filtrada else ""), extension)
+        
+        return respuesta_exportacion(
+            session_id, datos_sesion, formato, especificacion, mimetype, filename,
+            lambda: generador(tabla, filas),
+            gzip=admite_gzip and request.accept_encodings['gzip'] > 0
+        )
+    except Exception as e:
+        return jsonify({"error": f"Error al exportar los resultados: {str(e)}"}), 500
+
 def descargar_excel_controller(session_id):
     """
     Genera y descarga el archivo Excel desde el cache
     """
     try:
-        # Verificar que existe en el cache
-        if session_id not in CACHE_DATOS:
+        # Verificar que existe en el almacén de sesiones
+        datos_sesion = ALMACEN_SESIONES.obtener(session_id)
+        if datos_sesion is None:
             return jsonify({"error": "La sesión no existe o ha caducado"}), 404
         
-        datos_sesion = CACHE_DATOS[session_id]
-        datos = datos_sesion['datos']
         filename_base = datos_sesion['filename_base']
         
-        # Crear Excel en memoria
-        excel_buffer = exportar_dict_a_excel(datos)
-        
         # Generar nombre de archivo
         excel_filename = generar_nombre_archivo(filename_base, "xlsx")
         
-        # Crear respuesta
-        response = make_response(excel_buffer.getvalue())
-        response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        response.headers['Content-Disposition'] = f'attachment; filename="{excel_filename}"'
-        
-        return response
+        return respuesta_exportacion(
+            session_id, datos_sesion, "xlsx", None, MIMETYPE_EXCEL, excel_filename,
+            lambda: exportar_tabla_a_excel_stream(obtener_tabla_sesion(datos_sesion))
+        )
     
     except Exception as e:
         return jsonify({"error": f"Error al generar el archivo Excel: {str(e)}"}), 500
 
 def descargar_filtrado_controller():
     """
-    Genera un archivo Excel con los datos filtrados
+    Genera un archivo Excel con las filas de la sesión que cumplen un filtro.
+    Recibe {"session_id", "filtros", "orden"} con los mismos filtros que
+    /api/resultados/<session_id>/filas; las filas salen de la sesión guardada.
     """
     try:
-        # Obtener los datos filtrados del JSON enviado por POST
         if not request.is_json:
             return jsonify({"error": "Se esperaba formato JSON"}), 400
-            
-        datos_filtrados = request.json.get('datos_filtrados')
-        if not datos_filtrados:
-            return jsonify({"error": "No se recibieron datos filtrados"}), 400
         
-        # Aplicar orden correcto a los datos filtrados
-        datos_ordenados = aplicar_orden_dataframe(datos_filtrados)
+        especificacion = request.json
+        session_id = especificacion.get('session_id')
+        if not session_id:
+            return jsonify({"error": "No se recibió el session_id"}), 400
         
-        # Crear Excel en memoria
-        excel_buffer = exportar_dict_a_excel(datos_ordenados)
+        datos_sesion = ALMACEN_SESIONES.obtener(session_id)
+        if datos_sesion is None:
+            return jsonify({"error": "La sesión no existe o ha caducado"}), 404
+        
+        tabla = obtener_tabla_sesion(datos_sesion)
+        try:
+            consulta = interpretar_especificacion(especificacion, tabla.columnas)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        filas = filas_filtradas(tabla.indice(), consulta)
+        if not filas:
+            return jsonify({"error": "Ninguna fila cumple el filtro"}), 400
         
         # Generar nombre de archivo
         filtrado_filename = generar_nombre_archivo("datos_filtrados", "xlsx")
         
-        # Crear respuesta
-        response = make_response(excel_buffer.getvalue())
-        response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        response.headers['Content-Disposition'] = f'attachment; filename="{filtrado_filename}"'
-        
-        return response
+        # Las columnas de la tabla ya siguen el orden correcto
+        return respuesta_exportacion(
+            session_id, datos_sesion, "xlsx", clave_consulta(consulta), MIMETYPE_EXCEL, filtrado_filename,
+            lambda: exportar_tabla_a_excel_stream(tabla, filas)
+        )
         
     except Exception as e:
-        return jsonify({"error": f"Error al generar el Excel filtrado: {str(e)}"}), 500
\ No newline at end of file
+        return jsonify({"error": f"Error al generar el Excel filtrado: {str(e)}"}), 500
@@ -0,0 +1,7 @@
+# scanner/routes/metrics_routes.py
+from flask import Blueprint
+from controllers.metrics_controller import metricas_controller
+
+metrics_bp = Blueprint("metrics", __name__)
+
+metrics_bp.add_url_rule("/metrics", view_func=metricas_controller, methods=["GET"])
@@ -1,16 +1,33 @@
 # scanner/routes/pdf_routes.py
-from flask import Blueprint
+from flask import Blueprint, request
 from controllers.pdf_controller_vercel import (  # Cambiar la importación
     procesar_pdf_controller,
     descargar_excel_controller,
     mostrar_resultados_controller,
-    descargar_filtrado_controller
+    filas_resultados_controller,
+    descargar_filtrado_controller,
+    exportar_sesion_controller,
+    estado_trabajo_controller,
+    eventos_trabajo_controller,
+    resultados_trabajo_controller
 )
+from utils.metricas import PETICIONES
 
 pdf_bp = Blueprint("pdf", __name__)
 
 # Las rutas siguen igual, pero ahora usan session_id en lugar de nombres de archivo
 pdf_bp.add_url_rule("/procesar-pdf", view_func=procesar_pdf_controller, methods=["POST"])
+pdf_bp.add_url_rule("/jobs/<job_id>", view_func=estado_trabajo_controller, methods=["GET"])
+pdf_bp.add_url_rule("/jobs/<job_id>/eventos", view_func=eventos_trabajo_controller, methods=["GET"])
+pdf_bp.add_url_rule("/jobs/<job_id>/resultados", view_func=resultados_trabajo_controller, methods=["GET"])
 pdf_bp.add_url_rule("/resultados/<session_id>", view_func=mostrar_resultados_controller, methods=["GET"])
+pdf_bp.add_url_rule("/resultados/<session_id>/filas", view_func=filas_resultados_controller, methods=["GET"])
 pdf_bp.add_url_rule("/descargar-excel/<session_id>", view_func=descargar_excel_controller, methods=["GET"])
-pdf_bp.add_url_rule("/descargar-filtrado", view_func=descargar_filtrado_controller, methods=["POST"])
\ No newline at end of file
+pdf_bp.add_url_rule("/descargar-filtrado", view_func=descargar_filtrado_controller, methods=["POST"])
+pdf_bp.add_url_rule("/exportar/<session_id>/<formato>", view_func=exportar_sesion_controller, methods=["GET"])
+
+
+@pdf_bp.after_request
+def contar_peticion(response):
+    PETICIONES.inc(request.endpoint, response.status_code)
+    return response
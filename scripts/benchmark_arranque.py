@@ -0,0 +1,92 @@
+# scanner/scripts/benchmark_arranque.py
+"""
+Tiempo de arranque en frío de cada punto de entrada (app.py y api/index.py).
+
+Cada repetición es un intérprete nuevo, como un arranque en frío de Vercel:
+mide lo que tarda en importarse el módulo, la primera respuesta a una
+página estática y qué módulos pesados quedaron cargados.
+
+    python scripts/benchmark_arranque.py
+    python scripts/benchmark_arranque.py --repeticiones 10 --ruta /juegos
+    python scripts/benchmark_arranque.py --detalle 15
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PUNTOS_DE_ENTRADA = {"app.py": "app", "api/index.py": "api.index"}
+
+# Módulos que solo deberían cargarse al procesar un PDF o exportar
+MODULOS_PESADOS = ("pydantic_ai", "google.genai", "PyPDF2", "openpyxl", "pydantic", "agent.multi_account_agent")
+
+# Se ejecuta en el intérprete nuevo: importa el punto de entrada y pide una ruta
+MEDICION = """
+import json, sys, time
+inicio = time.perf_counter()
+modulo = __import__({modulo!r}, fromlist=["app"])
+importacion = time.perf_counter() - inicio
+inicio = time.perf_counter()
+respuesta = modulo.app.test_client().get({ruta!r})
+primera_respuesta = time.perf_counter() - inicio
+print(json.dumps({{
+    "importacion": importacion,
+    "primera_respuesta": primera_respuesta,
+    "codigo": respuesta.status_code,
+    "cargados": [m for m in {pesados!r} if m in sys.modules],
+}}))
+"""
+
+
+def medir(modulo, ruta):
+    """Un arranque en frío del módulo en un subproceso; devuelve el dict de MEDICION"""
+    codigo = MEDICION.format(modulo=modulo, ruta=ruta, pesados=MODULOS_PESADOS)
+    salida = subprocess.run(
+        [sys.executable, "-c", codigo], cwd=RAIZ, capture_output=True, text=True, check=True
+    ).stdout
+    # La aplicación puede imprimir mensajes antes; el resultado es la última línea
+    return json.loads(salida.strip().splitlines()[-1])
+
+
+def detalle_importaciones(modulo, cuantos):
+    """Los módulos con mayor tiempo acumulado según python -X importtime"""
+    salida = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        cwd=RAIZ, capture_output=True, text=True
+    ).stderr
+    filas = []
+    for linea in salida.splitlines():
+        partes = linea.split("|")
+        if len(partes) == 3 and partes[1].strip().isdigit():
+            filas.append((int(partes[1]), partes[2].strip()))
+    return sorted(filas, reverse=True)[:cuantos]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=5, help="arranques en frío por punto de entrada")
+    parser.add_argument("--ruta", default="/", help="página estática a pedir tras importar")
+    parser.add_argument("--detalle", type=int, default=0, help="mostrar los N módulos más lentos de importar")
+    args = parser.parse_args()
+
+    for archivo, modulo in PUNTOS_DE_ENTRADA.items():
+        resultados = [medir(modulo, args.ruta) for _ in range(args.repeticiones)]
+        importacion = [r["importacion"] for r in resultados]
+        respuesta = [r["primera_respuesta"] for r in resultados]
+        print(f"\n{archivo} ({args.repeticiones} arranques, GET {args.ruta} -> {resultados[-1]['codigo']})")
+        print(f"  Importación:       mediana={statistics.median(importacion) * 1000:.0f} ms  "
+              f"mín={min(importacion) * 1000:.0f} ms  máx={max(importacion) * 1000:.0f} ms")
+        print(f"  Primera respuesta: mediana={statistics.median(respuesta) * 1000:.0f} ms")
+        print(f"  Módulos pesados cargados: {', '.join(resultados[-1]['cargados']) or 'ninguno'}")
+        if args.detalle:
+            print("  Importaciones más lentas (acumulado):")
+            for microsegundos, nombre in detalle_importaciones(modulo, args.detalle):
+                print(f"    {microsegundos / 1000:8.1f} ms  {nombre}")
+
+
+if __name__ == "__main__":
+    main()
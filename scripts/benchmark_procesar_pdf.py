@@ -0,0 +1,163 @@
+# scanner/scripts/benchmark_procesar_pdf.py
+"""
+Prueba de carga de /api/procesar-pdf con PDFs sintéticos de varias páginas.
+
+Por defecto levanta la aplicación en el mismo proceso con el backend falso
+(GEMINI_BACKEND=falso), así que no consume cuota. Con --url se mide un
+servidor ya en marcha.
+
+    python scripts/benchmark_procesar_pdf.py --pdfs 30 --paginas 20 --concurrencia 4
+    FAKE_TASA_429=0.1 GEMINI_RPM=60 python scripts/benchmark_procesar_pdf.py
+    python scripts/benchmark_procesar_pdf.py --url http://localhost:5000
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def generar_pdf(num_paginas, rnd):
+    """PDF mínimo con texto: una página de reporte por hoja con claves únicas"""
+    objetos = [b"<< /Type /Catalog /Pages 2 0 R >>"]
+    hijos = " ".join(f"{4 + 2 * i} 0 R" for i in range(num_paginas))
+    objetos.append(f"<< /Type /Pages /Kids [{hijos}] /Count {num_paginas} >>".encode())
+    objetos.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    lote = uuid.uuid4().hex[:8]
+    for i in range(num_paginas):
+        valores = " ".join(f"{rnd.uniform(0, 100):.2f}" for _ in range(20))
+        lineas = [
+            "DATOS DEL SOLICITANTE",
+            f"CLAVE DE LA MUESTRA: B{lote}-{i + 1:03d}",
+            "RELACIONES ENTRE CATIONES",
+            valores,
+        ]
+        contenido = ("BT /F1 9 Tf 40 800 Td 11 TL " + " ".join(f"({l}) '" for l in lineas) + " ET").encode("latin-1")
+        objetos.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>".encode()
+        )
+        objetos.append(b"<< /Length %d >>\nstream\n" % len(contenido) + contenido + b"\nendstream")
+
+    salida = bytearray(b"%PDF-1.4\n")
+    posiciones = []
+    for n, objeto in enumerate(objetos, 1):
+        posiciones.append(len(salida))
+        salida += b"%d 0 obj\n" % n + objeto + b"\nendobj\n"
+    inicio_xref = len(salida)
+    salida += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objetos) + 1)
+    for posicion in posiciones:
+        salida += b"%010d 00000 n \n" % posicion
+    salida += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objetos) + 1, inicio_xref)
+    return bytes(salida)
+
+
+def cliente_local():
+    """Envía el PDF a la aplicación en este mismo proceso usando el backend falso"""
+    os.environ.setdefault("GEMINI_BACKEND", "falso")
+    os.environ.setdefault("EXTRACTION_CACHE_DIR", tempfile.mkdtemp(prefix="benchmark_cache_"))
+    sys.path.insert(0, RAIZ)
+    from app import app
+    client = app.test_client()
+
+    def enviar(pdf, nombre):
+        respuesta = client.post(
+            "/api/procesar-pdf",
+            data={"file": (io.BytesIO(pdf), nombre)},
+            content_type="multipart/form-data"
+        )
+        if respuesta.status_code != 202:
+            return respuesta.status_code
+        return esperar_trabajo(lambda: client.get(respuesta.get_json()["status_url"]).get_json())
+    return enviar
+
+
+def cliente_http(url):
+    """Envía el PDF a un servidor ya en marcha"""
+    def enviar(pdf, nombre):
+        separador = uuid.uuid4().hex
+        cuerpo = (
+            f"--{separador}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{nombre}\"\r\n"
+            f"Content-Type: application/pdf\r\n\r\n"
+        ).encode() + pdf + f"\r\n--{separador}--\r\n".encode()
+        peticion = urllib.request.Request(
+            url.rstrip("/") + "/api/procesar-pdf", data=cuerpo, method="POST",
+            headers={"Content-Type": f"multipart/form-data; boundary={separador}"}
+        )
+        try:
+            with urllib.request.urlopen(peticion, timeout=600) as respuesta:
+                cuerpo = json.loads(respuesta.read())
+                if respuesta.status != 202:
+                    return respuesta.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+        def consultar():
+            with urllib.request.urlopen(url.rstrip("/") + cuerpo["status_url"], timeout=60) as estado:
+                return json.loads(estado.read())
+        return esperar_trabajo(consultar)
+    return enviar
+
+
+def esperar_trabajo(consultar, intervalo=0.25):
+    """Consulta el trabajo hasta que termina y devuelve su código HTTP final"""
+    while True:
+        trabajo = consultar()
+        if trabajo.get("estado") in ("completado", "error"):
+            return trabajo.get("codigo") or 500
+        time.sleep(intervalo)
+
+
+def percentil(valores, p):
+    if not valores:
+        return float("nan")
+    ordenados = sorted(valores)
+    posicion = (len(ordenados) - 1) * p / 100
+    inferior = int(posicion)
+    superior = min(inferior + 1, len(ordenados) - 1)
+    return ordenados[inferior] + (ordenados[superior] - ordenados[inferior]) * (posicion - inferior)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="URL de un servidor en marcha (por defecto, la aplicación en este proceso)")
+    parser.add_argument("--pdfs", type=int, default=20, help="PDFs a enviar")
+    parser.add_argument("--paginas", type=int, default=10, help="páginas por PDF")
+    parser.add_argument("--concurrencia", type=int, default=4, help="subidas simultáneas")
+    parser.add_argument("--semilla", type=int, default=None)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.semilla)
+    pdfs = [generar_pdf(args.paginas, rnd) for _ in range(args.pdfs)]
+    enviar = cliente_http(args.url) if args.url else cliente_local()
+
+    def medir(n):
+        inicio = time.perf_counter()
+        codigo = enviar(pdfs[n], f"benchmark_{n + 1}.pdf")
+        return codigo, time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrencia) as executor:
+        resultados = list(executor.map(medir, range(args.pdfs)))
+    total = time.perf_counter() - inicio
+
+    codigos = Counter(codigo for codigo, _ in resultados)
+    latencias = [duracion for codigo, duracion in resultados if codigo == 200]
+    print(f"\nPDFs: {args.pdfs} x {args.paginas} páginas, concurrencia {args.concurrencia}")
+    print(f"Respuestas: {dict(sorted(codigos.items()))}")
+    print(f"Latencia (s, solo 200): p50={percentil(latencias, 50):.2f}  p95={percentil(latencias, 95):.2f}  p99={percentil(latencias, 99):.2f}")
+    print(f"Rendimiento: {len(latencias) / total * 60:.1f} PDFs/minuto ({total:.1f} s en total)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,9 @@
 from .convertir_reportes_a_json import convertir_reportes_a_json
-from .exportar_dict_a_excel import exportar_dict_a_excel
-__all__ = ["convertir_reportes_a_json", "exportar_dict_a_excel"]
\ No newline at end of file
+from .exportar_dict_a_excel import exportar_dict_a_excel, exportar_tabla_a_excel_stream
+from .metricas import exponer_metricas
+from .cola_trabajos import COLA_TRABAJOS
+from .almacen_sesiones import ALMACEN_SESIONES
+from .tabla_columnar import TablaColumnar
+from .cache_exportaciones import CACHE_EXPORTACIONES
+from .programador_caducidad import ProgramadorCaducidad
+__all__ = ["convertir_reportes_a_json", "exportar_dict_a_excel", "exportar_tabla_a_excel_stream", "exponer_metricas", "COLA_TRABAJOS", "ALMACEN_SESIONES", "TablaColumnar", "CACHE_EXPORTACIONES", "ProgramadorCaducidad"]
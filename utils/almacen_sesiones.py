@@ -0,0 +1,199 @@
+# utils/almacen_sesiones.py
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from .tabla_columnar import TablaColumnar
+
+
+def _serializar(objeto):
+    """Las tablas columnares se guardan en disco con su forma compacta"""
+    if isinstance(objeto, TablaColumnar):
+        return {"__tabla_columnar__": objeto.a_dict()}
+    raise TypeError(f"Tipo no serializable en la sesión: {type(objeto).__name__}")
+
+
+def _deserializar(datos):
+    if "__tabla_columnar__" in datos:
+        return TablaColumnar.desde_dict(datos["__tabla_columnar__"])
+    return datos
+
+
+def _tamano_indices(sesion):
+    """
+    Bytes de los índices de filtrado de las tablas de la sesión, que no están
+    en el JSON pero sí en memoria; se construyen aquí si aún no existen
+    """
+    if not isinstance(sesion, dict):
+        return 0
+    return sum(valor.indice().tamano_bytes() for valor in sesion.values() if isinstance(valor, TablaColumnar))
+
+
+class AlmacenSesiones:
+    """
+    Almacén de las sesiones de resultados con dos niveles:
+    - memoria: LRU acotado en bytes, propio de cada proceso
+    - SQLite en disco local: compartido por todos los workers del host
+    Las sesiones caducan a los ttl segundos en ambos niveles.
+    """
+    def __init__(self, directory=None, ttl=None, max_bytes_memoria=None, max_bytes_disco=None):
+        self.directory = directory or os.getenv(
+            "SESIONES_DIR", os.path.join(tempfile.gettempdir(), "pdf_scaner_sesiones")
+        )
+        self.ttl = ttl or int(os.getenv("SESIONES_TTL_MINUTOS", "30")) * 60
+        self.max_bytes_memoria = max_bytes_memoria or int(os.getenv("SESIONES_MEMORIA_MAX_MB", "64")) * 1024 * 1024
+        self.max_bytes_disco = max_bytes_disco or int(os.getenv("SESIONES_DISCO_MAX_MB", "512")) * 1024 * 1024
+        self.path = os.path.join(self.directory, "sesiones.sqlite3")
+
+        # session_id -> (sesion, tamaño, expira)
+        self._memoria = OrderedDict()
+        self._bytes_memoria = 0
+        self._lock = threading.Lock()
+
+        self.disco_habilitado = True
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS sesiones ("
+                    " id TEXT PRIMARY KEY,"
+                    " datos BLOB NOT NULL,"
+                    " tamano INTEGER NOT NULL,"
+                    " expira REAL NOT NULL,"
+                    " ultimo_acceso REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_sesiones_acceso ON sesiones (ultimo_acceso)")
+        except Exception as e:
+            print(f"Advertencia: almacén de sesiones compartido deshabilitado ({self.path}): {str(e)}")
+            self.disco_habilitado = False
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def guardar(self, session_id, sesion):
+        """Guarda la sesión en memoria y en el nivel compartido"""
+        serializada = json.dumps(sesion, ensure_ascii=False, default=_serializar).encode("utf-8")
+        expira = time.time() + self.ttl
+        self._guardar_en_memoria(session_id, sesion, len(serializada) + _tamano_indices(sesion), expira)
+
+        if self.disco_habilitado:
+            datos = zlib.compress(serializada)
+            try:
+                with self._connect() as conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO sesiones (id, datos, tamano, expira, ultimo_acceso) VALUES (?, ?, ?, ?, ?)",
+                        (session_id, datos, len(datos), expira, time.time())
+                    )
+                    self._expulsar_disco(conn)
+            except Exception as e:
+                print(f"Advertencia: no se pudo guardar la sesión {session_id} en disco: {str(e)}")
+
+    def obtener(self, session_id):
+        """Devuelve la sesión o None si no existe o ha caducado"""
+        ahora = time.time()
+        with self._lock:
+            entrada = self._memoria.get(session_id)
+            if entrada is not None:
+                sesion, tamano, expira = entrada
+                if expira > ahora:
+                    self._memoria.move_to_end(session_id)
+                    return sesion
+                self._quitar_de_memoria(session_id)
+
+        if not self.disco_habilitado:
+            return None
+        try:
+            with self._connect() as conn:
+                fila = conn.execute(
+                    "SELECT datos, expira FROM sesiones WHERE id = ? AND expira > ?", (session_id, ahora)
+                ).fetchone()
+                if fila is None:
+                    return None
+                conn.execute("UPDATE sesiones SET ultimo_acceso = ? WHERE id = ?", (ahora, session_id))
+        except Exception as e:
+            print(f"Advertencia: error leyendo la sesión {session_id}: {str(e)}")
+            return None
+
+        serializada = zlib.decompress(fila[0])
+        sesion = json.loads(serializada.decode("utf-8"), object_hook=_deserializar)
+        # La sesión la creó otro worker: subirla a la memoria de este proceso
+        self._guardar_en_memoria(session_id, sesion, len(serializada) + _tamano_indices(sesion), fila[1])
+        return sesion
+
+    def existe(self, session_id):
+        """Comprueba si la sesión sigue vigente sin leerla ni deserializarla"""
+        ahora = time.time()
+        with self._lock:
+            entrada = self._memoria.get(session_id)
+            if entrada is not None and entrada[2] > ahora:
+                return True
+
+        if not self.disco_habilitado:
+            return False
+        try:
+            with self._connect() as conn:
+                fila = conn.execute(
+                    "SELECT 1 FROM sesiones WHERE id = ? AND expira > ?", (session_id, ahora)
+                ).fetchone()
+        except Exception as e:
+            print(f"Advertencia: error consultando la sesión {session_id}: {str(e)}")
+            return False
+        return fila is not None
+
+    def __contains__(self, session_id):
+        return self.existe(session_id)
+
+    def limpiar_caducados(self):
+        """Elimina las sesiones caducadas de ambos niveles. Devuelve cuántas había en memoria"""
+        ahora = time.time()
+        with self._lock:
+            caducadas = [sid for sid, (_, _, expira) in self._memoria.items() if expira <= ahora]
+            for session_id in caducadas:
+                self._quitar_de_memoria(session_id)
+
+        if self.disco_habilitado:
+            try:
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM sesiones WHERE expira <= ?", (ahora,))
+            except Exception as e:
+                print(f"Advertencia: error limpiando sesiones caducadas: {str(e)}")
+        return len(caducadas)
+
+    def _guardar_en_memoria(self, session_id, sesion, tamano, expira):
+        with self._lock:
+            if session_id in self._memoria:
+                self._quitar_de_memoria(session_id)
+            # Una sesión mayor que todo el nivel de memoria solo se guarda en disco
+            if tamano > self.max_bytes_memoria:
+                return
+            self._memoria[session_id] = (sesion, tamano, expira)
+            self._bytes_memoria += tamano
+            while self._bytes_memoria > self.max_bytes_memoria:
+                self._quitar_de_memoria(next(iter(self._memoria)))
+
+    def _quitar_de_memoria(self, session_id):
+        _, tamano, _ = self._memoria.pop(session_id)
+        self._bytes_memoria -= tamano
+
+    def _expulsar_disco(self, conn):
+        """Borra las caducadas y expulsa por LRU hasta quedar por debajo del 90% del límite"""
+        conn.execute("DELETE FROM sesiones WHERE expira <= ?", (time.time(),))
+        total = conn.execute("SELECT COALESCE(SUM(tamano), 0) FROM sesiones").fetchone()[0]
+        if total <= self.max_bytes_disco:
+            return
+        objetivo = int(self.max_bytes_disco * 0.9)
+        for session_id, tamano in conn.execute(
+            "SELECT id, tamano FROM sesiones ORDER BY ultimo_acceso ASC"
+        ).fetchall():
+            if total <= objetivo:
+                break
+            conn.execute("DELETE FROM sesiones WHERE id = ?", (session_id,))
+            total -= tamano
+
+
+ALMACEN_SESIONES = AlmacenSesiones()
@@ -0,0 +1,99 @@
+# utils/cache_exportaciones.py
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from .metricas import CACHE_DESCARGAS
+
+
+class CacheExportaciones:
+    """
+    Caché LRU, acotada en bytes, de los archivos exportados de cada sesión.
+    La clave es (sesión, formato, hash de la especificación de filtro); los
+    datos de una sesión no cambian tras la extracción, así que una entrada
+    solo caduca cuando caduca su sesión. Por lo mismo el ETag se deriva de la
+    clave y de la marca de tiempo de la sesión y se conoce antes de generar.
+    """
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes or int(os.getenv("EXPORTACIONES_CACHE_MAX_MB", "128")) * 1024 * 1024
+        # clave -> (contenido, etag, expira)
+        self._entradas = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def clave(session_id, formato, especificacion=None):
+        """Clave de caché; la especificación se normaliza para que el orden de los filtros no importe"""
+        normalizada = json.dumps(especificacion or {}, sort_keys=True, ensure_ascii=False)
+        return f"{session_id}:{formato}:{hashlib.sha256(normalizada.encode('utf-8')).hexdigest()[:16]}"
+
+    @staticmethod
+    def etag(clave, timestamp=None):
+        """Validador fuerte de la exportación: mismo archivo mientras no cambie la sesión"""
+        return hashlib.sha256(f"{clave}:{timestamp}".encode("utf-8")).hexdigest()
+
+    def obtener(self, clave):
+        """Devuelve (contenido, etag) o None si no está o su sesión ha caducado"""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada[2] <= time.time():
+                self._quitar(clave)
+                entrada = None
+            if entrada is None:
+                CACHE_DESCARGAS.inc("fallo")
+                return None
+            self._entradas.move_to_end(clave)
+            CACHE_DESCARGAS.inc("acierto")
+            return entrada[0], entrada[1]
+
+    def guardar(self, clave, contenido, expira, etag=None):
+        """
+        Guarda el contenido hasta expira (caducidad de la sesión) y devuelve su
+        ETag; sin etag se usa el hash del contenido
+        """
+        etag = etag or hashlib.sha256(contenido).hexdigest()
+        if len(contenido) > self.max_bytes:
+            return etag
+        with self._lock:
+            if clave in self._entradas:
+                self._quitar(clave)
+            self._entradas[clave] = (contenido, etag, expira)
+            self._bytes += len(contenido)
+            while self._bytes > self.max_bytes:
+                self._quitar(next(iter(self._entradas)))
+        return etag
+
+    def envolver(self, clave, bloques, expira, etag=None):
+        """
+        Pasa los bloques de una exportación en streaming y, si la descarga
+        termina, guarda el archivo completo para las siguientes peticiones
+        """
+        partes = []
+        tamano = 0
+        for bloque in bloques:
+            if partes is not None:
+                tamano += len(bloque)
+                # Demasiado grande para la caché: se sigue enviando sin guardar
+                if tamano > self.max_bytes:
+                    partes = None
+                else:
+                    partes.append(bloque)
+            yield bloque
+        if partes is not None:
+            self.guardar(clave, b"".join(partes), expira, etag)
+
+    def limpiar_caducados(self):
+        """Elimina las entradas de sesiones caducadas"""
+        ahora = time.time()
+        with self._lock:
+            for clave in [c for c, (_, _, expira) in self._entradas.items() if expira <= ahora]:
+                self._quitar(clave)
+
+    def _quitar(self, clave):
+        contenido, _, _ = self._entradas.pop(clave)
+        self._bytes -= len(contenido)
+
+
+CACHE_EXPORTACIONES = CacheExportaciones()
@@ -0,0 +1,549 @@
+# utils/cola_trabajos.py
+import json
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from .metricas import TRABAJOS, TRABAJOS_RECHAZADOS
+
+
+class Trabajo:
+    """Estado de una extracción en segundo plano"""
+    def __init__(self, job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.estado = "en_cola"  # en_cola, procesando, completado, error
+        self.chunks_completados = 0
+        self.chunks_totales = 0
+        self.resultado = None
+        self.codigo = None
+        self.error = None
+        self.creado = time.time()
+        self.terminado = None
+        # Eventos para el stream SSE: (id, tipo, datos) en orden de llegada
+        self.eventos = []
+        # Se llama con (trabajo, evento) en cada cambio, para reflejarlo en el registro compartido
+        self.al_cambiar = None
+        self._lock = threading.RLock()
+        self._condicion = threading.Condition(self._lock)
+
+    def progreso(self, hechos, total):
+        """Callback de progreso del agente: chunks terminados / chunks planificados"""
+        with self._lock:
+            self.chunks_completados = hechos
+            self.chunks_totales = total
+        self.publicar("progreso", {"chunks_completados": hechos, "chunks_totales": total})
+
+    def publicar(self, tipo, datos):
+        """Añade un evento y despierta a los clientes que esperan en eventos_desde"""
+        with self._condicion:
+            evento = (len(self.eventos), tipo, datos)
+            self.eventos.append(evento)
+            self._condicion.notify_all()
+        # La escritura en el registro no bloquea a quien espera eventos
+        if self.al_cambiar is not None:
+            self.al_cambiar(self, evento)
+
+    def descartar_filas(self):
+        """
+        Vacía las filas de los eventos "filas" y devuelve los eventos cambiados.
+        Cuando la sesión ya existe la vista en vivo redirige a ella y no las necesita.
+        """
+        with self._condicion:
+            cambiados = []
+            for i, (evento_id, tipo, datos) in enumerate(self.eventos):
+                if tipo == "filas" and datos.get("filas"):
+                    self.eventos[i] = (evento_id, tipo, {**datos, "filas": []})
+                    cambiados.append(self.eventos[i])
+            return cambiados
+
+    def eventos_desde(self, desde, timeout=15):
+        """
+        Eventos con id >= desde; si no hay ninguno espera hasta timeout segundos.
+        Devuelve (eventos, terminado).
+        """
+        with self._condicion:
+            if desde >= len(self.eventos) and self.terminado is None:
+                self._condicion.wait(timeout)
+            return self.eventos[desde:], self.terminado is not None
+
+    def a_dict(self):
+        with self._lock:
+            resultado = self.resultado or {}
+            return {
+                "job_id": self.id,
+                "estado": self.estado,
+                "progreso": {
+                    "chunks_completados": self.chunks_completados,
+                    "chunks_totales": self.chunks_totales,
+                },
+                "session_id": resultado.get("session_id"),
+                "redirect_url": resultado.get("redirect_url"),
+                "codigo": self.codigo,
+                "error": self.error,
+                "resultado": self.resultado,
+            }
+
+
+class RegistroTrabajos:
+    """
+    Copia en SQLite (en el directorio de las sesiones, compartido por los
+    workers del host) del estado y los eventos de cada trabajo, para que
+    /api/jobs/<job_id> responda aunque la petición llegue a otro proceso
+    """
+    def __init__(self, directory=None):
+        self.directory = directory or os.getenv(
+            "SESIONES_DIR", os.path.join(tempfile.gettempdir(), "pdf_scaner_sesiones")
+        )
+        self.path = os.path.join(self.directory, "trabajos.sqlite3")
+        self.habilitado = True
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS trabajos ("
+                    " id TEXT PRIMARY KEY,"
+                    " estado TEXT NOT NULL,"
+                    " terminado INTEGER NOT NULL,"
+                    " expira REAL NOT NULL)"
+                )
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS eventos ("
+                    " job_id TEXT NOT NULL,"
+                    " evento_id INTEGER NOT NULL,"
+                    " tipo TEXT NOT NULL,"
+                    " datos TEXT NOT NULL,"
+                    " PRIMARY KEY (job_id, evento_id))"
+                )
+                # clave (hash del PDF) -> trabajo que la está extrayendo en algún worker
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS en_curso ("
+                    " clave TEXT PRIMARY KEY,"
+                    " job_id TEXT NOT NULL,"
+                    " expira REAL NOT NULL)"
+                )
+        except Exception as e:
+            print(f"Advertencia: registro compartido de trabajos deshabilitado ({self.path}): {str(e)}")
+            self.habilitado = False
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def guardar(self, trabajo, expira, evento=None):
+        """Guarda el estado actual del trabajo y, si lo hay, su último evento"""
+        if not self.habilitado:
+            return
+        estado = json.dumps(trabajo.a_dict(), ensure_ascii=False, default=str)
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO trabajos (id, estado, terminado, expira) VALUES (?, ?, ?, ?)",
+                    (trabajo.id, estado, int(trabajo.terminado is not None), expira)
+                )
+                if evento is not None:
+                    evento_id, tipo, datos = evento
+                    conn.execute(
+                        "INSERT OR REPLACE INTO eventos (job_id, evento_id, tipo, datos) VALUES (?, ?, ?, ?)",
+                        (trabajo.id, evento_id, tipo, json.dumps(datos, ensure_ascii=False, default=str))
+                    )
+        except Exception as e:
+            print(f"Advertencia: no se pudo guardar el trabajo {trabajo.id}: {str(e)}")
+
+    def reemplazar_eventos(self, job_id, eventos):
+        """Sobrescribe los datos de eventos ya guardados"""
+        if not self.habilitado or not eventos:
+            return
+        try:
+            with self._connect() as conn:
+                conn.executemany(
+                    "UPDATE eventos SET datos = ? WHERE job_id = ? AND evento_id = ?",
+                    [(json.dumps(datos, ensure_ascii=False, default=str), job_id, evento_id)
+                     for evento_id, _, datos in eventos]
+                )
+        except Exception as e:
+            print(f"Advertencia: no se pudieron actualizar los eventos del trabajo {job_id}: {str(e)}")
+
+    def estado(self, job_id):
+        """(estado como dict, terminado) de un trabajo vigente, o None"""
+        if not self.habilitado:
+            return None
+        try:
+            with self._connect() as conn:
+                fila = conn.execute(
+                    "SELECT estado, terminado FROM trabajos WHERE id = ? AND expira > ?", (job_id, time.time())
+                ).fetchone()
+        except Exception as e:
+            print(f"Advertencia: error leyendo el trabajo {job_id}: {str(e)}")
+            return None
+        if fila is None:
+            return None
+        return json.loads(fila[0]), bool(fila[1])
+
+    def eventos(self, job_id, desde):
+        """Eventos del trabajo con id >= desde, en orden"""
+        try:
+            with self._connect() as conn:
+                filas = conn.execute(
+                    "SELECT evento_id, tipo, datos FROM eventos WHERE job_id = ? AND evento_id >= ? ORDER BY evento_id",
+                    (job_id, desde)
+                ).fetchall()
+        except Exception as e:
+            print(f"Advertencia: error leyendo los eventos del trabajo {job_id}: {str(e)}")
+            return []
+        return [(evento_id, tipo, json.loads(datos)) for evento_id, tipo, datos in filas]
+
+    def reclamar(self, clave, job_id, expira):
+        """
+        Reserva la clave para job_id si ningún trabajo sin terminar la tiene.
+        Devuelve el job_id que queda a cargo: el propio o el de otro worker.
+        """
+        if not self.habilitado:
+            return job_id
+        try:
+            conn = self._connect()
+            try:
+                conn.isolation_level = None
+                # BEGIN IMMEDIATE: la consulta y la reserva son atómicas entre procesos
+                conn.execute("BEGIN IMMEDIATE")
+                fila = conn.execute(
+                    "SELECT e.job_id FROM en_curso e LEFT JOIN trabajos t ON t.id = e.job_id"
+                    " WHERE e.clave = ? AND e.expira > ? AND COALESCE(t.terminado, 0) = 0",
+                    (clave, time.time())
+                ).fetchone()
+                if fila is None:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO en_curso (clave, job_id, expira) VALUES (?, ?, ?)",
+                        (clave, job_id, expira)
+                    )
+                conn.execute("COMMIT")
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"Advertencia: no se pudo reservar la clave {clave[:12]}...: {str(e)}")
+            return job_id
+        return fila[0] if fila else job_id
+
+    def en_curso(self, clave):
+        """job_id del trabajo sin terminar que extrae esa clave en algún worker, o None"""
+        if not self.habilitado:
+            return None
+        try:
+            with self._connect() as conn:
+                fila = conn.execute(
+                    "SELECT e.job_id FROM en_curso e LEFT JOIN trabajos t ON t.id = e.job_id"
+                    " WHERE e.clave = ? AND e.expira > ? AND COALESCE(t.terminado, 0) = 0",
+                    (clave, time.time())
+                ).fetchone()
+        except Exception as e:
+            print(f"Advertencia: error consultando la clave {clave[:12]}...: {str(e)}")
+            return None
+        return fila[0] if fila else None
+
+    def liberar(self, clave, job_id):
+        """Quita la reserva de la clave si sigue siendo de job_id"""
+        if not self.habilitado:
+            return
+        try:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM en_curso WHERE clave = ? AND job_id = ?", (clave, job_id))
+        except Exception as e:
+            print(f"Advertencia: no se pudo liberar la clave {clave[:12]}...: {str(e)}")
+
+    def limpiar_caducados(self):
+        if not self.habilitado:
+            return
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "DELETE FROM eventos WHERE job_id IN (SELECT id FROM trabajos WHERE expira <= ?)", (time.time(),)
+                )
+                conn.execute("DELETE FROM trabajos WHERE expira <= ?", (time.time(),))
+                conn.execute("DELETE FROM en_curso WHERE expira <= ?", (time.time(),))
+        except Exception as e:
+            print(f"Advertencia: error limpiando trabajos caducados: {str(e)}")
+
+
+class TrabajoRemoto:
+    """
+    Vista de solo lectura de un trabajo que se ejecuta en otro proceso:
+    expone a_dict y eventos_desde leyendo el registro compartido
+    """
+    # Cada cuánto se vuelve a consultar el registro mientras se esperan eventos
+    INTERVALO = 0.5
+
+    def __init__(self, job_id, registro):
+        self.id = job_id
+        self._registro = registro
+
+    def a_dict(self):
+        leido = self._registro.estado(self.id)
+        return leido[0] if leido else {"job_id": self.id, "estado": "error", "error": "El trabajo ha caducado"}
+
+    def eventos_desde(self, desde, timeout=15):
+        limite = time.time() + timeout
+        while True:
+            leido = self._registro.estado(self.id)
+            terminado = leido is None or leido[1]
+            eventos = self._registro.eventos(self.id, desde)
+            if eventos or terminado or time.time() >= limite:
+                return eventos, terminado
+            time.sleep(self.INTERVALO)
+
+
+def stream_eventos(trabajo, desde=0, keepalive=15):
+    """
+    Genera los eventos de un trabajo en formato Server-Sent Events a partir
+    del id indicado y termina tras enviar el evento "fin".
+    """
+    while True:
+        eventos, terminado = trabajo.eventos_desde(desde, keepalive)
+        if not eventos:
+            if terminado:
+                return
+            # Comentario SSE para que proxies y navegador no cierren la conexión
+            yield ": keepalive\n\n"
+            continue
+        for evento_id, tipo, datos in eventos:
+            yield f"id: {evento_id}\nevent: {tipo}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+        desde = eventos[-1][0] + 1
+        if terminado and eventos[-1][1] == "fin":
+            return
+
+
+class ColaLlena(Exception):
+    """La cola de espera está llena; retry_after son los segundos hasta que se espera hueco"""
+    def __init__(self, retry_after):
+        super().__init__(f"Cola de extracciones llena, reintentar en {retry_after} s")
+        self.retry_after = retry_after
+
+
+class ColaTrabajos:
+    """
+    Cola de extracciones atendida por un pool de workers en el mismo proceso.
+    La petición HTTP solo valida y encola; el worker ejecuta la extracción y
+    guarda el resultado, que se consulta por id hasta que caduca.
+    Los workers limitan las extracciones simultáneas y la espera está acotada
+    por la capacidad del pool de API keys: con la cola llena se lanza ColaLlena.
+
+    El estado y los eventos se copian en un RegistroTrabajos compartido, así
+    que cualquier worker del host puede responder por un trabajo. La extracción
+    en sí corre en un hilo del proceso que aceptó la subida, así que la cola
+    necesita un proceso de larga duración (gunicorn, flask run). En serverless
+    (VERCEL definida o TRABAJOS_SINCRONOS=1) sincrono es True y los
+    controladores usan ejecutar, que extrae dentro de la propia petición.
+    """
+    def __init__(self, workers=None, ttl=None):
+        self.workers = workers or int(os.getenv("TRABAJOS_WORKERS", "2"))
+        # Tiempo que se conserva un trabajo terminado (por defecto 30 minutos)
+        self.ttl = ttl or int(os.getenv("TRABAJOS_TTL_MINUTOS", "30")) * 60
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="extraccion")
+        self._trabajos = {}
+        # clave (hash del PDF) -> trabajo en curso, para no repetir extracciones
+        self._en_curso = {}
+        # Trabajos admitidos que aún esperan un worker, y inicio de los que se están procesando
+        self._en_espera = 0
+        self._procesando = {}
+        # Duración media de una extracción (media móvil), para estimar el Retry-After
+        self._duracion_media = float(os.getenv("TRABAJOS_DURACION_INICIAL", "60"))
+        # Trabajos que pueden esperar turno por cada API key disponible
+        self.en_espera_por_key = int(os.getenv("TRABAJOS_EN_ESPERA_POR_KEY", "2"))
+        # Función que devuelve (keys disponibles, segundos hasta que vuelva una);
+        # sin ella la espera no tiene límite
+        self.capacidad = None
+        self.registro = RegistroTrabajos()
+        # En serverless el proceso se congela tras responder: sin hilos en segundo plano
+        self.sincrono = os.getenv("TRABAJOS_SINCRONOS", "1" if os.getenv("VERCEL") else "0") != "0"
+        self._lock = threading.Lock()
+
+    def encolar(self, funcion, *args, **kwargs):
+        """
+        Encola funcion(trabajo, *args, **kwargs), que debe devolver
+        (dict_de_respuesta, código_http). Devuelve el Trabajo creado.
+        Lanza ColaLlena si no se admiten más trabajos en espera.
+        """
+        self.limpiar_caducados()
+        capacidad = self._leer_capacidad()
+        with self._lock:
+            trabajo = self._admitir(capacidad)
+        self._guardar(trabajo)
+        self._executor.submit(self._ejecutar, trabajo, funcion, args, kwargs)
+        return trabajo
+
+    def ejecutar(self, funcion, *args, **kwargs):
+        """
+        Ejecuta funcion(trabajo, *args, **kwargs) en el hilo de la petición,
+        sin cola ni registro. Devuelve (dict_de_respuesta, código_http).
+        """
+        trabajo = Trabajo()
+        trabajo.estado = "procesando"
+        respuesta, codigo = self._correr(trabajo, funcion, args, kwargs)
+        self._terminar(trabajo, respuesta, codigo)
+        return respuesta, codigo
+
+    def encolar_unico(self, clave, funcion, *args, **kwargs):
+        """
+        Como encolar, pero si ya hay un trabajo en curso con la misma clave, en
+        este proceso o en otro worker del host, devuelve ese en lugar de crear
+        otro. Devuelve (trabajo, nuevo).
+        """
+        self.limpiar_caducados()
+        capacidad = self._leer_capacidad()
+        with self._lock:
+            trabajo = self._en_curso.get(clave)
+        if trabajo is not None:
+            return trabajo, False
+
+        # La reserva en el registro compartido decide qué worker extrae la clave
+        job_id = uuid.uuid4().hex
+        a_cargo = self.registro.reclamar(clave, job_id, time.time() + self.ttl)
+        if a_cargo != job_id:
+            return self.obtener(a_cargo) or TrabajoRemoto(a_cargo, self.registro), False
+
+        with self._lock:
+            try:
+                trabajo = self._admitir(capacidad, job_id)
+            except ColaLlena:
+                self.registro.liberar(clave, job_id)
+                raise
+            self._en_curso[clave] = trabajo
+        self._guardar(trabajo)
+        self._executor.submit(self._ejecutar, trabajo, funcion, args, kwargs, clave)
+        return trabajo, True
+
+    def _leer_capacidad(self):
+        """
+        (keys disponibles, segundos hasta que vuelva una) o None sin límite. Se
+        lee antes de tomar el lock: la primera vez puede crear el agente, y si
+        falta su configuración el error llega al controlador.
+        """
+        return self.capacidad() if self.capacidad is not None else None
+
+    def _admitir(self, capacidad, job_id=None):
+        """Crea y registra un trabajo si cabe en la cola de espera (con el lock tomado)"""
+        if capacidad is not None:
+            keys, espera_capacidad = capacidad
+            # Aunque todas las keys estén en una espera corta tras un 429, al menos
+            # un trabajo por worker puede esperar: la espera la absorbe la cola
+            maximo = max(self.workers, keys * self.en_espera_por_key)
+        else:
+            maximo, espera_capacidad = None, 0.0
+        if maximo is not None and self._en_espera >= maximo:
+            TRABAJOS_RECHAZADOS.inc()
+            raise ColaLlena(self._retry_after(espera_capacidad))
+        trabajo = Trabajo(job_id)
+        trabajo.al_cambiar = self._guardar
+        self._trabajos[trabajo.id] = trabajo
+        self._en_espera += 1
+        TRABAJOS.set("en_cola", valor=self._en_espera)
+        return trabajo
+
+    def _retry_after(self, espera_capacidad):
+        """
+        Segundos hasta que previsiblemente quede un hueco en la cola: lo que
+        le falta al trabajo en curso más avanzado, o lo que tarde en volver
+        la primera API key si ahora no hay ninguna disponible
+        """
+        ahora = time.time()
+        restantes = [max(1.0, self._duracion_media - (ahora - inicio)) for inicio in self._procesando.values()]
+        hueco = min(restantes) if len(restantes) >= self.workers else 1.0
+        return max(1, math.ceil(max(hueco, espera_capacidad)))
+
+    def estado(self):
+        """Trabajos en espera y en proceso, y duración media de una extracción"""
+        with self._lock:
+            return {
+                "en_cola": self._en_espera,
+                "procesando": len(self._procesando),
+                "workers": self.workers,
+                "duracion_media": round(self._duracion_media, 1),
+            }
+
+    def en_curso(self, clave):
+        """Trabajo sin terminar con esa clave, de este proceso o de otro worker, o None"""
+        with self._lock:
+            trabajo = self._en_curso.get(clave)
+        if trabajo is None:
+            job_id = self.registro.en_curso(clave)
+            trabajo = TrabajoRemoto(job_id, self.registro) if job_id else None
+        return trabajo
+
+    def obtener(self, job_id):
+        """El trabajo de este proceso o, si lo aceptó otro worker, su vista en el registro"""
+        with self._lock:
+            trabajo = self._trabajos.get(job_id)
+        if trabajo is None and self.registro.estado(job_id) is not None:
+            trabajo = TrabajoRemoto(job_id, self.registro)
+        return trabajo
+
+    def _guardar(self, trabajo, evento=None):
+        """Refleja el trabajo en el registro; caduca ttl segundos tras su último cambio"""
+        self.registro.guardar(trabajo, time.time() + self.ttl, evento)
+
+    def _ejecutar(self, trabajo, funcion, args, kwargs, clave=None):
+        inicio = time.time()
+        with self._lock:
+            self._en_espera -= 1
+            self._procesando[trabajo.id] = inicio
+            TRABAJOS.set("en_cola", valor=self._en_espera)
+            TRABAJOS.set("procesando", valor=len(self._procesando))
+        with trabajo._lock:
+            trabajo.estado = "procesando"
+        self._guardar(trabajo)
+        respuesta, codigo = self._correr(trabajo, funcion, args, kwargs)
+        with self._lock:
+            del self._procesando[trabajo.id]
+            self._duracion_media = 0.8 * self._duracion_media + 0.2 * (time.time() - inicio)
+            TRABAJOS.set("procesando", valor=len(self._procesando))
+        self._terminar(trabajo, respuesta, codigo)
+        if clave is not None:
+            with self._lock:
+                if self._en_curso.get(clave) is trabajo:
+                    del self._en_curso[clave]
+            self.registro.liberar(clave, trabajo.id)
+
+    def _correr(self, trabajo, funcion, args, kwargs):
+        try:
+            return funcion(trabajo, *args, **kwargs)
+        except Exception as e:
+            print(f"Error en el trabajo {trabajo.id}: {str(e)}\n{traceback.format_exc()}")
+            return {"error": f"Error al procesar el PDF: {str(e)}", "detalle": "Error interno del sistema."}, 500
+
+    def _terminar(self, trabajo, respuesta, codigo):
+        """Guarda el resultado en el trabajo y publica el evento final"""
+        with trabajo._lock:
+            trabajo.resultado = respuesta
+            trabajo.codigo = codigo
+            trabajo.estado = "completado" if codigo < 400 else "error"
+            trabajo.error = respuesta.get("error") if codigo >= 400 else None
+            trabajo.terminado = time.time()
+        trabajo.publicar("fin", {
+            "estado": trabajo.estado,
+            "codigo": codigo,
+            "mensaje": respuesta.get("mensaje"),
+            "error": trabajo.error,
+            "session_id": respuesta.get("session_id"),
+            "redirect_url": respuesta.get("redirect_url"),
+        })
+        # Con la sesión guardada, las filas parciales solo ocuparían memoria y disco
+        if respuesta.get("session_id"):
+            self.registro.reemplazar_eventos(trabajo.id, trabajo.descartar_filas())
+
+    def limpiar_caducados(self):
+        """Elimina los trabajos terminados hace más de ttl segundos"""
+        limite = time.time() - self.ttl
+        with self._lock:
+            caducados = [
+                job_id for job_id, trabajo in self._trabajos.items()
+                if trabajo.terminado is not None and trabajo.terminado < limite
+            ]
+            for job_id in caducados:
+                del self._trabajos[job_id]
+        self.registro.limpiar_caducados()
+
+
+COLA_TRABAJOS = ColaTrabajos()
@@ -0,0 +1,234 @@
+# utils/consulta_tabla.py
+import bisect
+import sys
+from array import array
+
+# Columnas con más valores distintos que esta fracción de filas no tienen listas de filas por valor
+MAX_FRACCION_DISTINTOS = 0.25
+# Columnas que cubre el filtro "cultivo"
+COLUMNAS_CULTIVO = ("cultivo_anterior", "cultivo_a_establecer")
+
+
+def _numero(valor):
+    """Valor numérico de una celda o None si no es un número"""
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    if not isinstance(valor, str):
+        return None
+    try:
+        return float(valor.strip().replace(",", "."))
+    except ValueError:
+        return None
+
+
+def _clave_orden(valor):
+    """Números antes que textos y vacíos al final, para ordenar de forma natural"""
+    numero = _numero(valor)
+    if numero is not None:
+        return (0, numero, "")
+    if valor is None or valor == "":
+        return (2, 0.0, "")
+    return (1, 0.0, str(valor).lower())
+
+
+class IndiceTabla:
+    """
+    Índices de una TablaColumnar para filtrar y ordenar en el servidor.
+    Se construyen una vez por sesión y trabajan sobre los códigos del
+    diccionario de cada columna, no sobre los valores de cada fila:
+    - filas por código en las columnas con pocos valores distintos
+    - valores numéricos ordenados de cada columna para los rangos
+    - rango de orden de cada código para ordenar por cualquier columna
+    Todo se guarda en arrays compactos; tamano_bytes() es lo que ocupan.
+    """
+    def __init__(self, tabla):
+        self.tabla = tabla
+        # columna -> (inicios, filas): las filas del código c son filas[inicios[c]:inicios[c + 1]]
+        self.filas_por_codigo = {}
+        # columna -> (números ordenados, código de cada número)
+        self.numericos = {}
+        self.rangos = {}
+
+        limite_distintos = max(64, int(len(tabla) * MAX_FRACCION_DISTINTOS))
+        for columna in tabla.columnas:
+            datos = tabla._columnas[columna]
+            valores = list(datos.valores)
+
+            if len(valores) <= limite_distintos:
+                # Recuento por código y después cada fila en su hueco
+                inicios = array("I", bytes(4 * (len(valores) + 1)))
+                for codigo in datos.codigos:
+                    inicios[codigo + 1] += 1
+                for codigo in range(len(valores)):
+                    inicios[codigo + 1] += inicios[codigo]
+                siguiente = array("I", inicios)
+                filas = array("I", bytes(4 * len(datos.codigos)))
+                for fila, codigo in enumerate(datos.codigos):
+                    filas[siguiente[codigo]] = fila
+                    siguiente[codigo] += 1
+                self.filas_por_codigo[columna] = (inicios, filas)
+
+            numericos = sorted(
+                (numero, codigo) for codigo, numero in ((c, _numero(v)) for c, v in enumerate(valores)) if numero is not None
+            )
+            if numericos:
+                self.numericos[columna] = (array("d", (n for n, _ in numericos)), array("I", (c for _, c in numericos)))
+
+            orden = sorted(range(len(valores)), key=lambda codigo: _clave_orden(valores[codigo]))
+            rango = array("I", bytes(4 * len(valores)))
+            for posicion, codigo in enumerate(orden):
+                rango[codigo] = posicion
+            self.rangos[columna] = rango
+
+    def tamano_bytes(self):
+        """Memoria aproximada que ocupa el índice (arrays y diccionarios por columna)"""
+        arrays = [a for par in self.filas_por_codigo.values() for a in par]
+        arrays += [a for par in self.numericos.values() for a in par]
+        arrays += list(self.rangos.values())
+        diccionarios = (self.filas_por_codigo, self.numericos, self.rangos)
+        return sum(map(sys.getsizeof, arrays)) + sum(map(sys.getsizeof, diccionarios)) + 64 * (
+            len(self.filas_por_codigo) + len(self.numericos)
+        )
+
+    def _filas_con_codigos(self, columna, codigos):
+        """Conjunto de filas cuyo código en la columna está en codigos"""
+        if not codigos:
+            return set()
+        por_codigo = self.filas_por_codigo.get(columna)
+        if por_codigo is not None:
+            inicios, filas_codigo = por_codigo
+            filas = set()
+            for codigo in codigos:
+                filas.update(filas_codigo[inicios[codigo]:inicios[codigo + 1]])
+            return filas
+        return {fila for fila, codigo in enumerate(self.tabla._columnas[columna].codigos) if codigo in codigos}
+
+    def contiene(self, columna, texto):
+        """Filas cuyo valor contiene el texto (sin distinguir mayúsculas)"""
+        texto = texto.lower()
+        valores = self.tabla._columnas[columna].valores
+        codigos = {codigo for codigo, valor in enumerate(valores) if valor is not None and texto in str(valor).lower()}
+        return self._filas_con_codigos(columna, codigos)
+
+    def en_rango(self, columna, minimo=None, maximo=None):
+        """Filas cuyo valor numérico está entre minimo y maximo (incluidos)"""
+        numeros, codigos = self.numericos.get(columna, ([], []))
+        inicio = 0 if minimo is None else bisect.bisect_left(numeros, minimo)
+        fin = len(numeros) if maximo is None else bisect.bisect_right(numeros, maximo)
+        return self._filas_con_codigos(columna, set(codigos[inicio:fin]))
+
+    def ordenar(self, filas, orden):
+        """Ordena las filas por una lista de (columna, descendente)"""
+        filas = sorted(filas)
+        # Ordenaciones estables de la última clave a la primera
+        for columna, descendente in reversed(orden):
+            codigos = self.tabla._columnas[columna].codigos
+            rango = self.rangos[columna]
+            filas.sort(key=lambda fila: rango[codigos[fila]], reverse=descendente)
+        return filas
+
+
+def interpretar_consulta(argumentos, columnas):
+    """
+    Convierte los parámetros de la petición en filtros, orden y paginación:
+        <columna>=texto             la columna contiene el texto
+        cultivo=texto               cultivo anterior o a establecer contiene el texto
+        <columna>_min / _max=número rango numérico en la columna
+        orden=col1,-col2            orden ascendente / descendente (prefijo "-")
+        pagina=1, limite=50         paginación (limite máximo 500)
+    Lanza ValueError con un mensaje para el usuario si algún parámetro no es válido.
+    """
+    columnas = set(columnas)
+    contiene = []
+    rangos = {}
+    for nombre, valor in argumentos.items():
+        if nombre in ("orden", "pagina", "limite") or valor == "":
+            continue
+        if nombre == "cultivo":
+            contiene.append((tuple(c for c in COLUMNAS_CULTIVO if c in columnas), valor))
+        elif nombre in columnas:
+            contiene.append(((nombre,), valor))
+        elif nombre.endswith(("_min", "_max")) and nombre[:-4] in columnas:
+            numero = _numero(valor)
+            if numero is None:
+                raise ValueError(f"El valor de {nombre} no es un número: {valor}")
+            rangos.setdefault(nombre[:-4], [None, None])[0 if nombre.endswith("_min") else 1] = numero
+        else:
+            raise ValueError(f"Parámetro de filtro desconocido: {nombre}")
+
+    orden = []
+    for clave in filter(None, (argumentos.get("orden") or "").split(",")):
+        descendente = clave.startswith("-")
+        columna = clave.lstrip("-+")
+        if columna not in columnas:
+            raise ValueError(f"No se puede ordenar por la columna desconocida: {columna}")
+        orden.append((columna, descendente))
+
+    try:
+        pagina = max(1, int(argumentos.get("pagina", 1)))
+        limite = min(500, max(1, int(argumentos.get("limite", 50))))
+    except ValueError:
+        raise ValueError("pagina y limite deben ser números enteros")
+
+    return {"contiene": contiene, "rangos": rangos, "orden": orden, "pagina": pagina, "limite": limite}
+
+
+def interpretar_especificacion(especificacion, columnas):
+    """
+    Consulta a partir de la especificación compacta que envían las descargas:
+        {"filtros": {"municipio_muestra": "tepic", "ph_min": 6}, "orden": "-ph"}
+    con los mismos nombres de filtro que interpretar_consulta. No hay paginación.
+    """
+    filtros = especificacion.get("filtros") or {}
+    if not isinstance(filtros, dict):
+        raise ValueError("filtros debe ser un objeto con los filtros por columna")
+    argumentos = {
+        nombre: str(valor) for nombre, valor in filtros.items()
+        if valor is not None and nombre not in ("orden", "pagina", "limite")
+    }
+    orden = especificacion.get("orden") or ""
+    argumentos["orden"] = ",".join(orden) if isinstance(orden, list) else str(orden)
+    return interpretar_consulta(argumentos, columnas)
+
+
+def clave_consulta(consulta):
+    """Filtros y orden de la consulta sin paginación, o None si no filtra ni ordena"""
+    if not (consulta["contiene"] or consulta["rangos"] or consulta["orden"]):
+        return None
+    return {"contiene": consulta["contiene"], "rangos": consulta["rangos"], "orden": consulta["orden"]}
+
+
+def filas_filtradas(indice, consulta):
+    """Índices de las filas que cumplen los filtros, en el orden pedido"""
+    conjuntos = []
+    for columnas_filtro, texto in consulta["contiene"]:
+        filas = set()
+        for columna in columnas_filtro:
+            filas |= indice.contiene(columna, texto)
+        conjuntos.append(filas)
+    for columna, (minimo, maximo) in consulta["rangos"].items():
+        conjuntos.append(indice.en_rango(columna, minimo, maximo))
+
+    if conjuntos:
+        conjuntos.sort(key=len)
+        filas = conjuntos[0].intersection(*conjuntos[1:])
+    else:
+        filas = range(len(indice.tabla))
+    return indice.ordenar(filas, consulta["orden"])
+
+
+def consultar(tabla, consulta):
+    """Aplica filtros, orden y paginación y devuelve la página pedida"""
+    filas = filas_filtradas(tabla.indice(), consulta)
+    limite = consulta["limite"]
+    pagina = consulta["pagina"]
+    inicio = (pagina - 1) * limite
+    return {
+        "total": len(tabla),
+        "total_filtrado": len(filas),
+        "pagina": pagina,
+        "limite": limite,
+        "paginas": max(1, -(-len(filas) // limite)),
+        "columnas": tabla.columnas,
+        "filas": list(tabla.filas(filas[inicio:inicio + limite])),
+    }
@@ -1,61 +1,168 @@
 # utils/exportar_dict_a_excel.py - Versión sin pandas
-import openpyxl
-from openpyxl.styles import Font, PatternFill, Alignment
+import queue
+import threading
 from io import BytesIO
+from .metricas import ETAPA_SEGUNDOS
+
+# Tamaño de los bloques que se envían al cliente y bloques en vuelo como máximo
+TAMANO_BLOQUE = 256 * 1024
+BLOQUES_EN_COLA = 8
 
 def exportar_dict_a_excel(data, filename=None):
     """
     Exporta diccionario a Excel usando openpyxl en lugar de pandas
     """
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Reporte"
-    
+    with ETAPA_SEGUNDOS.time("excel"):
+        columnas, filas, anchos = _columnas_filas_y_anchos(data)
+        excel_buffer = BytesIO()
+        _guardar_excel(columnas, filas, anchos, excel_buffer)
+        excel_buffer.seek(0)
+        return excel_buffer
+
+def exportar_tabla_a_excel_stream(tabla, indices=None):
+    """
+    Genera el .xlsx de una TablaColumnar (todas las filas o las de indices)
+    como bloques de bytes para una respuesta en streaming. Los anchos salen
+    del diccionario de cada columna, sin recorrer las filas.
+    """
+    columnas = tabla.columnas
+    anchos = [_ancho(columna, tabla.valores_distintos(columna)) for columna in columnas]
+    filas = (list(fila.values()) for fila in tabla.filas(indices))
+    return exportar_excel_stream(columnas, filas, anchos)
+
+def exportar_excel_stream(columnas, filas, anchos):
+    """
+    Genera un .xlsx en modo write-only como bloques de bytes. Un hilo escribe
+    el libro en una cola acotada, así la memoria no crece con el número de
+    filas; si el cliente corta la descarga, el hilo se detiene.
+    """
+    cola = queue.Queue(maxsize=BLOQUES_EN_COLA)
+    cancelado = threading.Event()
+    salida = _SalidaEnCola(cola, cancelado)
+
+    def escribir():
+        try:
+            with ETAPA_SEGUNDOS.time("excel"):
+                _guardar_excel(columnas, filas, anchos, salida)
+            salida.vaciar()
+            salida.poner(None)
+        except _DescargaCancelada:
+            pass
+        except Exception as e:
+            print(f"Error generando el Excel en streaming: {str(e)}")
+            try:
+                salida.poner(e)
+            except _DescargaCancelada:
+                pass
+
+    threading.Thread(target=escribir, name="exportar_excel", daemon=True).start()
+    try:
+        while True:
+            bloque = cola.get()
+            if bloque is None:
+                return
+            if isinstance(bloque, Exception):
+                raise bloque
+            yield bloque
+    finally:
+        cancelado.set()
+
+class _DescargaCancelada(Exception):
+    pass
+
+class _SalidaEnCola:
+    """Fichero de solo escritura (sin seek) que entrega los bytes por bloques a una cola"""
+    def __init__(self, cola, cancelado):
+        self._cola = cola
+        self._cancelado = cancelado
+        self._buffer = bytearray()
+        self._descartar = False
+
+    def write(self, datos):
+        # Tras cancelar, openpyxl aún puede cerrar el zip al recolectarlo: se descarta
+        if self._descartar:
+            return len(datos)
+        self._buffer += datos
+        if len(self._buffer) >= TAMANO_BLOQUE:
+            self.vaciar()
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        if self._buffer:
+            self.poner(bytes(self._buffer))
+            self._buffer.clear()
+
+    def poner(self, elemento):
+        while True:
+            if self._cancelado.is_set():
+                self._descartar = True
+                raise _DescargaCancelada()
+            try:
+                self._cola.put(elemento, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+def _ancho(encabezado, valores):
+    """Ancho de columna: el texto más largo más un margen, con un máximo de 50"""
+    maximo = len(str(encabezado))
+    for valor in valores:
+        if valor is not None:
+            maximo = max(maximo, len(str(valor)))
+    return min(maximo + 2, 50)
+
+def _columnas_filas_y_anchos(data):
+    """Encabezados, filas como listas y anchos calculados en una sola pasada"""
+    # Si data es una lista de diccionarios
+    if isinstance(data, list) and len(data) > 0:
+        columnas = list(data[0].keys())
+        filas = [[item.get(header, "") for header in columnas] for item in data]
+    # Si data es un diccionario simple
+    elif isinstance(data, dict):
+        columnas = ["Campo", "Valor"]
+        filas = [[str(key), str(value)] for key, value in data.items()]
+    else:
+        return [], [], []
+
+    maximos = [len(str(columna)) for columna in columnas]
+    for fila in filas:
+        for indice, valor in enumerate(fila):
+            if valor is not None and len(str(valor)) > maximos[indice]:
+                maximos[indice] = len(str(valor))
+    return columnas, filas, [min(maximo + 2, 50) for maximo in maximos]
+
+def _guardar_excel(columnas, filas, anchos, destino):
+    """Escribe el libro en modo write-only: las filas van a disco, no a objetos celda"""
+    # openpyxl se importa al exportar, no al arrancar la aplicación
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill
+    from openpyxl.utils import get_column_letter
+
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("Reporte")
+
+    # En modo write-only los anchos se fijan antes de escribir filas
+    for indice, ancho in enumerate(anchos, 1):
+        ws.column_dimensions[get_column_letter(indice)].width = ancho
+
     # Estilos
     header_font = Font(bold=True, color="FFFFFF")
     header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    
-    # Si data es una lista de diccionarios
-    if isinstance(data, list) and len(data) > 0:
-        # Headers
-        headers = list(data[0].keys())
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
+
+    if columnas:
+        encabezados = []
+        for header in columnas:
+            cell = WriteOnlyCell(ws, value=header)
             cell.font = header_font
             cell.fill = header_fill
-        
-        # Data rows
-        for row_idx, item in enumerate(data, 2):
-            for col_idx, header in enumerate(headers, 1):
-                ws.cell(row=row_idx, column=col_idx, value=item.get(header, ""))
-    
-    # Si data es un diccionario simple
-    elif isinstance(data, dict):
-        ws.cell(row=1, column=1, value="Campo").font = header_font
-        ws.cell(row=1, column=1).fill = header_fill
-        ws.cell(row=1, column=2, value="Valor").font = header_font
-        ws.cell(row=1, column=2).fill = header_fill
-        
-        for row_idx, (key, value) in enumerate(data.items(), 2):
-            ws.cell(row=row_idx, column=1, value=str(key))
-            ws.cell(row=row_idx, column=2, value=str(value))
-    
-    # Ajustar columnas
-    for column in ws.columns:
-        max_length = 0
-        column_letter = column[0].column_letter
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        ws.column_dimensions[column_letter].width = adjusted_width
-    
-    # Guardar en BytesIO para envío
-    excel_buffer = BytesIO()
-    wb.save(excel_buffer)
-    excel_buffer.seek(0)
-    
-    return excel_buffer
\ No newline at end of file
+            encabezados.append(cell)
+        ws.append(encabezados)
+
+    for fila in filas:
+        ws.append(fila)
+
+    wb.save(destino)
@@ -0,0 +1,85 @@
+# utils/exportar_formatos.py
+import csv
+import io
+import json
+import zlib
+from .exportar_dict_a_excel import exportar_tabla_a_excel_stream
+
+# Bytes que se acumulan antes de enviar un bloque al cliente
+TAMANO_BLOQUE = 64 * 1024
+
+
+def _en_bloques(textos):
+    """Agrupa fragmentos de texto en bloques de bytes UTF-8 de ~TAMANO_BLOQUE"""
+    pendientes = []
+    tamano = 0
+    for texto in textos:
+        pendientes.append(texto)
+        tamano += len(texto)
+        if tamano >= TAMANO_BLOQUE:
+            yield "".join(pendientes).encode("utf-8")
+            pendientes = []
+            tamano = 0
+    if pendientes:
+        yield "".join(pendientes).encode("utf-8")
+
+
+def exportar_tabla_a_csv_stream(tabla, indices=None):
+    """CSV con encabezado en el orden de columnas de la tabla; los vacíos salen como celda vacía"""
+    def lineas():
+        buffer = io.StringIO()
+        escritor = csv.writer(buffer, lineterminator="\n")
+        escritor.writerow(tabla.columnas)
+        for fila in tabla.filas(indices):
+            escritor.writerow(fila.values())
+            if buffer.tell() >= TAMANO_BLOQUE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    return _en_bloques(lineas())
+
+
+def exportar_tabla_a_ndjson_stream(tabla, indices=None):
+    """Un objeto JSON por línea (newline-delimited JSON)"""
+    return _en_bloques(json.dumps(fila, ensure_ascii=False) + "\n" for fila in tabla.filas(indices))
+
+
+def exportar_tabla_a_json_columnas_stream(tabla, indices=None):
+    """
+    JSON por columnas: {"columnas": [...], "num_filas": n, "datos": {"col": [v1, v2, ...]}}.
+    Cada columna se decodifica directamente de su diccionario, sin construir filas.
+    """
+    indices = range(len(tabla)) if indices is None else indices
+
+    def fragmentos():
+        yield json.dumps({"columnas": tabla.columnas, "num_filas": len(indices)}, ensure_ascii=False)[:-1]
+        yield ', "datos": {'
+        for posicion, columna in enumerate(tabla.columnas):
+            datos = tabla._columnas[columna]
+            valores = datos.valores
+            codigos = datos.codigos
+            separador = ", " if posicion else ""
+            yield f"{separador}{json.dumps(columna, ensure_ascii=False)}: "
+            yield json.dumps([valores[codigos[fila]] for fila in indices], ensure_ascii=False)
+        yield "}}"
+    return _en_bloques(fragmentos())
+
+
+def comprimir_gzip(bloques):
+    """Comprime en gzip los bloques de una exportación sin acumular el archivo completo"""
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for bloque in bloques:
+        comprimido = compresor.compress(bloque)
+        if comprimido:
+            yield comprimido
+    yield compresor.flush()
+
+
+# formato -> (mimetype, extensión, generador, admite gzip); Flask añade el charset a text/*
+FORMATOS_EXPORTACION = {
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx", exportar_tabla_a_excel_stream, False),
+    "csv": ("text/csv", "csv", exportar_tabla_a_csv_stream, True),
+    "ndjson": ("application/x-ndjson; charset=utf-8", "ndjson", exportar_tabla_a_ndjson_stream, True),
+    "json-columnas": ("application/json; charset=utf-8", "json", exportar_tabla_a_json_columnas_stream, True),
+}
@@ -0,0 +1,196 @@
+# utils/metricas.py
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Límites por defecto de los histogramas de duración (segundos)
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatear_etiquetas(nombres, valores, extra=None):
+    pares = list(zip(nombres, valores))
+    if extra:
+        pares.append(extra)
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{n}="{_escapar(v)}"' for n, v in pares) + "}"
+
+
+def _formatear_numero(valor):
+    if valor == float("inf"):
+        return "+Inf"
+    if float(valor).is_integer():
+        return str(int(valor))
+    return repr(float(valor))
+
+
+class _Metrica:
+    """Base de las métricas: nombre, ayuda, etiquetas y un lock propio"""
+    tipo = None
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        # Un lock por métrica: registrar es una suma bajo un lock sin contención con las demás
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def _clave(self, etiquetas):
+        if len(etiquetas) != len(self.etiquetas):
+            raise ValueError(f"{self.nombre} espera las etiquetas {self.etiquetas}")
+        return tuple(str(v) for v in etiquetas)
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+        with self._lock:
+            series = {clave: self._copiar(valor) for clave, valor in self._series.items()}
+        for clave in sorted(series):
+            lineas.extend(self._lineas(clave, series[clave]))
+        return lineas
+
+
+class Counter(_Metrica):
+    """Contador monótono con etiquetas"""
+    tipo = "counter"
+
+    def inc(self, *etiquetas, valor=1):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._series[clave] = self._series.get(clave, 0) + valor
+
+    def valor(self, *etiquetas):
+        with self._lock:
+            return self._series.get(self._clave(etiquetas), 0)
+
+    def _copiar(self, valor):
+        return valor
+
+    def _lineas(self, clave, valor):
+        return [f"{self.nombre}{_formatear_etiquetas(self.etiquetas, clave)} {_formatear_numero(valor)}"]
+
+
+class Gauge(Counter):
+    """Valor que puede subir y bajar (p. ej. trabajos en cola)"""
+    tipo = "gauge"
+
+    def set(self, *etiquetas, valor):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._series[clave] = valor
+
+    def dec(self, *etiquetas, valor=1):
+        self.inc(*etiquetas, valor=-valor)
+
+
+class Histogram(_Metrica):
+    """Histograma con buckets fijos; cada serie guarda [conteos por bucket, suma, total]"""
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_SEGUNDOS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, *etiquetas, valor):
+        clave = self._clave(etiquetas)
+        posicion = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                serie = self._series[clave] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][posicion] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    @contextmanager
+    def time(self, *etiquetas):
+        """Mide la duración del bloque en segundos"""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(*etiquetas, valor=time.perf_counter() - inicio)
+
+    def _copiar(self, serie):
+        return [list(serie[0]), serie[1], serie[2]]
+
+    def _lineas(self, clave, serie):
+        conteos, suma, total = serie
+        lineas = []
+        acumulado = 0
+        for limite, conteo in zip(self.buckets + (float("inf"),), conteos):
+            acumulado += conteo
+            etiquetas = _formatear_etiquetas(self.etiquetas, clave, ("le", _formatear_numero(limite)))
+            lineas.append(f"{self.nombre}_bucket{etiquetas} {acumulado}")
+        etiquetas = _formatear_etiquetas(self.etiquetas, clave)
+        lineas.append(f"{self.nombre}_sum{etiquetas} {_formatear_numero(suma)}")
+        lineas.append(f"{self.nombre}_count{etiquetas} {total}")
+        return lineas
+
+
+class Registro:
+    """Conjunto de métricas de la aplicación en formato de texto de Prometheus"""
+    def __init__(self):
+        self._metricas = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, metrica):
+        with self._lock:
+            return self._metricas.setdefault(metrica.nombre, metrica)
+
+    def counter(self, nombre, ayuda, etiquetas=()):
+        return self.registrar(Counter(nombre, ayuda, etiquetas))
+
+    def gauge(self, nombre, ayuda, etiquetas=()):
+        return self.registrar(Gauge(nombre, ayuda, etiquetas))
+
+    def histogram(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_SEGUNDOS):
+        return self.registrar(Histogram(nombre, ayuda, etiquetas, buckets))
+
+    def exponer(self):
+        with self._lock:
+            metricas = list(self._metricas.values())
+        lineas = []
+        for metrica in metricas:
+            lineas.extend(metrica.exponer())
+        return "\n".join(lineas) + "\n"
+
+
+REGISTRO = Registro()
+
+# Subidas
+PDF_BYTES = REGISTRO.histogram(
+    "pdf_scaner_upload_bytes", "Tamaño de los PDFs subidos en bytes",
+    buckets=(64 * 1024, 256 * 1024, 1024 ** 2, 4 * 1024 ** 2, 16 * 1024 ** 2, 64 * 1024 ** 2)
+)
+PDF_PAGINAS = REGISTRO.histogram(
+    "pdf_scaner_upload_pages", "Número de páginas de los PDFs subidos",
+    buckets=(1, 2, 5, 10, 20, 40, 60)
+)
+PETICIONES = REGISTRO.counter("pdf_scaner_http_requests_total", "Peticiones a la API por ruta y código de respuesta", ("endpoint", "estado"))
+
+# Etapas del pipeline: preflight, clasificacion, cache, extraccion_local, division, modelo, verificacion, conversion, excel
+ETAPA_SEGUNDOS = REGISTRO.histogram("pdf_scaner_stage_seconds", "Duración de cada etapa del procesamiento", ("etapa",))
+
+# Llamadas al modelo por API key
+MODELO_SEGUNDOS = REGISTRO.histogram("pdf_scaner_model_call_seconds", "Latencia de las llamadas al modelo", ("key", "resultado"))
+MODELO_TOKENS = REGISTRO.counter("pdf_scaner_model_tokens_total", "Tokens consumidos por API key", ("key",))
+REINTENTOS = REGISTRO.counter("pdf_scaner_model_retries_total", "Reintentos de llamadas al modelo por clase de error", ("clase_error",))
+
+# Cola de extracciones: trabajos esperando turno o en un worker, y subidas rechazadas por sobrecarga
+TRABAJOS = REGISTRO.gauge("pdf_scaner_jobs", "Trabajos de extracción por estado", ("estado",))
+TRABAJOS_RECHAZADOS = REGISTRO.counter("pdf_scaner_jobs_rejected_total", "Subidas rechazadas con 503 por cola llena")
+
+# Cachés
+CACHE_PAGINAS = REGISTRO.counter("pdf_scaner_extraction_cache_pages_total", "Páginas buscadas en la caché de extracciones", ("resultado",))
+CACHE_DESCARGAS = REGISTRO.counter("pdf_scaner_export_cache_total", "Archivos exportados buscados en la caché de descargas", ("resultado",))
+
+
+def exponer_metricas():
+    """Texto de todas las métricas registradas"""
+    return REGISTRO.exponer()
@@ -0,0 +1,144 @@
+# utils/programador_caducidad.py
+import heapq
+import os
+import threading
+import time
+
+
+class ProgramadorCaducidad:
+    """
+    Caducidad de los archivos generados en un directorio con un único hilo:
+    - montículo de (vencimiento, ruta) con el próximo archivo a eliminar arriba
+    - total de bytes del directorio, actualizado al registrar y al eliminar
+    Registrar, renovar o eliminar un archivo cuesta O(log n); el directorio
+    solo se recorre una vez, al arrancar, para adoptar los archivos existentes.
+    """
+    def __init__(self, directory, ttl, max_bytes, al_eliminar=None):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        # Se llama con la ruta de cada archivo eliminado (p. ej. para invalidar cachés)
+        self.al_eliminar = al_eliminar
+        self._monticulo = []
+        # ruta -> (vencimiento, tamaño); las entradas del montículo que no coinciden están obsoletas
+        self._archivos = {}
+        self._bytes = 0
+        self._condicion = threading.Condition()
+        self._hilo = None
+
+    @property
+    def bytes_totales(self):
+        with self._condicion:
+            return self._bytes
+
+    def __len__(self):
+        with self._condicion:
+            return len(self._archivos)
+
+    def iniciar(self):
+        """Adopta los archivos que ya hay en el directorio y arranca el hilo (una sola vez)"""
+        with self._condicion:
+            if self._hilo is not None:
+                return
+            self._hilo = threading.Thread(target=self._bucle, name="caducidad_archivos", daemon=True)
+        try:
+            if os.path.isdir(self.directory):
+                for entrada in os.scandir(self.directory):
+                    if entrada.is_file():
+                        info = entrada.stat()
+                        self._registrar(entrada.path, info.st_size, info.st_mtime + self.ttl)
+        except Exception as e:
+            print(f"Error al revisar {self.directory}: {str(e)}")
+        self._hilo.start()
+
+    def registrar(self, ruta):
+        """Programa la eliminación de un archivo recién creado a los ttl segundos"""
+        self._registrar(ruta, os.path.getsize(ruta), time.time() + self.ttl)
+
+    def renovar(self, ruta):
+        """Un acceso al archivo retrasa su caducidad otros ttl segundos"""
+        with self._condicion:
+            entrada = self._archivos.get(ruta)
+            if entrada is None:
+                return
+            vencimiento = time.time() + self.ttl
+            self._archivos[ruta] = (vencimiento, entrada[1])
+            self._empujar(vencimiento, ruta)
+
+    def eliminar_vencidos(self):
+        """Elimina ya los archivos caducados. Devuelve cuántos se eliminaron"""
+        with self._condicion:
+            return self._eliminar_vencidos(time.time())
+
+    def _registrar(self, ruta, tamano, vencimiento):
+        with self._condicion:
+            anterior = self._archivos.get(ruta)
+            if anterior is not None:
+                self._bytes -= anterior[1]
+            self._archivos[ruta] = (vencimiento, tamano)
+            self._bytes += tamano
+            self._empujar(vencimiento, ruta)
+            self._liberar_espacio()
+            self._condicion.notify()
+
+    def _empujar(self, vencimiento, ruta):
+        heapq.heappush(self._monticulo, (vencimiento, ruta))
+        # Las renovaciones dejan entradas obsoletas: reconstruir si ya son mayoría
+        if len(self._monticulo) > 2 * len(self._archivos) + 64:
+            self._monticulo = [(v, r) for r, (v, _) in self._archivos.items()]
+            heapq.heapify(self._monticulo)
+
+    def _siguiente(self):
+        """Saca la entrada vigente con el vencimiento más próximo, descartando las obsoletas"""
+        while self._monticulo:
+            vencimiento, ruta = heapq.heappop(self._monticulo)
+            entrada = self._archivos.get(ruta)
+            if entrada is not None and entrada[0] == vencimiento:
+                return ruta
+        return None
+
+    def _liberar_espacio(self):
+        """Si se supera el límite, elimina los que antes vencen hasta bajar del 80%"""
+        if self._bytes <= self.max_bytes:
+            return
+        print(f"Directorio excede el límite de tamaño ({self._bytes} bytes). Limpiando archivos más antiguos...")
+        while self._bytes >= self.max_bytes * 0.8:
+            ruta = self._siguiente()
+            if ruta is None:
+                break
+            self._eliminar(ruta)
+
+    def _eliminar_vencidos(self, ahora):
+        eliminados = 0
+        while self._monticulo and self._monticulo[0][0] <= ahora:
+            vencimiento, ruta = heapq.heappop(self._monticulo)
+            entrada = self._archivos.get(ruta)
+            if entrada is not None and entrada[0] == vencimiento:
+                self._eliminar(ruta)
+                eliminados += 1
+        return eliminados
+
+    def _eliminar(self, ruta):
+        _, tamano = self._archivos.pop(ruta)
+        self._bytes -= tamano
+        try:
+            os.remove(ruta)
+            print(f"Archivo eliminado automáticamente: {ruta}")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error al eliminar {ruta}: {str(e)}")
+        if self.al_eliminar is not None:
+            try:
+                self.al_eliminar(ruta)
+            except Exception as e:
+                print(f"Error tras eliminar {ruta}: {str(e)}")
+
+    def _bucle(self):
+        with self._condicion:
+            while True:
+                ahora = time.time()
+                self._eliminar_vencidos(ahora)
+                espera = self._monticulo[0][0] - ahora if self._monticulo else None
+                # Se despierta al vencer el próximo archivo o al registrar uno nuevo
+                self._condicion.wait(espera)
@@ -0,0 +1,73 @@
+# utils/subidas.py
+import hashlib
+import os
+import tempfile
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+# Límites de las subidas (configurables por entorno)
+MAX_BYTES_PDF = int(os.getenv("PDF_MAX_MB", "50")) * 1024 * 1024
+MAX_PAGINAS_PDF = int(os.getenv("PDF_MAX_PAGINAS", "60"))
+# Por debajo de este tamaño la subida no toca el disco
+UMBRAL_MEMORIA_PDF = int(os.getenv("PDF_MEMORIA_MAX_MB", "16")) * 1024 * 1024
+
+
+def _error_tamano():
+    return RequestEntityTooLarge(
+        f"El archivo excede el tamaño máximo permitido por la aplicación ({MAX_BYTES_PDF // (1024 * 1024)} MB)"
+    )
+
+
+class BufferSubida:
+    """
+    Destino de un archivo subido mientras se lee el cuerpo de la petición:
+    se queda en memoria hasta UMBRAL_MEMORIA_PDF (después pasa a disco),
+    calcula el SHA-256 a medida que llegan los bytes y corta la subida en
+    cuanto supera MAX_BYTES_PDF.
+    """
+    def __init__(self):
+        self._archivo = tempfile.SpooledTemporaryFile(max_size=UMBRAL_MEMORIA_PDF, mode="w+b")
+        self._hash = hashlib.sha256()
+        self.tamano = 0
+
+    def write(self, datos):
+        self.tamano += len(datos)
+        if self.tamano > MAX_BYTES_PDF:
+            raise _error_tamano()
+        self._hash.update(datos)
+        return self._archivo.write(datos)
+
+    @property
+    def sha256(self):
+        return self._hash.hexdigest()
+
+    def contenido(self):
+        self._archivo.seek(0)
+        return self._archivo.read()
+
+    def __getattr__(self, nombre):
+        # read, seek, readline, tell, close... del archivo subyacente
+        return getattr(self._archivo, nombre)
+
+
+class PeticionSubida(Request):
+    """Petición de Flask cuyos archivos subidos se escriben en un BufferSubida"""
+    # Rechaza por Content-Length antes de leer el cuerpo (con margen para el multipart)
+    max_content_length = MAX_BYTES_PDF + 1024 * 1024
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return BufferSubida()
+
+
+def leer_subida(file):
+    """
+    Devuelve (bytes, sha256) de un archivo subido. Si la petición es una
+    PeticionSubida el hash ya se calculó mientras llegaba el archivo.
+    Lanza RequestEntityTooLarge si supera el límite de tamaño.
+    """
+    if isinstance(file.stream, BufferSubida):
+        return file.stream.contenido(), file.stream.sha256
+    data = file.read()
+    if len(data) > MAX_BYTES_PDF:
+        raise _error_tamano()
+    return data, hashlib.sha256(data).hexdigest()
@@ -0,0 +1,173 @@
+# utils/tabla_columnar.py
+import base64
+import sys
+from array import array
+from .consulta_tabla import IndiceTabla
+
+# Tipos de array según el número de valores distintos de la columna
+_TIPOS_CODIGO = (("B", 1 << 8), ("H", 1 << 16), ("I", 1 << 32))
+# A partir de cuántos valores distintos se empaquetan en un único string
+MIN_VALORES_EMPAQUETADOS = 64
+
+
+class ValoresEmpaquetados:
+    """
+    Lista inmutable de strings guardada como un único string más los
+    desplazamientos de cada valor. Evita el coste de un objeto str por valor
+    en columnas con muchos valores distintos (claves, folios, mediciones).
+    """
+    __slots__ = ("_texto", "_inicios")
+
+    def __init__(self, valores):
+        self._texto = "".join(valores)
+        self._inicios = array("I", [0])
+        posicion = 0
+        for valor in valores:
+            posicion += len(valor)
+            self._inicios.append(posicion)
+
+    def __len__(self):
+        return len(self._inicios) - 1
+
+    def __getitem__(self, indice):
+        return self._texto[self._inicios[indice]:self._inicios[indice + 1]]
+
+    def __iter__(self):
+        for indice in range(len(self)):
+            yield self[indice]
+
+
+class ColumnaCodificada:
+    """
+    Columna codificada por diccionario: cada valor distinto se guarda una
+    sola vez y cada fila guarda solo su código (1, 2 o 4 bytes).
+    """
+    __slots__ = ("valores", "codigos", "_indice")
+
+    def __init__(self, valores=None, codigos=None):
+        self.valores = valores if valores is not None else []
+        self.codigos = codigos if codigos is not None else array("B")
+        # Índice valor -> código; solo hace falta mientras se agregan filas
+        self._indice = None
+
+    def agregar(self, valor):
+        if isinstance(valor, str):
+            valor = sys.intern(valor)
+        if self._indice is None:
+            self.valores = list(self.valores)
+            self._indice = {v: codigo for codigo, v in enumerate(self.valores)}
+        codigo = self._indice.get(valor)
+        if codigo is None:
+            codigo = len(self.valores)
+            self.valores.append(valor)
+            self._indice[valor] = codigo
+            self._ampliar_si_hace_falta(len(self.valores))
+        self.codigos.append(codigo)
+
+    def _ampliar_si_hace_falta(self, distintos):
+        for tipo, limite in _TIPOS_CODIGO:
+            if distintos <= limite:
+                if tipo != self.codigos.typecode:
+                    self.codigos = array(tipo, self.codigos)
+                return
+
+    def compactar(self):
+        """Libera el índice de construcción y empaqueta los valores si son muchos"""
+        self._indice = None
+        if len(self.valores) >= MIN_VALORES_EMPAQUETADOS and all(isinstance(v, str) for v in self.valores):
+            self.valores = ValoresEmpaquetados(self.valores)
+
+    def __len__(self):
+        return len(self.codigos)
+
+    def __getitem__(self, fila):
+        return self.valores[self.codigos[fila]]
+
+    def a_dict(self):
+        return {
+            "valores": list(self.valores),
+            "tipo": self.codigos.typecode,
+            "codigos": base64.b64encode(self.codigos.tobytes()).decode("ascii"),
+        }
+
+    @classmethod
+    def desde_dict(cls, datos):
+        codigos = array(datos["tipo"])
+        codigos.frombytes(base64.b64decode(datos["codigos"]))
+        columna = cls([sys.intern(v) if isinstance(v, str) else v for v in datos["valores"]], codigos)
+        columna.compactar()
+        return columna
+
+
+class TablaColumnar:
+    """
+    Filas de reportes guardadas por columnas con el esquema fijo de la tabla
+    de resultados. Las filas se reconstruyen como diccionarios solo al leerlas.
+    """
+    def __init__(self, columnas, datos_columnas, num_filas):
+        self.columnas = list(columnas)
+        self._columnas = datos_columnas
+        self.num_filas = num_filas
+        # Índices de consulta; no se serializan, cada proceso los construye una vez
+        self._indice = None
+
+    @classmethod
+    def desde_filas(cls, filas, orden_columnas=()):
+        """
+        Crea la tabla a partir de una lista de diccionarios. Las columnas siguen
+        orden_columnas y después las adicionales, como aplicar_orden_dataframe.
+        """
+        presentes = {}
+        for fila in filas:
+            for columna in fila:
+                presentes.setdefault(columna, None)
+        columnas = [c for c in orden_columnas if c in presentes] + [c for c in presentes if c not in orden_columnas]
+
+        datos_columnas = {columna: ColumnaCodificada() for columna in columnas}
+        for fila in filas:
+            for columna in columnas:
+                datos_columnas[columna].agregar(fila.get(columna))
+        for datos in datos_columnas.values():
+            datos.compactar()
+        return cls(columnas, datos_columnas, len(filas))
+
+    def __len__(self):
+        return self.num_filas
+
+    def fila(self, indice):
+        """Vista de una fila como diccionario"""
+        return {columna: self._columnas[columna][indice] for columna in self.columnas}
+
+    def filas(self, indices=None):
+        """Itera las filas (todas o las de los índices indicados) como diccionarios"""
+        for indice in (range(self.num_filas) if indices is None else indices):
+            yield self.fila(indice)
+
+    def columna(self, nombre):
+        """Columna completa decodificada"""
+        datos = self._columnas[nombre]
+        return [datos.valores[codigo] for codigo in datos.codigos]
+
+    def valores_distintos(self, nombre):
+        return list(self._columnas[nombre].valores)
+
+    def indice(self):
+        """Índices para filtrar y ordenar (ver consulta_tabla), construidos la primera vez"""
+        if self._indice is None:
+            self._indice = IndiceTabla(self)
+        return self._indice
+
+    def a_dict(self):
+        return {
+            "columnas": self.columnas,
+            "num_filas": self.num_filas,
+            "datos": {columna: self._columnas[columna].a_dict() for columna in self.columnas},
+        }
+
+    @classmethod
+    def desde_dict(cls, datos):
+        return cls(
+            datos["columnas"],
+            {columna: ColumnaCodificada.desde_dict(d) for columna, d in datos["datos"].items()},
+            datos["num_filas"],
+        )